@@ -0,0 +1,160 @@
+"""
+Database connection pool health checks and metrics.
+
+With DATABASE_POOL enabled (see settings.py) the psycopg 3 backend keeps a pool of
+open connections per process, psycopg_pool.ConnectionPool, and requests borrow one
+instead of connecting to PostgreSQL each time. This module:
+- checks the idle connections of every open pool every DATABASE_POOL_CHECK_INTERVAL
+  seconds in a background thread, so broken connections are replaced before a
+  request gets one (with an interval of 0, every connection is checked when it is
+  borrowed instead), and
+- serves the pool statistics in the Prometheus text format from `pool_metrics_view`.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+logger = logging.getLogger(__name__)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (metric, type, help, psycopg_pool statistic, scale) for every statistic exported as is;
+# see https://www.psycopg.org/psycopg3/docs/advanced/pool.html#pool-stats
+POOL_METRICS = [
+    ("db_pool_min_connections", "gauge", "Configured minimum number of connections.", "pool_min", 1),
+    ("db_pool_max_connections", "gauge", "Configured maximum number of connections.", "pool_max", 1),
+    ("db_pool_connections", "gauge", "Connections currently managed by the pool.", "pool_size", 1),
+    ("db_pool_idle_connections", "gauge", "Connections currently idle in the pool.", "pool_available", 1),
+    ("db_pool_waiting_requests", "gauge", "Requests currently waiting for a connection.", "requests_waiting", 1),
+    ("db_pool_requests_total", "counter", "Connections requested from the pool.", "requests_num", 1),
+    ("db_pool_queued_requests_total", "counter", "Requests that had to wait for a connection.", "requests_queued", 1),
+    ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", "requests_wait_ms", 0.001),
+    ("db_pool_request_errors_total", "counter", "Requests that got no connection in time.", "requests_errors", 1),
+    ("db_pool_usage_seconds_total", "counter", "Time connections were borrowed for.", "usage_ms", 0.001),
+    ("db_pool_connects_total", "counter", "Connections opened to the server.", "connections_num", 1),
+    ("db_pool_connect_seconds_total", "counter", "Time spent opening connections.", "connections_ms", 0.001),
+    ("db_pool_connect_errors_total", "counter", "Failed attempts to open a connection.", "connections_errors", 1),
+    ("db_pool_lost_connections_total", "counter", "Broken connections found by checks.", "connections_lost", 1),
+    ("db_pool_bad_returns_total", "counter", "Connections returned in a bad state.", "returns_bad", 1),
+]
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+def open_pools():
+    """
+    Return the open connection pools of this process, by database alias.
+    """
+    pools = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None and not pool.closed:
+            pools[alias] = pool
+    return pools
+
+
+def check_pools():
+    """
+    Check the idle connections of every open pool once; broken ones are discarded and replaced.
+    """
+    for alias, pool in open_pools().items():
+        try:
+            pool.check()
+        except Exception:
+            logger.exception("Health check of the %s database pool failed.", alias)
+
+
+class PoolChecker(threading.Thread):
+    """
+    Daemon thread running `check_pools()` every `interval` seconds until stopped.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="db-pool-checker", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            check_pools()
+
+    def stop(self):
+        self.stopped.set()
+
+
+@receiver(connection_created)
+def start_pool_checker(sender, connection, **kwargs):
+    """
+    Start the health check thread when a pooled connection is first used in this process.
+    """
+    global _checker
+    if _checker is not None or not settings.DATABASE_POOL_CHECK_INTERVAL or getattr(connection, "pool", None) is None:
+        return
+    with _checker_lock:
+        if _checker is None:
+            _checker = PoolChecker(settings.DATABASE_POOL_CHECK_INTERVAL)
+            _checker.start()
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_pool_metrics(pools):
+    """
+    Render the statistics of connection pools, keyed by database alias, in the Prometheus text format.
+    """
+    stats = {alias: pool.get_stats() for alias, pool in pools.items()}
+    lines = []
+
+    def metric(name, kind, description, values):
+        lines.append(f"# HELP pin_people_{name} {description}")
+        lines.append(f"# TYPE pin_people_{name} {kind}")
+        for alias, value in values:
+            lines.append(f'pin_people_{name}{{database="{alias}"}} {_format_value(value)}')
+
+    metric(
+        "db_pool_enabled",
+        "gauge",
+        "Whether connections to the database are pooled.",
+        [(alias, int(alias in stats)) for alias in connections],
+    )
+    for name, kind, description, key, scale in POOL_METRICS:
+        # psycopg_pool leaves out the counters that are still zero
+        metric(name, kind, description, [(alias, s.get(key, 0) * scale) for alias, s in stats.items()])
+    metric(
+        "db_pool_utilization_ratio",
+        "gauge",
+        "Share of the maximum number of connections currently borrowed.",
+        [(alias, (s["pool_size"] - s["pool_available"]) / s["pool_max"]) for alias, s in stats.items()],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if token and constant_time_compare(authorization, f"Bearer {token}"):
+        return True
+    return request.user.is_staff
+
+
+@never_cache
+def pool_metrics_view(request):
+    """
+    Return the connection pool statistics of this process for Prometheus to scrape.
+    Scrapers authenticate with an "Authorization: Bearer <METRICS_TOKEN>" header;
+    staff users can also open the page in a browser.
+    """
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden("You are not allowed to view the metrics.")
+    return HttpResponse(render_pool_metrics(open_pools()), content_type=METRICS_CONTENT_TYPE)
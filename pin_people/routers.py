@@ -0,0 +1,185 @@
+"""
+Read replica routing.
+
+With DATABASE_REPLICA_HOSTS set (see settings.py), every replica becomes a database
+alias listed in settings.DATABASE_REPLICAS and `ReplicaRouter` is installed. Writes
+always go to the primary, the "default" database. Reads go to a replica only:
+- inside a view wrapped in `read_from_replicas` (the map page, profiles and the admin
+  changelists), on a GET or HEAD request,
+- outside a transaction on the primary,
+- when the request has not written anything yet, and its client did not write
+  anything in the last DATABASE_REPLICA_STICKY_SECONDS seconds
+  (`ReplicaStickinessMiddleware` marks such clients with a cookie), so users always
+  read their own writes, and
+- to a replica that lags less than DATABASE_REPLICA_MAX_LAG seconds behind the
+  primary, measured at most every DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds.
+Everything else, including every management command, reads from the primary.
+
+Data that outlives the request, such as the users resolved for sessions and the
+map caches, must be read from the primary; wrap such reads in `use_replicas(False)`.
+"""
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+# Set for clients that wrote to the primary within the stickiness window
+PRIMARY_COOKIE = "pin_people_primary"
+
+# Seconds the replica is behind the primary; 0 while it has replayed all WAL it received,
+# so a replica of an idle primary does not look like it is lagging, and NULL if unknown
+LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# The routing state of the current request, set by ReplicaStickinessMiddleware
+_request_state = ContextVar("replica_request_state", default=None)
+# Whether the reads of the current view may go to a replica, see use_replicas()
+_replica_reads = ContextVar("replica_reads", default=False)
+# Last measured lag per replica alias, as (time.monotonic() of the check, lag or None)
+_lag_checks = {}
+
+
+class RequestState:
+    """
+    Routing state of one request.
+    """
+
+    __slots__ = ("sticky", "wrote", "replica")
+
+    def __init__(self, sticky):
+        # Whether the client wrote recently, so all its reads go to the primary
+        self.sticky = sticky
+        # Whether this request wrote to the primary
+        self.wrote = False
+        # The replica picked for the first read of the request, used for all of them
+        self.replica = None
+
+
+def replica_lag(alias):
+    """
+    Return how many seconds the replica behind the database alias lags, or None
+    when that is unknown, e.g. because the replica is unreachable.
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            (lag,) = cursor.fetchone()
+    except DatabaseError:
+        logger.warning("Could not measure the lag of the %s database.", alias, exc_info=True)
+        return None
+    return None if lag is None else float(lag)
+
+
+def healthy_replicas():
+    """
+    Return the replica aliases lagging at most settings.DATABASE_REPLICA_MAX_LAG seconds.
+    """
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked_at, lag = _lag_checks.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            lag = replica_lag(alias)
+            _lag_checks[alias] = (now, lag)
+        if lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG:
+            healthy.append(alias)
+    return healthy
+
+
+@contextmanager
+def use_replicas(allowed=True):
+    """
+    Let the reads inside the block go to a replica, or with `allowed` False, keep them on the primary.
+    """
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replicas(view_func):
+    """
+    Decorate a view whose GET and HEAD requests may read from a replica.
+    Deferred responses are rendered inside, so the queries of their templates are routed too.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view_func(request, *args, **kwargs)
+        with use_replicas():
+            response = view_func(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)) and not response.is_rendered:
+                response.render()
+        return response
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Send writes to the primary and the reads allowed by `read_from_replicas` to a healthy replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state.sticky or state.wrote or not _replica_reads.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if state.replica is None:
+            replicas = healthy_replicas()
+            state.replica = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaStickinessMiddleware(MiddlewareMixin):
+    """
+    Track the writes of every request, and keep the reads of a client that wrote
+    on the primary for the next settings.DATABASE_REPLICA_STICKY_SECONDS seconds.
+    """
+
+    def process_request(self, request):
+        request.replica_state = RequestState(sticky=PRIMARY_COOKIE in request.COOKIES)
+        _request_state.set(request.replica_state)
+
+    def process_response(self, request, response):
+        state = getattr(request, "replica_state", None)
+        if state is not None and state.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        _request_state.set(None)
+        return response
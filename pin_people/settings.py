@@ -86,6 +86,94 @@ DATABASES = {
     }
 }
 
+# Connection pooling (requires psycopg 3 with the pool extra), see pin_people/db.py.
+# Without it, each thread keeps its connection open for DATABASE_CONN_MAX_AGE seconds
+# (0 closes it at the end of every request).
+DATABASE_POOL = os.environ.get("DATABASE_POOL", "false").lower() == "true"
+# Seconds between health checks of the idle pooled connections; 0 checks each connection when it is borrowed
+DATABASE_POOL_CHECK_INTERVAL = int(os.environ.get("DATABASE_POOL_CHECK_INTERVAL", 30))
+if DATABASE_POOL:
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+            # Connections are replaced after this many seconds, so server-side memory does not grow forever
+            "max_lifetime": float(os.environ.get("DATABASE_POOL_MAX_LIFETIME", 3600)),
+            # Idle connections above min_size are closed after this many seconds
+            "max_idle": float(os.environ.get("DATABASE_POOL_MAX_IDLE", 600)),
+            # Seconds a request waits for a free connection before failing
+            "timeout": float(os.environ.get("DATABASE_POOL_TIMEOUT", 10)),
+        }
+    }
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = DATABASE_POOL_CHECK_INTERVAL == 0
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DATABASE_CONN_MAX_AGE", 0))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Read replicas, see pin_people/routers.py: a comma-separated list of host[:port] of
+# streaming replicas of the default database, each used with its name and credentials
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.environ.get("DATABASE_REPLICA_HOSTS", "").split(",")), 1):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica_{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        # Tests run against the test database only
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{number}")
+# Replicas lagging further behind the primary than this many seconds are skipped
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get("DATABASE_REPLICA_MAX_LAG", 5))
+# Seconds the lag of a replica is trusted before it is measured again
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("DATABASE_REPLICA_LAG_CHECK_INTERVAL", 2))
+# Seconds a client reads only from the primary after it wrote, so it sees its own changes
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", 15))
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ["pin_people.routers.ReplicaRouter"]
+    # Before the session middleware, so the writes of saving the session are seen
+    MIDDLEWARE.insert(1, "pin_people.routers.ReplicaStickinessMiddleware")
+
+# Token Prometheus sends as "Authorization: Bearer <token>" to scrape /metrics/db-pool/
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_BACKEND selects local memory (default), a file-based cache in CACHE_LOCATION,
+# or Redis at CACHE_LOCATION (requires the redis package)
+
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+CACHE_DEFAULT_LOCATIONS = {
+    "locmem": "pin_people",
+    "file": str(BASE_DIR / ".cache"),
+    "redis": "redis://127.0.0.1:6379/0",
+}
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+# Whether all the processes serving requests share one cache. The local memory cache is
+# private to each process: with several worker processes, an entry one of them drops or
+# bumps stays as it was in the others. The session and user caches below are only used
+# with a shared cache for that reason. The map caches are used either way, but with
+# locmem and several workers, the other workers keep serving map data cached before a
+# change for up to the snapshot and tile timeouts (see users/map_cache.py and
+# users/tiles.py); run several workers only with the file or Redis cache.
+CACHE_SHARED = CACHE_BACKEND != "locmem"
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": os.environ.get("CACHE_LOCATION", CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]),
+        "KEY_PREFIX": "pin_people",
+    }
+}
+if CACHE_BACKEND != "redis":
+    # Vector tiles and map snapshots need more room than the default 300 entries
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", 10000))}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -105,6 +193,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 AUTH_USER_MODEL = "users.User"
+# Verifies passwords off the event loop in the async login view, see users/hashing.py,
+# and resolves the user of a session from the cache, see users/backends.py
+AUTHENTICATION_BACKENDS = ["users.backends.PooledHashingBackend"]
+# Seconds a session's user is served from the cache; 0 loads it from the database on every request.
+# Always 0 without a shared cache, where a password change or deactivation saved by one worker
+# would leave the old user cached in the others, still accepting its sessions.
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get("AUTH_USER_CACHE_TIMEOUT", 300)) if CACHE_SHARED else 0
+
+# With a shared cache, sessions are read from the cache and written through to the
+# database, so they survive a cache flush. Without one they are read from the database,
+# as a session flushed at logout by one worker would stay valid in the others' caches.
+if CACHE_SHARED:
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+else:
+    SESSION_ENGINE = "django.contrib.sessions.backends.db"
+
 LOGIN_REDIRECT_URL = "/users/location/"
 LOGIN_URL = "/login/"
 
@@ -137,3 +241,32 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 PHONENUMBER_DB_FORMAT = "E164"
 PHONENUMBER_DEFAULT_REGION = "ZA"
 PHONENUMBER_DEFAULT_FORMAT = "INTERNATIONAL"
+
+# Map settings
+# Load the user layer of the map as vector tiles instead of JSON, for large deployments
+MAP_VECTOR_TILES = os.environ.get("MAP_VECTOR_TILES", "false").lower() == "true"
+
+# Geocoding settings
+# Local gazetteer that User.address is resolved against, see users/gazetteer.py
+GEOCODER_GAZETTEER = os.environ.get("GEOCODER_GAZETTEER", str(BASE_DIR / "data" / "cities500.txt"))
+# Geocode users saved with a new address and no coordinates
+GEOCODE_ON_SAVE = os.environ.get("GEOCODE_ON_SAVE", "true").lower() == "true"
+# Normalized addresses remembered per process, on top of the GeocodedAddress table
+GEOCODER_CACHE_SIZE = int(os.environ.get("GEOCODER_CACHE_SIZE", 10000))
+
+# Audit log settings
+# Write login/logout audit records from a background thread in batches, see users/audit.py
+AUDIT_LOG_ASYNC = os.environ.get("AUDIT_LOG_ASYNC", "true").lower() == "true"
+AUDIT_LOG_BATCH_SIZE = int(os.environ.get("AUDIT_LOG_BATCH_SIZE", 100))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.environ.get("AUDIT_LOG_FLUSH_INTERVAL", 1.0))
+AUDIT_LOG_MAX_QUEUE_SIZE = int(os.environ.get("AUDIT_LOG_MAX_QUEUE_SIZE", 10000))
+
+# Auth events are partitioned by month, see users/partitions.py and "manage.py auth_event_partitions"
+AUTH_EVENT_PARTITION_MONTHS_AHEAD = int(os.environ.get("AUTH_EVENT_PARTITION_MONTHS_AHEAD", 3))
+AUTH_EVENT_RETENTION_MONTHS = int(os.environ.get("AUTH_EVENT_RETENTION_MONTHS", 12))
+AUTH_EVENT_ARCHIVE_DIR = os.environ.get("AUTH_EVENT_ARCHIVE_DIR", str(BASE_DIR / "archive" / "auth_events"))
+
+# Password hashing pool used by the async login and registration views, see users/hashing.py
+PASSWORD_HASHING_WORKERS = int(os.environ.get("PASSWORD_HASHING_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get("PASSWORD_HASHING_MAX_PENDING", 32))
+PASSWORD_HASHING_RETRY_AFTER = int(os.environ.get("PASSWORD_HASHING_RETRY_AFTER", 1))
@@ -20,8 +20,9 @@ from django.contrib.staticfiles.storage import staticfiles_storage
 from django.urls import include, path
 from django.views.generic import RedirectView
 
+from pin_people.db import pool_metrics_view
 from users.admin import admin_site
-from users.views import register_view
+from users.views import login_view, register_view
 
 urlpatterns = [
     path("favicon.ico", RedirectView.as_view(url=staticfiles_storage.url("images/favicon.ico"))),
@@ -30,7 +31,8 @@ urlpatterns = [
     path("", RedirectView.as_view(url="/login/", permanent=False)),
     path("admin/", admin_site.urls),
     path("users/", include("users.urls")),
-    path("login/", auth_views.LoginView.as_view(template_name="registration/login.html"), name="login"),
+    path("login/", login_view, name="login"),
     path("logout/", auth_views.LogoutView.as_view(next_page="/login/"), name="logout"),
     path("register/", register_view, name="register"),
+    path("metrics/db-pool/", pool_metrics_view, name="db_pool_metrics"),
 ]
@@ -5,9 +5,15 @@ from django.contrib.admin.models import LogEntry
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
+from django.utils.decorators import method_decorator
 
-from .admin_filters import AdminLoginLogoutFilter
+from pin_people.routers import read_from_replicas
+
+from .admin_filters import AdminLoginLogoutFilter, UsernameFilter
+from .admin_paginators import EstimatedCountPaginator
 from .forms import CustomUserChangeForm, CustomUserCreationForm
+from .models import AuthEvent
+from .search import TrigramSearchMixin
 
 User = get_user_model()
 
@@ -36,17 +42,31 @@ admin_site = PinPeopleAdminSite(name="pin_people_admin")
 admin_site.register(Group)
 
 
+class ReplicaChangelistMixin:
+    """
+    Read the changelist from a replica when one is configured, see pin_people/routers.py.
+    Actions are POSTed, so they still read from the primary.
+    """
+
+    @method_decorator(read_from_replicas)
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
+
+
 @admin.register(User, site=admin_site)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ReplicaChangelistMixin, TrigramSearchMixin, BaseUserAdmin):
     """
     Custom configuration for the Django admin interface managing User objects.
     This customization ensures that all user-related data, including geographical
     details, can be viewed and edited directly within the Django admin.
+    Searches go through the trigram indexes, see users/search.py, and saving a user
+    only writes the fields that changed.
     """
 
     list_display = ("username", "email", "first_name", "last_name", "phone_number", "latitude", "longitude")
     search_fields = ("username", "email", "phone_number")
     ordering = ("username",)
+    show_full_result_count = False
 
     add_form = CustomUserCreationForm
     form = CustomUserChangeForm
@@ -59,6 +79,12 @@ class UserAdmin(BaseUserAdmin):
         ("Extra Info", {"fields": ("phone_number", "address", "latitude", "longitude")}),
     )
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Write only the columns whose value changed, see User.save_changes
+        obj.save_changes(form._meta.fields)
+
 
 # Un-register LogEntry if it has been registered
 # It might be that LogEntry is already registered by Django in django.contrib.admin
@@ -69,15 +95,52 @@ except admin.sites.NotRegistered:
 
 
 @admin.register(LogEntry, site=admin_site)
-class LogEntryAdmin(admin.ModelAdmin):
+class LogEntryAdmin(ReplicaChangelistMixin, TrigramSearchMixin, admin.ModelAdmin):
     """
     Custom admin configuration for viewing and managing Django's built-in LogEntry records.
+    Built to stay fast with millions of entries: users are joined in instead of fetched
+    per row, the user filter is a text box instead of a list of every user, the
+    unfiltered changelist is counted from table statistics, the date drill-down
+    is backed by the index on action_time created in users/migrations, and searches
+    go through trigram indexes (see users/search.py). Searches only cover the columns
+    of the log itself: a user column would turn every word into an OR across a join
+    that the indexes cannot answer, and the user filter finds entries by username.
     """
 
     list_display = ("action_time", "user", "object_repr", "change_message", "action_flag")
-    list_filter = (AdminLoginLogoutFilter, "user", "action_flag")
-    search_fields = ("change_message", "user__username", "object_repr")
+    list_filter = (UsernameFilter, "action_flag")
+    list_select_related = ("user",)
+    search_fields = ("change_message", "object_repr")
+    date_hierarchy = "action_time"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs
+
+
+@admin.register(AuthEvent, site=admin_site)
+class AuthEventAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    """
+    Read-only admin for the login/logout history recorded in AuthEvent.
+    The date filter and date drill-down bound the timestamp, so only the monthly
+    partitions in range are read.
+    """
+
+    list_display = ("timestamp", "user", "event_type", "channel", "ip_address")
+    list_filter = (AdminLoginLogoutFilter, ("timestamp", admin.DateFieldListFilter), "channel", UsernameFilter)
+    list_select_related = ("user",)
+    search_fields = ("user__username",)
+    ordering = ("-timestamp",)
+    date_hierarchy = "timestamp"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
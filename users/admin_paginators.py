@@ -0,0 +1,45 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_row_count(model, using="default"):
+    """
+    Return the planner's estimate of the number of rows in a model's table, or None
+    when the database keeps no such statistics or the table has not been analyzed yet.
+    A partitioned table is estimated as the sum of its partitions, as the statistics
+    of the parent are not kept up to date by autovacuum.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sum(reltuples) FILTER (WHERE reltuples >= 0) FROM pg_class "
+            "WHERE relkind <> 'p' AND (oid = %s::regclass OR oid IN "
+            "(SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass))",
+            [model._meta.db_table, model._meta.db_table],
+        )
+        estimate = cursor.fetchone()[0]
+    return None if estimate is None else int(estimate)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over very large tables.
+    An unfiltered changelist is counted from the planner statistics instead of with an
+    exact COUNT(*), which has to read the whole table. Filtered changelists, which go
+    through indexes, and small tables are still counted exactly.
+    """
+
+    # Tables estimated smaller than this are counted exactly
+    ESTIMATE_THRESHOLD = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, "query") and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
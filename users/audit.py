@@ -0,0 +1,122 @@
+"""
+Asynchronous, batched writer for audit records such as the login/logout log.
+
+`audit_writer.write(instance)` puts an unsaved model instance on a bounded in-process
+queue and returns immediately. A background thread saves the queued instances with
+one `bulk_create` per model as soon as AUDIT_LOG_BATCH_SIZE of them are waiting or
+AUDIT_LOG_FLUSH_INTERVAL seconds after the oldest one was queued, whichever comes
+first. Whatever is still queued when the process exits is written by an atexit hook.
+
+Records are written synchronously instead when settings.AUDIT_LOG_ASYNC is off, when
+the caller is inside a transaction (so the record commits or rolls back with it, which
+also keeps tests deterministic) and when the queue is full, so memory stays bounded
+and no record is dropped under load.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditWriter:
+    """
+    Queue of unsaved model instances drained by one background thread per process.
+    """
+
+    def __init__(self, max_queue_size=None, batch_size=None, flush_interval=None):
+        self.max_queue_size = max_queue_size or settings.AUDIT_LOG_MAX_QUEUE_SIZE
+        self.batch_size = batch_size or settings.AUDIT_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_LOG_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def write(self, instance):
+        """
+        Save an unsaved model instance, in the background when possible.
+        """
+        if not settings.AUDIT_LOG_ASYNC or connection.in_atomic_block:
+            _bulk_create([instance])
+            return
+        try:
+            self._ensure_started().put_nowait(instance)
+        except queue.Full:
+            _bulk_create([instance])
+
+    def _ensure_started(self):
+        # A forked worker inherits the parent's queue but not its thread, so it starts its own
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_queue_size)
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            return self._queue
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._flush(batch)
+        finally:
+            connections.close_all()
+
+    def _flush(self, batch):
+        try:
+            _bulk_create(batch)
+        except Exception:
+            # A failed batch must not kill the writer thread
+            logger.exception("Could not write %d audit records.", len(batch))
+        close_old_connections()
+
+    def shutdown(self, timeout=10):
+        """
+        Write everything still queued and stop the background thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("The audit writer did not drain its queue in time.")
+            return
+        thread.join(timeout)
+
+
+def _bulk_create(instances):
+    by_model = {}
+    for instance in instances:
+        by_model.setdefault(type(instance), []).append(instance)
+    for model, objs in by_model.items():
+        model.objects.bulk_create(objs)
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.shutdown)
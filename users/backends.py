@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password, verify_password
+from django.core.cache import cache
+from django.db import transaction
+
+from pin_people.routers import use_replicas
+
+from .hashing import run_hashing
+
+User = get_user_model()
+
+
+def _user_cache_key(user_id):
+    return f"users:auth:{user_id}"
+
+
+def invalidate_cached_users(user_ids):
+    """
+    Drop the cached users resolved for the sessions of these users, now and again once
+    the current transaction commits, so a request that read the old row in between
+    cannot leave it cached.
+    """
+    keys = [_user_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class PooledHashingBackend(ModelBackend):
+    """
+    ModelBackend whose async authentication verifies passwords in the hashing pool
+    (see users/hashing.py) instead of on the event loop. Synchronous authentication,
+    used by the admin and the test client, is unchanged.
+
+    The user of a logged-in session is resolved from the cache, for up to
+    settings.AUTH_USER_CACHE_TIMEOUT seconds (0 disables the cache, and it is always
+    0 unless the cache is shared between processes, see settings.CACHE_SHARED). Saving or
+    deleting a user drops their cached copy, see users/signals.py; a changed password
+    still logs other sessions out, as Django checks the session hash against the
+    password of the user returned here. Cached users are always loaded from the primary
+    database, as a copy read from a lagging replica would outlive the lag.
+    """
+
+    def get_user(self, user_id):
+        if not settings.AUTH_USER_CACHE_TIMEOUT:
+            return super().get_user(user_id)
+        key = _user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            with use_replicas(False):
+                user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        if not settings.AUTH_USER_CACHE_TIMEOUT:
+            return await super().aget_user(user_id)
+        key = _user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            with use_replicas(False):
+                user = await super().aget_user(user_id)
+            if user is None:
+                return None
+            await cache.aset(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await User._default_manager.aget_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash once anyway, so unknown usernames take as long as wrong passwords
+            await run_hashing(make_password, password)
+            return None
+        is_correct, must_update = await run_hashing(verify_password, password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            # Upgrade the hash to the current hasher settings, like User.check_password
+            user.password = await run_hashing(make_password, password)
+            await user.asave(update_fields=["password"])
+        return user
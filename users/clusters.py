@@ -0,0 +1,170 @@
+"""
+Precomputed marker clusters for the user map.
+
+Every zoom level up to CLUSTER_MAX_ZOOM is divided into a grid of cells, each a
+quarter of a map tile wide, and `MapCluster` keeps one row per non-empty cell with
+the number of users in it, the sums needed for its centroid and a few sample
+usernames, refilled from the cell when sampled users leave it. Rows are adjusted
+incrementally when a single user moves, so serving a zoomed-out map costs the
+same no matter how many users there are.
+"""
+
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .geo import bbox_q, tile_bounds, tile_ranges, tile_xy
+from .models import MapCluster, float_coordinates
+
+User = get_user_model()
+
+# Deepest zoom level served as clusters; deeper zoom levels show individual users
+CLUSTER_MAX_ZOOM = 12
+# Cells at zoom z are tiles at zoom z + CLUSTER_CELL_SHIFT, i.e. 64x64 pixels
+CLUSTER_CELL_SHIFT = 2
+SAMPLE_SIZE = 3
+MAX_CLUSTERS_PER_REQUEST = 2000
+REBUILD_BATCH_SIZE = 5000
+
+
+def cell_for(latitude, longitude, zoom):
+    """
+    Return the (cell_x, cell_y) of the cluster cell containing a point at a zoom level.
+    """
+    return tile_xy(latitude, longitude, zoom + CLUSTER_CELL_SHIFT)
+
+
+def _deltas(old, new):
+    """
+    Collect the per-cell changes needed to move a map point from old to new.
+    Both are (latitude, longitude, username) tuples or None.
+    """
+    deltas = {}
+    for point, sign in ((old, -1), (new, 1)):
+        if point is None:
+            continue
+        latitude, longitude, username = point
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            key = (zoom, *cell_for(latitude, longitude, zoom))
+            delta = deltas.setdefault(key, {"count": 0, "latitude": 0.0, "longitude": 0.0, "add": [], "remove": []})
+            delta["count"] += sign
+            delta["latitude"] += sign * latitude
+            delta["longitude"] += sign * longitude
+            delta["remove" if sign < 0 else "add"].append(username)
+    return deltas
+
+
+def _cell_samples(zoom, x, y, exclude, limit):
+    """
+    Return up to `limit` usernames of the users in a cluster cell, other than those in `exclude`.
+    """
+    south, west, north, east = tile_bounds(x, y, zoom + CLUSTER_CELL_SHIFT)
+    users = User.objects.filter(bbox_q(south, west, north, east)).exclude(username__in=exclude)
+    return list(users.values_list("username", flat=True)[:limit])
+
+
+def _apply_deltas(deltas):
+    cells = reduce(or_, (Q(zoom=zoom, cell_x=x, cell_y=y) for zoom, x, y in deltas))
+    existing = {(c.zoom, c.cell_x, c.cell_y): c for c in MapCluster.objects.select_for_update().filter(cells)}
+
+    to_create, to_update, to_delete = [], [], []
+    for key, delta in deltas.items():
+        cluster = existing.get(key)
+        if cluster is None:
+            if delta["count"] <= 0:
+                continue
+            zoom, x, y = key
+            cluster = MapCluster(zoom=zoom, cell_x=x, cell_y=y)
+            to_create.append(cluster)
+        else:
+            to_update.append(cluster)
+
+        cluster.count += delta["count"]
+        cluster.latitude_sum += delta["latitude"]
+        cluster.longitude_sum += delta["longitude"]
+        samples = [name for name in cluster.sample_usernames if name not in delta["remove"]]
+        samples += [name for name in delta["add"] if name not in samples]
+        if delta["remove"] and len(samples) < min(SAMPLE_SIZE, cluster.count):
+            # Refill the sample from the users left in the cell, so it does not drain away
+            samples += _cell_samples(*key, exclude=samples, limit=SAMPLE_SIZE - len(samples))
+        cluster.sample_usernames = samples[:SAMPLE_SIZE]
+        if cluster.count <= 0:
+            to_update.remove(cluster)
+            to_delete.append(cluster.pk)
+
+    MapCluster.objects.bulk_create(to_create)
+    MapCluster.objects.bulk_update(to_update, ["count", "latitude_sum", "longitude_sum", "sample_usernames"])
+    if to_delete:
+        MapCluster.objects.filter(pk__in=to_delete).delete()
+
+
+def move_point(old, new):
+    """
+    Update the precomputed clusters after a user's map point changed from old to new.
+    Pass old=None for a user that just got coordinates and new=None for one that lost them.
+    """
+    if old == new:
+        return
+    deltas = _deltas(old, new)
+    # Two concurrent saves can race to create the same cell; the loser retries
+    # and then finds the row the winner created
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                _apply_deltas(deltas)
+            return
+        except IntegrityError:
+            if attempt == 2:
+                raise
+
+
+def rebuild_clusters():
+    """
+    Recompute every cluster level from scratch.
+    Levels are rebuilt one at a time so memory is bounded by the cells of one level.
+    """
+    with transaction.atomic():
+        MapCluster.objects.all().delete()
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            clusters = {}
+            users = User.objects.exclude(latitude=None).exclude(longitude=None)
+            rows = users.values_list(*float_coordinates(), "username")
+            for latitude, longitude, username in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                x, y = cell_for(latitude, longitude, zoom)
+                cluster = clusters.get((x, y))
+                if cluster is None:
+                    cluster = clusters[(x, y)] = MapCluster(zoom=zoom, cell_x=x, cell_y=y, sample_usernames=[])
+                cluster.count += 1
+                cluster.latitude_sum += latitude
+                cluster.longitude_sum += longitude
+                if len(cluster.sample_usernames) < SAMPLE_SIZE:
+                    cluster.sample_usernames.append(username)
+            MapCluster.objects.bulk_create(clusters.values(), batch_size=REBUILD_BATCH_SIZE)
+
+
+def clusters_in_bbox(south, west, north, east, zoom):
+    """
+    Return the clusters whose cells intersect a bounding box at a zoom level,
+    at most MAX_CLUSTERS_PER_REQUEST of them.
+    """
+    ranges = tile_ranges(south, west, north, east, zoom + CLUSTER_CELL_SHIFT)
+    cells = reduce(
+        or_,
+        (
+            Q(cell_x__gte=x_min, cell_x__lte=x_max, cell_y__gte=y_min, cell_y__lte=y_max)
+            for x_min, x_max, y_min, y_max in ranges
+        ),
+    )
+    clusters = MapCluster.objects.filter(cells, zoom=zoom).order_by("-count")[:MAX_CLUSTERS_PER_REQUEST]
+    return [
+        {
+            "latitude": c.latitude_sum / c.count,
+            "longitude": c.longitude_sum / c.count,
+            "count": c.count,
+            "usernames": c.sample_usernames,
+        }
+        for c in clusters
+    ]
@@ -0,0 +1,102 @@
+"""
+ETag and Last-Modified validators for the HTML pages, used with Django's `condition` decorator.
+
+A page's validators cover everything its markup depends on: the templates it is
+rendered from, the logged-in user shown in the navigation, the CSRF secret its forms
+embed a token for and, for profiles, the user being viewed. Revalidating an unchanged
+page therefore costs the session lookup plus at most one indexed query, and never
+renders a template.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.middleware.csrf import get_token
+from django.template.loader import get_template
+
+User = get_user_model()
+
+LOCATION_TEMPLATES = ("users/location.html", "base.html")
+PROFILE_TEMPLATES = ("users/profile.html", "base.html")
+# How long a rendered profile is kept, see `profile_fragment_vary_on`
+PROFILE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def _templates_modified(names):
+    """
+    Return when the most recently edited of the templates changed, so a deploy that
+    changes the markup also changes the validators.
+    """
+    mtime = max(os.path.getmtime(get_template(name).origin.name) for name in names)
+    return datetime.fromtimestamp(mtime, tz=timezone.utc)
+
+
+def _viewer(request):
+    user = request.user
+    # get_token() creates the secret when the request has none yet, so the ETag
+    # matches the cookie the response is about to set
+    get_token(request)
+    return user.pk, user.is_superuser, user.updated_at, request.META["CSRF_COOKIE"]
+
+
+def _etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def location_etag(request):
+    return _etag(_templates_modified(LOCATION_TEMPLATES), _viewer(request), settings.MAP_VECTOR_TILES)
+
+
+def location_last_modified(request):
+    return max(_templates_modified(LOCATION_TEMPLATES), request.user.updated_at)
+
+
+def viewed_profile(request, user_id):
+    """
+    Return the user whose profile is being viewed, or None when the view will
+    answer with a 403 or 404 instead. The result is memoized on the request, as
+    Django asks for the ETag and Last-Modified separately and the view needs it too.
+    """
+    if not hasattr(request, "_viewed_profile"):
+        if not user_id or user_id == request.user.pk:
+            user = request.user
+        elif request.user.is_superuser:
+            user = User.objects.filter(pk=user_id).first()
+        else:
+            user = None
+        request._viewed_profile = user
+    return request._viewed_profile
+
+
+def _profile_updated_at(request, user_id):
+    user = viewed_profile(request, user_id)
+    return None if user is None else user.updated_at
+
+
+def profile_fragment_vary_on(request, user):
+    """
+    Return what the cached rendering of a profile is keyed on, besides its name:
+    the user and their modification stamp, the viewer's role and the template
+    version. Saving the user in any way but a queryset update bumps updated_at, so
+    edits from the profile change page or the admin are picked up without any
+    explicit invalidation.
+    """
+    role = "superuser" if request.user.is_superuser else "owner"
+    return [user.pk, user.updated_at.isoformat(), role, _templates_modified(PROFILE_TEMPLATES).timestamp()]
+
+
+def profile_etag(request, user_id=None):
+    updated_at = _profile_updated_at(request, user_id)
+    if updated_at is None:
+        return None
+    return _etag(_templates_modified(PROFILE_TEMPLATES), _viewer(request), user_id, updated_at)
+
+
+def profile_last_modified(request, user_id=None):
+    updated_at = _profile_updated_at(request, user_id)
+    if updated_at is None:
+        return None
+    return max(_templates_modified(PROFILE_TEMPLATES), request.user.updated_at, updated_at)
@@ -0,0 +1,96 @@
+"""
+Streaming export of every user location as GeoJSON or NDJSON.
+
+Rows are read through a server-side cursor with `QuerySet.iterator()` and encoded
+one chunk at a time, optionally gzip-compressed on the fly, so memory use stays flat
+however many users there are. The same generators back `export_locations_view`
+and the `export_locations` management command.
+"""
+
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+
+from .models import float_coordinates
+
+User = get_user_model()
+
+# Rows fetched per round trip, and encoded per yielded chunk
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    "geojson": "application/geo+json",
+    "ndjson": "application/x-ndjson",
+}
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _location_rows():
+    users = User.objects.exclude(latitude=None).exclude(longitude=None).order_by("pk")
+    rows = users.values_list("id", "username", *float_coordinates())
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _ndjson_line(user_id, username, latitude, longitude):
+    return _dumps({"id": user_id, "username": username, "latitude": latitude, "longitude": longitude})
+
+
+def _geojson_feature(user_id, username, latitude, longitude):
+    return _dumps(
+        {
+            "type": "Feature",
+            "id": user_id,
+            # GeoJSON positions are longitude first
+            "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+            "properties": {"username": username},
+        }
+    )
+
+
+def _chunked(rows, encode, separator):
+    """
+    Encode rows and join them into chunks of EXPORT_CHUNK_SIZE rows, each one ending with the separator.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(encode(*row))
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield separator.join(chunk) + separator
+            chunk = []
+    if chunk:
+        yield separator.join(chunk) + separator
+
+
+def export_chunks(export_format):
+    """
+    Yield the export of every user with coordinates in `export_format`, as UTF-8 bytes.
+    Raise ValueError for an unknown format.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}.")
+    rows = _location_rows()
+    if export_format == "ndjson":
+        for chunk in _chunked(rows, _ndjson_line, "\n"):
+            yield chunk.encode()
+        return
+
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    for chunk in _chunked(rows, _geojson_feature, ","):
+        # Move the separator to the front of the chunk, so the last feature has none after it
+        yield (chunk[:-1] if first else "," + chunk[:-1]).encode()
+        first = False
+    yield b"]}"
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compress a stream of bytes chunks into one gzip stream, incrementally.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
@@ -1,17 +1,85 @@
+from asgiref.sync import sync_to_async
 from django import forms
-from django.contrib.auth import get_user_model
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth import aauthenticate, get_user_model
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+
+from .hashing import run_hashing
 
 User = get_user_model()
 
 
+class AsyncAuthenticationForm(AuthenticationForm):
+    """
+    AuthenticationForm for async views: `avalidate()` checks the credentials with
+    `aauthenticate()`, so the password is verified in the hashing pool. Synchronous
+    callers of `is_valid()` still get the credentials checked by AuthenticationForm.
+    """
+
+    # Set by avalidate() while it runs the field validation
+    _validating_async = False
+
+    def clean(self):
+        if not self._validating_async:
+            return super().clean()
+        # The credentials are checked by avalidate(), not on the calling thread
+        return self.cleaned_data
+
+    async def avalidate(self):
+        """
+        Return whether the form is valid and the credentials belong to a user allowed to log in.
+        """
+        self._validating_async = True
+        try:
+            valid = self.is_valid()
+        finally:
+            self._validating_async = False
+        if not valid:
+            return False
+        self.user_cache = await aauthenticate(
+            self.request, username=self.cleaned_data["username"], password=self.cleaned_data["password"]
+        )
+        try:
+            if self.user_cache is None:
+                raise self.get_invalid_login_error()
+            self.confirm_login_allowed(self.user_cache)
+        except ValidationError as exc:
+            self.add_error(None, exc)
+            return False
+        return True
+
+
 class CustomUserCreationForm(UserCreationForm):
+    password_hash = None
+
     class Meta:
         model = User
         fields = ["username"]
 
+    def set_password_and_save(self, user, password_field_name="password1", commit=True):
+        if self.password_hash is None:
+            return super().set_password_and_save(user, password_field_name, commit)
+        user.password = self.password_hash
+        if commit:
+            user.save()
+        return user
+
+    async def asave(self):
+        """
+        Save the user, hashing the password in the hashing pool.
+        """
+        self.password_hash = await run_hashing(make_password, self.cleaned_data["password1"])
+        return await sync_to_async(self.save)()
+
 
 class CustomUserChangeForm(forms.ModelForm):
+    """
+    Profile form. Emails are checked for case-insensitive uniqueness by the model's
+    constraint validation, one lookup on the lower(email) index. Saving writes only
+    the fields that changed, see User.save_changes.
+    """
+
     class Meta:
         model = User
         fields = (
@@ -33,8 +101,12 @@ class CustomUserChangeForm(forms.ModelForm):
             "longitude": forms.TextInput(attrs={"id": "id_longitude"}),
         }
 
-    def clean_email(self):
-        email = self.cleaned_data.get("email")
-        if User.objects.exclude(pk=self.instance.pk).filter(email=email).exists():
-            raise forms.ValidationError("This email is already in use.")
-        return email
+    def save(self, commit=True):
+        """
+        Write only the columns whose value changed, and nothing at all when none did.
+        """
+        if not commit:
+            return super().save(commit=False)
+        self.instance.save_changes(self._meta.fields)
+        self._save_m2m()
+        return self.instance
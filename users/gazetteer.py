@@ -0,0 +1,127 @@
+"""
+Offline place name lookup for geocoding free-text addresses, see users/geocoding.py.
+
+A gazetteer is a local file of named places with coordinates, either:
+- a GeoNames dump such as cities500.txt (tab-separated, no header; the name, ASCII
+  name, coordinates and population columns are used), or
+- a CSV file with a header row and "name", "latitude" and "longitude" columns, and
+  optionally "population".
+
+An address resolves to the longest place name found in it as a run of whole words
+within one comma-separated part; among equally long names the most populous place
+wins. Names and addresses are compared after `normalize_address()`.
+
+This module does not use Django, so the geocoding worker processes can import it
+without setting Django up.
+"""
+
+import csv
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Longest place name looked for, in words
+MAX_NAME_WORDS = 4
+# Longest normalized address stored, the length of User.address
+MAX_ADDRESS_LENGTH = 255
+
+# GeoNames dump columns
+_GEONAMES_NAME, _GEONAMES_ASCII_NAME, _GEONAMES_LATITUDE, _GEONAMES_LONGITUDE, _GEONAMES_POPULATION = 1, 2, 4, 5, 14
+
+_not_word = re.compile(r"[^\w,]+")
+_lock = threading.Lock()
+_loaded = {}
+
+
+def normalize_address(address):
+    """
+    Return the address lower-cased, without accents or punctuation and with single
+    spaces, its comma-separated parts kept apart by bare commas.
+    """
+    text = unicodedata.normalize("NFKD", address).encode("ascii", "ignore").decode().lower()
+    parts = (" ".join(_not_word.sub(" ", part).split()) for part in text.replace("_", " ").split(","))
+    return ",".join(part for part in parts if part)[:MAX_ADDRESS_LENGTH]
+
+
+class Gazetteer:
+    """
+    Place names of a gazetteer file, indexed for `locate()`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        # Identifies this version of the file, so cached results from another one are not reused
+        self.fingerprint = hashlib.md5(
+            f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode(), usedforsecurity=False
+        ).hexdigest()
+        self.places = {}
+        for names, latitude, longitude, population in self._read():
+            for name in names:
+                key = normalize_address(name).replace(",", " ")
+                if key and (key not in self.places or population > self.places[key][2]):
+                    self.places[key] = (latitude, longitude, population)
+
+    def _read(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            if self.path.endswith(".csv"):
+                for row in csv.DictReader(f):
+                    yield [row["name"]], row["latitude"], row["longitude"], int(row.get("population") or 0)
+                return
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                yield (
+                    [row[_GEONAMES_NAME], row[_GEONAMES_ASCII_NAME]],
+                    row[_GEONAMES_LATITUDE],
+                    row[_GEONAMES_LONGITUDE],
+                    int(row[_GEONAMES_POPULATION] or 0),
+                )
+
+    def locate(self, normalized_address):
+        """
+        Return the (latitude, longitude) strings of the place a normalized address is in, or None.
+        """
+        best = None
+        for part in normalized_address.split(","):
+            words = part.split()
+            for length in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+                if best is not None and length < best[0]:
+                    break
+                for start in range(len(words) - length + 1):
+                    place = self.places.get(" ".join(words[start : start + length]))
+                    if place is not None and (best is None or (length, place[2]) > best[:2]):
+                        best = (length, place[2], place[0], place[1])
+        return None if best is None else best[2:]
+
+
+def load_gazetteer(path):
+    """
+    Return the Gazetteer of a file, loaded once per process and version of the file,
+    or None when the file does not exist.
+    """
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        key = (path, None)
+    with _lock:
+        if key not in _loaded:
+            # Forget the previous versions of the file
+            for stale in [k for k in _loaded if k[0] == path]:
+                del _loaded[stale]
+            if key[1] is None:
+                logger.warning("No gazetteer at %s, addresses will not be geocoded.", path)
+                _loaded[key] = None
+            else:
+                _loaded[key] = Gazetteer(path)
+        return _loaded[key]
+
+
+def locate(path, normalized_address):
+    """
+    Locate a normalized address in the gazetteer file at path; used by the worker processes.
+    """
+    return load_gazetteer(path).locate(normalized_address)
@@ -0,0 +1,327 @@
+"""
+Helpers for working with the latitude/longitude coordinates stored on users.
+"""
+
+import math
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.db.models import Q
+
+MIN_LATITUDE = -90.0
+MAX_LATITUDE = 90.0
+MIN_LONGITUDE = -180.0
+MAX_LONGITUDE = 180.0
+MAX_ZOOM = 19
+# Web Mercator cannot represent the poles; tiles stop at this latitude
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+# Mean Earth radius used for great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Length of the geohash stored on users, a cell of roughly 5 x 5 metres
+GEOHASH_PRECISION = 9
+# Upper bound on the geohash prefixes a bounding box query is broken into
+GEOHASH_MAX_CELLS = 32
+
+
+def _normalize_longitude(value):
+    """
+    Wrap a longitude into the [-180, 180] range.
+    """
+    if MIN_LONGITUDE <= value <= MAX_LONGITUDE:
+        return value
+    return (value + 180.0) % 360.0 - 180.0
+
+
+def to_dms(value, lat_or_lon="lat"):
+    """
+    Convert a decimal latitude or longitude value to Degrees, Minutes, Seconds (DMS) format.
+    """
+    degrees = int(abs(value))
+    minutes_float = (abs(value) - degrees) * 60
+    minutes = int(minutes_float)
+    seconds = round((minutes_float - minutes) * 60)
+
+    direction = ""
+    if lat_or_lon == "lat":
+        direction = "N" if value >= 0 else "S"
+    else:
+        direction = "E" if value >= 0 else "W"
+
+    return f"{degrees}°{minutes}'{seconds}\"{direction}"
+
+
+def format_position(latitude, longitude):
+    """
+    Return a point formatted as DMS coordinates, e.g. 34°4'48"S 18°51'36"E.
+    """
+    return f"{to_dms(latitude)} {to_dms(longitude, lat_or_lon='lon')}"
+
+
+# Lookup tables for to_dms_batch. Seconds run up to 60, as to_dms does not carry a rounded-up 60 into the minutes
+_DMS_DEGREES = np.array([f"{d}°" for d in range(181)])
+_DMS_MINUTES_SECONDS = np.array([f"{m}'{s}\"" for m in range(60) for s in range(61)])
+
+
+def _dms_array(values, lat_or_lon):
+    values = np.asarray(values, dtype=float)
+    micro = np.rint(np.abs(values) * 1_000_000).astype(np.int64)
+    degrees, rest = np.divmod(micro, 1_000_000)
+    minutes, rest = np.divmod(rest * 60, 1_000_000)
+    seconds, rest = np.divmod(rest * 60, 1_000_000)
+    # round() on a Decimal rounds half to even
+    seconds += (2 * rest > 1_000_000) | ((2 * rest == 1_000_000) & (seconds % 2 == 1))
+
+    directions = np.array(["N", "S"] if lat_or_lon == "lat" else ["E", "W"])[(values < 0).astype(np.intp)]
+    return _DMS_DEGREES[degrees] + _DMS_MINUTES_SECONDS[minutes * 61 + seconds] + directions
+
+
+def to_dms_batch(values, lat_or_lon="lat"):
+    """
+    Vectorized `to_dms`: convert an array of decimal latitudes or longitudes to a list of DMS strings.
+    Values are taken to six decimal places, the precision coordinates are stored with,
+    and split into degrees, minutes and seconds with exact integer arithmetic, so the
+    result matches `to_dms` on the stored Decimal values, including the half-even
+    rounding of the seconds.
+    """
+    return _dms_array(values, lat_or_lon).tolist()
+
+
+def format_positions_batch(latitudes, longitudes):
+    """
+    Vectorized `format_position`: format arrays of coordinates as a list of DMS positions.
+    """
+    return (_dms_array(latitudes, "lat") + " " + _dms_array(longitudes, "lon")).tolist()
+
+
+def parse_bbox(params):
+    """
+    Parse the south, west, north and east query parameters into a bounding box.
+    Latitudes are clamped to the valid range and longitudes are wrapped, so the
+    box Leaflet reports for a panned or zoomed-out map is accepted as is.
+    A box whose west edge is greater than its east edge crosses the antimeridian.
+    Raise ValueError when a parameter is missing or not a number.
+    """
+    try:
+        south, west, north, east = (float(params[key]) for key in ("south", "west", "north", "east"))
+    except KeyError as exc:
+        raise ValueError(f"Missing bounding box parameter: {exc.args[0]}.") from exc
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Bounding box parameters must be numbers.") from exc
+    if not all(map(math.isfinite, (south, west, north, east))):
+        raise ValueError("Bounding box parameters must be finite numbers.")
+
+    if south > north:
+        raise ValueError("south must not be greater than north.")
+
+    south = max(south, MIN_LATITUDE)
+    north = min(north, MAX_LATITUDE)
+    if east - west >= 360.0:
+        west, east = MIN_LONGITUDE, MAX_LONGITUDE
+    else:
+        west, east = _normalize_longitude(west), _normalize_longitude(east)
+    return south, west, north, east
+
+
+def parse_zoom(params):
+    """
+    Parse the zoom query parameter, clamped to the zoom levels the map supports.
+    Raise ValueError when it is missing or not an integer.
+    """
+    try:
+        zoom = int(params["zoom"])
+    except KeyError as exc:
+        raise ValueError("Missing zoom parameter.") from exc
+    except (TypeError, ValueError) as exc:
+        raise ValueError("zoom must be an integer.") from exc
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encode a point as a geohash of the given length.
+    Points that are close together share a long common prefix, so a prefix
+    match on an indexed geohash column is a range scan over one area.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range, lon_range = [MIN_LATITUDE, MAX_LATITUDE], [MIN_LONGITUDE, MAX_LONGITUDE]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            interval[0] = middle
+        else:
+            value <<= 1
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _geohash_cell_size(precision):
+    """
+    Return the (height, width) in degrees of a geohash cell of the given length.
+    """
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _cell_indexes(low, high, origin, size):
+    """
+    Return the indexes of the cells of the given size covering [low, high], counted from origin.
+    """
+    last = round(-2 * origin / size) - 1
+    return range(min(int((low - origin) // size), last), min(int((high - origin) // size), last) + 1)
+
+
+def geohash_prefixes(south, west, north, east, max_cells=GEOHASH_MAX_CELLS):
+    """
+    Return the geohash prefixes of the cells covering a bounding box.
+    The longest prefix length giving at most `max_cells` cells is used. Return None
+    when the box is so large that the covering is the whole world.
+    """
+    lon_spans = [(west, east)] if west <= east else [(west, MAX_LONGITUDE), (MIN_LONGITUDE, east)]
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = _geohash_cell_size(precision)
+        rows = _cell_indexes(south, north, MIN_LATITUDE, height)
+        columns = [i for low, high in lon_spans for i in _cell_indexes(low, high, MIN_LONGITUDE, width)]
+        if len(rows) * len(columns) > max_cells:
+            break
+        best = (precision, height, width, rows, columns)
+    if best is None:
+        return None
+
+    precision, height, width, rows, columns = best
+    if precision == 1 and len(rows) * len(columns) == len(GEOHASH_ALPHABET):
+        return None
+    # Encode the centre of each cell to get its prefix
+    return sorted(
+        {
+            encode_geohash(MIN_LATITUDE + (row + 0.5) * height, MIN_LONGITUDE + (column + 0.5) * width, precision)
+            for row in rows
+            for column in columns
+        }
+    )
+
+
+def bbox_q(south, west, north, east):
+    """
+    Return a Q object matching users whose coordinates fall inside the bounding box.
+    The exact coordinate filter is combined with prefix matches on the indexed
+    geohash column, which lets the database answer it with index range scans.
+    """
+    q = Q(latitude__gte=south, latitude__lte=north)
+    if west <= east:
+        q &= Q(longitude__gte=west, longitude__lte=east)
+    else:
+        # The box crosses the antimeridian, so it is split into two longitude ranges
+        q &= Q(longitude__gte=west) | Q(longitude__lte=east)
+
+    prefixes = geohash_prefixes(south, west, north, east)
+    if prefixes:
+        q &= reduce(or_, (Q(geohash__startswith=prefix) for prefix in prefixes))
+    return q
+
+
+def tile_fraction(latitude, longitude, zoom):
+    """
+    Return the fractional tile coordinates of a point, e.g. (2.5, 1.25) for a point
+    halfway across and a quarter down tile x=2, y=1.
+    """
+    n = 1 << zoom
+    latitude = min(max(float(latitude), -MAX_MERCATOR_LATITUDE), MAX_MERCATOR_LATITUDE)
+    x = (float(longitude) + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n
+    return x, y
+
+
+def tile_xy(latitude, longitude, zoom):
+    """
+    Return the x/y index of the Web Mercator (slippy map) tile containing a point.
+    Points beyond the Mercator latitude limit are placed in the edge tiles.
+    """
+    n = 1 << zoom
+    x, y = tile_fraction(latitude, longitude, zoom)
+    return min(max(int(x), 0), n - 1), min(max(int(y), 0), n - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """
+    Return the (south, west, north, east) bounding box of a Web Mercator tile.
+    """
+    n = 1 << zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def tile_ranges(south, west, north, east, zoom):
+    """
+    Return the (x_min, x_max, y_min, y_max) tile index ranges covering a bounding box.
+    A box crossing the antimeridian yields two ranges, one on each side of it.
+    """
+    x_min, y_min = tile_xy(north, west, zoom)
+    x_max, y_max = tile_xy(south, east, zoom)
+    if west <= east:
+        return [(x_min, x_max, y_min, y_max)]
+    return [(x_min, (1 << zoom) - 1, y_min, y_max), (0, x_max, y_min, y_max)]
+
+
+def snap_bbox(south, west, north, east, zoom):
+    """
+    Grow a bounding box to the edges of the tiles covering it at a zoom level, so that
+    viewports panned by less than a tile share one box. The tiles at the edges of the
+    Mercator grid are extended to the poles.
+    """
+    ranges = tile_ranges(south, west, north, east, zoom)
+    last = (1 << zoom) - 1
+    x_min, _, y_min, y_max = ranges[0]
+    x_max = ranges[-1][1]
+    if len(ranges) == 2 and x_max + 1 >= x_min:
+        # The two sides of a box crossing the antimeridian meet once snapped
+        x_min, x_max = 0, last
+    north = MAX_LATITUDE if y_min == 0 else tile_bounds(x_min, y_min, zoom)[2]
+    south = MIN_LATITUDE if y_max == last else tile_bounds(x_min, y_max, zoom)[0]
+    west = tile_bounds(x_min, y_min, zoom)[1]
+    east = tile_bounds(x_max, y_min, zoom)[3]
+    return south, west, north, east
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """
+    Return the smallest bounding box containing every point within radius_km of a point.
+    The box spans all longitudes when the circle reaches a pole.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    south = latitude - math.degrees(angular)
+    north = latitude + math.degrees(angular)
+    if south <= MIN_LATITUDE or north >= MAX_LATITUDE:
+        return max(south, MIN_LATITUDE), MIN_LONGITUDE, min(north, MAX_LATITUDE), MAX_LONGITUDE
+
+    delta = math.degrees(math.asin(min(math.sin(angular) / math.cos(math.radians(latitude)), 1.0)))
+    if delta >= 180.0:
+        return south, MIN_LONGITUDE, north, MAX_LONGITUDE
+    return south, _normalize_longitude(longitude - delta), north, _normalize_longitude(longitude + delta)
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Return the great-circle distances in kilometres from one point to arrays of points.
+    """
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,90 @@
+"""
+Offline geocoding of User.address against the local gazetteer (settings.GEOCODER_GAZETTEER),
+so users who did not share their browser location still appear on the map.
+
+Addresses are normalized first, and results are cached at two levels keyed on the
+normalized address and the gazetteer version: an in-process LRU cache for the save
+hook, and the GeocodedAddress table shared by every process and run. No network
+access is involved at any point.
+
+Users are geocoded when saved with a new address and no coordinates (see User.save),
+and in bulk by "manage.py geocode_users".
+"""
+
+from decimal import Decimal
+from functools import lru_cache
+from itertools import repeat
+
+from django.conf import settings
+
+from .gazetteer import load_gazetteer, locate, normalize_address
+from .models import GeocodedAddress
+
+# Addresses resolved per task sent to a worker process
+WORKER_CHUNK_SIZE = 100
+
+
+def get_gazetteer():
+    return load_gazetteer(str(settings.GEOCODER_GAZETTEER))
+
+
+def _position(latitude, longitude):
+    return None if latitude is None else (Decimal(latitude), Decimal(longitude))
+
+
+def geocode_normalized(addresses, executor=None):
+    """
+    Resolve normalized addresses, from the GeocodedAddress cache when possible and
+    otherwise from the gazetteer, in the executor's processes when one is given.
+    Return a dict mapping each address to its (latitude, longitude) Decimals, or to
+    None when it matched no place. Return an empty dict when there is no gazetteer.
+    """
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return {}
+    addresses = set(addresses)
+    cached = GeocodedAddress.objects.filter(normalized_address__in=addresses, gazetteer=gazetteer.fingerprint)
+    results = {
+        address: _position(latitude, longitude)
+        for address, latitude, longitude in cached.values_list("normalized_address", "latitude", "longitude")
+    }
+    misses = sorted(addresses - results.keys())
+    if not misses:
+        return results
+
+    if executor is None:
+        located = map(gazetteer.locate, misses)
+    else:
+        located = executor.map(locate, repeat(gazetteer.path), misses, chunksize=WORKER_CHUNK_SIZE)
+    rows = []
+    for address, position in zip(misses, located):
+        latitude, longitude = position or (None, None)
+        results[address] = _position(latitude, longitude)
+        rows.append(
+            GeocodedAddress(
+                normalized_address=address, gazetteer=gazetteer.fingerprint, latitude=latitude, longitude=longitude
+            )
+        )
+    GeocodedAddress.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["normalized_address"],
+        update_fields=["gazetteer", "latitude", "longitude"],
+    )
+    return results
+
+
+@lru_cache(maxsize=settings.GEOCODER_CACHE_SIZE)
+def _geocode_cached(fingerprint, address):
+    return geocode_normalized([address]).get(address)
+
+
+def geocode(address):
+    """
+    Return the (latitude, longitude) Decimals of a free-text address, or None.
+    """
+    normalized = normalize_address(address)
+    gazetteer = get_gazetteer()
+    if not normalized or gazetteer is None:
+        return None
+    return _geocode_cached(gazetteer.fingerprint, normalized)
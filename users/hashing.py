@@ -0,0 +1,66 @@
+"""
+Password hashing off the request path.
+
+A PBKDF2 hash takes hundreds of milliseconds of CPU. Under ASGI every synchronous
+view runs on one shared thread, so hashing in the login or registration view would
+hold up every other synchronous view (map, profile...) meanwhile. The async login and
+registration flows instead hand hashing and verification to a bounded thread pool
+(hashlib releases the GIL while hashing, so the threads run in parallel), via
+`run_hashing()`.
+
+At most PASSWORD_HASHING_WORKERS jobs run and PASSWORD_HASHING_MAX_PENDING more wait
+for a thread; beyond that `run_hashing()` raises HashingOverloaded right away, and
+the views answer 503 with a Retry-After header instead of letting the queue grow.
+
+The bulk user import hashes in worker processes started with `init_worker()`. This
+module is imported by those processes before Django is set up, so it must not import
+models at module level.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+class HashingOverloaded(Exception):
+    """
+    Raised when the password hashing pool has no room for another job.
+    """
+
+
+def init_worker():
+    """
+    Set Django up in a password hashing worker process, so make_password() can read the hasher settings.
+    """
+    django.setup()
+
+
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.PASSWORD_HASHING_WORKERS
+            _executor = ThreadPoolExecutor(workers, thread_name_prefix="password-hashing")
+            _slots = threading.BoundedSemaphore(workers + settings.PASSWORD_HASHING_MAX_PENDING)
+        return _executor, _slots
+
+
+async def run_hashing(func, *args):
+    """
+    Run a password hashing function in the hashing pool and return its result.
+    Raise HashingOverloaded when the pool is saturated.
+    """
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise HashingOverloaded
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    finally:
+        slots.release()
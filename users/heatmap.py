@@ -0,0 +1,171 @@
+"""
+Density heatmap tiles for the user map.
+
+Each Web Mercator tile is divided into a HEATMAP_GRID_SIZE x HEATMAP_GRID_SIZE grid
+of bins, each bin being the tile HEATMAP_GRID_SHIFT zoom levels deeper, and a
+heatmap tile holds the number of users in every bin. The browser only receives the
+non-empty bins and draws them on a canvas, so the payload depends on the tile size
+rather than on how many users there are.
+
+Zoomed-out grids are summed from the precomputed map clusters, whose cells are the
+bins themselves at those zoom levels; deeper grids are binned from the users in the
+tile with NumPy. Grids are cached per tile and tile generation (see users.tiles),
+and the cached grids around a user that moved are adjusted in place rather than
+dropped. Concurrent adjustments can race and lose an update; the cache timeout
+bounds how long such a drift can last.
+"""
+
+import math
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .clusters import CLUSTER_CELL_SHIFT, CLUSTER_MAX_ZOOM
+from .geo import (
+    MAX_LATITUDE,
+    MAX_LONGITUDE,
+    MAX_MERCATOR_LATITUDE,
+    MAX_ZOOM,
+    MIN_LATITUDE,
+    MIN_LONGITUDE,
+    bbox_q,
+    tile_bounds,
+)
+from .models import MapCluster, float_coordinates
+from .tiles import tiles_generation
+
+User = get_user_model()
+
+# Bins at zoom z are tiles at zoom z + HEATMAP_GRID_SHIFT, i.e. 4x4 pixels
+HEATMAP_GRID_SHIFT = 6
+HEATMAP_GRID_SIZE = 1 << HEATMAP_GRID_SHIFT
+# Deepest zoom level whose bins are cluster cells, see users.clusters
+HEATMAP_CLUSTER_MAX_ZOOM = CLUSTER_MAX_ZOOM + CLUSTER_CELL_SHIFT - HEATMAP_GRID_SHIFT
+HEATMAP_CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(generation, z, x, y):
+    return f"users:heatmap:{generation}:{z}:{x}:{y}"
+
+
+def _bins(latitudes, longitudes, zoom):
+    """
+    Vectorized `tile_xy`: return the x and y indexes of the tiles containing arrays of points.
+    The zoom may be an array too, to place one point on several zoom levels at once.
+    """
+    n = np.exp2(zoom)
+    latitudes = np.radians(np.clip(latitudes, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    x = (np.asarray(longitudes, dtype=float) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(latitudes)) / math.pi) / 2.0 * n
+    last = n - 1
+    return np.clip(np.floor(x), 0, last).astype(np.int64), np.clip(np.floor(y), 0, last).astype(np.int64)
+
+
+def _cluster_grid(z, x, y):
+    size = HEATMAP_GRID_SIZE
+    cells = MapCluster.objects.filter(
+        zoom=z + HEATMAP_GRID_SHIFT - CLUSTER_CELL_SHIFT,
+        cell_x__gte=x * size,
+        cell_x__lt=(x + 1) * size,
+        cell_y__gte=y * size,
+        cell_y__lt=(y + 1) * size,
+    )
+    rows = np.array(cells.values_list("cell_x", "cell_y", "count"), dtype=np.int64).reshape(-1, 3)
+    index = (rows[:, 1] - y * size) * size + rows[:, 0] - x * size
+    return np.bincount(index, weights=rows[:, 2], minlength=size * size)
+
+
+def _user_grid(z, x, y):
+    size = HEATMAP_GRID_SIZE
+    # Query one bin beyond the tile edges, so points the bbox filter and the binning
+    # disagree about are not lost; the binning decides which tile they are in
+    margin = 1 / size
+    _, west, north, _ = tile_bounds(x - margin, y - margin, z)
+    south, _, _, east = tile_bounds(x + margin, y + margin, z)
+    if y == 0:
+        north = MAX_LATITUDE
+    if y == (1 << z) - 1:
+        south = MIN_LATITUDE
+    bbox = (south, max(west, MIN_LONGITUDE), north, min(east, MAX_LONGITUDE))
+    rows = User.objects.filter(bbox_q(*bbox)).values_list(*float_coordinates())
+    points = np.array(rows, dtype=float).reshape(-1, 2)
+
+    bin_x, bin_y = _bins(points[:, 0], points[:, 1], z + HEATMAP_GRID_SHIFT)
+    inside = (bin_x >> HEATMAP_GRID_SHIFT == x) & (bin_y >> HEATMAP_GRID_SHIFT == y)
+    index = (bin_y[inside] & (size - 1)) * size + (bin_x[inside] & (size - 1))
+    return np.bincount(index, minlength=size * size)
+
+
+def render_heatmap(z, x, y):
+    """
+    Count the users in every bin of tile z/x/y from the database.
+    Return the counts as a flat uint32 array, row by row from the north-west corner.
+    """
+    if z <= HEATMAP_CLUSTER_MAX_ZOOM:
+        grid = _cluster_grid(z, x, y)
+    else:
+        grid = _user_grid(z, x, y)
+    return grid.astype(np.uint32)
+
+
+def get_heatmap(z, x, y):
+    """
+    Return the bin counts of tile z/x/y, from the cache when possible.
+    """
+    key = _cache_key(tiles_generation(), z, x, y)
+    grid = cache.get(key)
+    if grid is None:
+        grid = render_heatmap(z, x, y).tobytes()
+        cache.set(key, grid, HEATMAP_CACHE_TIMEOUT)
+    return np.frombuffer(grid, dtype=np.uint32)
+
+
+def sparse_heatmap(grid):
+    """
+    Return the JSON-ready form of a grid: its size and the indexes and counts of its non-empty bins.
+    """
+    cells = np.flatnonzero(grid)
+    return {
+        "size": HEATMAP_GRID_SIZE,
+        "cells": cells.tolist(),
+        "counts": grid[cells].tolist(),
+        "max": int(grid.max(initial=0)),
+    }
+
+
+def update_heatmaps(old, new):
+    """
+    Move a user's map point from old to new in the cached heatmap grids, on every zoom level,
+    once the current transaction commits, so a rolled-back save leaves the grids alone.
+    Both are (latitude, longitude, username) tuples or None. Grids that are not cached are left alone.
+    """
+    transaction.on_commit(lambda: _apply_heatmap_deltas(old, new))
+
+
+def _apply_heatmap_deltas(old, new):
+    size = HEATMAP_GRID_SIZE
+    zooms = np.arange(MAX_ZOOM + 1)
+    generation = tiles_generation()
+    deltas = {}
+    for point, sign in ((old, -1), (new, 1)):
+        if point is None:
+            continue
+        bin_x, bin_y = _bins(point[0], point[1], zooms + HEATMAP_GRID_SHIFT)
+        for z, bx, by in zip(zooms.tolist(), bin_x.tolist(), bin_y.tolist()):
+            key = _cache_key(generation, z, bx >> HEATMAP_GRID_SHIFT, by >> HEATMAP_GRID_SHIFT)
+            index = (by & (size - 1)) * size + (bx & (size - 1))
+            grid_deltas = deltas.setdefault(key, {})
+            grid_deltas[index] = grid_deltas.get(index, 0) + sign
+
+    updated = {}
+    for key, grid in cache.get_many(deltas).items():
+        changes = {index: delta for index, delta in deltas[key].items() if delta}
+        if not changes:
+            continue
+        counts = np.frombuffer(grid, dtype=np.uint32).astype(np.int64)
+        np.add.at(counts, list(changes), list(changes.values()))
+        updated[key] = np.clip(counts, 0, None).astype(np.uint32).tobytes()
+    if updated:
+        cache.set_many(updated, HEATMAP_CACHE_TIMEOUT)
@@ -0,0 +1,221 @@
+"""
+Bulk creation of users from CSV or JSONL files, used by "manage.py import_users".
+
+Records are streamed from the file and handled in chunks: each chunk is validated
+with one query for existing usernames and one for existing emails, its passwords are
+hashed across a process pool, and its users are inserted with one `bulk_create`.
+"""
+
+import contextlib
+import csv
+import io
+import json
+import sys
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from phonenumber_field.phonenumber import to_python as to_phone_number
+
+from .geo import MAX_LATITUDE, MAX_LONGITUDE, MIN_LATITUDE, MIN_LONGITUDE, format_positions_batch
+
+User = get_user_model()
+
+
+def _open(path, encoding):
+    if path == "-":
+        return contextlib.nullcontext(io.TextIOWrapper(sys.stdin.buffer, encoding=encoding, newline=""))
+    return open(path, newline="", encoding=encoding)
+
+
+def read_records(path, input_format):
+    """
+    Yield (line number, record dict) for every record of a CSV file with a header row
+    or of a JSONL file with one object per line, or of standard input when path is "-".
+    A JSONL line that is not a JSON object yields None as its record.
+    """
+    if input_format == "csv":
+        with _open(path, "utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        return
+
+    with _open(path, "utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+
+def _text(record, field):
+    value = record.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def _coordinate(value, low, high, name, errors):
+    if value == "":
+        return None
+    try:
+        coordinate = Decimal(value).quantize(Decimal("0.000001"))
+    except InvalidOperation:
+        errors.append(f"{name} is not a number.")
+        return None
+    if not coordinate.is_finite():
+        # NaN cannot be compared with the bounds
+        errors.append(f"{name} must be a finite number.")
+        return None
+    if not low <= coordinate <= high:
+        errors.append(f"{name} must be between {low} and {high}.")
+    return coordinate
+
+
+def _build_user(record, errors):
+    """
+    Validate one record and return the unsaved User and its plain password, or None.
+    """
+    username = _text(record, "username")
+    if not username:
+        errors.append("username is required.")
+    else:
+        try:
+            User.username_validator(username)
+        except ValidationError as exc:
+            errors.extend(exc.messages)
+        if len(username) > User._meta.get_field("username").max_length:
+            errors.append("username is too long.")
+
+    email = _text(record, "email")
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors.append(f"{email!r} is not a valid email address.")
+
+    phone_number = _text(record, "phone_number")
+    if phone_number:
+        parsed = to_phone_number(phone_number, region=settings.PHONENUMBER_DEFAULT_REGION)
+        if not parsed or not parsed.is_valid():
+            errors.append(f"{phone_number!r} is not a valid phone number.")
+        phone_number = parsed
+
+    latitude = _coordinate(_text(record, "latitude"), MIN_LATITUDE, MAX_LATITUDE, "latitude", errors)
+    longitude = _coordinate(_text(record, "longitude"), MIN_LONGITUDE, MAX_LONGITUDE, "longitude", errors)
+    if (latitude is None) != (longitude is None) and not errors:
+        errors.append("latitude and longitude must be given together.")
+
+    password_hash = _text(record, "password_hash")
+    if password_hash and not password_hash.startswith(UNUSABLE_PASSWORD_PREFIX):
+        try:
+            identify_hasher(password_hash)
+        except ValueError:
+            errors.append("password_hash is not a hash of a known algorithm.")
+
+    if errors:
+        return None
+    user = User(
+        username=username,
+        email=email,
+        first_name=_text(record, "first_name"),
+        last_name=_text(record, "last_name"),
+        phone_number=phone_number,
+        address=_text(record, "address"),
+        latitude=latitude,
+        longitude=longitude,
+        password=password_hash,
+    )
+    return user, _text(record, "password")
+
+
+def validate_chunk(records):
+    """
+    Validate a chunk of (line number, record) pairs.
+    Return (users, skipped, rejects): the (user, plain password) pairs to create, the
+    number of records whose username already exists (e.g. created by an earlier,
+    interrupted run) and the (line number, errors) of the invalid records.
+    """
+    built, rejects = [], []
+    for line_number, record in records:
+        errors = []
+        if record is None:
+            errors.append("Not a JSON object.")
+        else:
+            result = _build_user(record, errors)
+        if errors:
+            rejects.append((line_number, errors))
+        else:
+            built.append((line_number, result))
+
+    usernames = [user.username for _, (user, _) in built]
+    emails = [user.email.lower() for _, (user, _) in built if user.email]
+    existing_usernames = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+    # Emails are unique regardless of case, see the constraint on User; excluding blank
+    # emails matches the condition of its partial index, so the lookup can use it
+    existing_emails = set(
+        User.objects.exclude(email="")
+        .annotate(email_lower=Lower("email"))
+        .filter(email_lower__in=emails)
+        .values_list("email_lower", flat=True)
+    )
+
+    users, skipped, seen_usernames, seen_emails = [], 0, set(), set()
+    for line_number, (user, password) in built:
+        if user.username in existing_usernames:
+            skipped += 1
+        elif user.username in seen_usernames:
+            rejects.append((line_number, [f"Duplicate username {user.username!r} in the input."]))
+        elif user.email and (user.email.lower() in existing_emails or user.email.lower() in seen_emails):
+            rejects.append((line_number, [f"The email {user.email!r} is already in use."]))
+        else:
+            seen_usernames.add(user.username)
+            if user.email:
+                seen_emails.add(user.email.lower())
+            users.append((user, password))
+    return users, skipped, rejects
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """
+    Return the hashes of a list of plain passwords, computed across the executor's
+    `workers` processes when one is given. Empty passwords give an unusable password.
+    """
+    to_hash = [i for i, password in enumerate(passwords) if password]
+    hashes = [make_password(None) for _ in passwords]
+    if executor is None:
+        results = map(make_password, (passwords[i] for i in to_hash))
+    else:
+        chunksize = max(1, len(to_hash) // (workers * 4))
+        results = executor.map(make_password, [passwords[i] for i in to_hash], chunksize=chunksize)
+    for i, password_hash in zip(to_hash, results):
+        hashes[i] = password_hash
+    return hashes
+
+
+def create_users(users, executor=None, workers=1):
+    """
+    Hash the passwords of (unsaved user, plain password) pairs, in the executor's
+    `workers` processes when one is given, and insert the users.
+    Users with a password_hash keep it. Return the created users.
+    """
+    hashes = hash_passwords([password if not user.password else "" for user, password in users], executor, workers)
+    located = [user for user, _ in users if user.latitude is not None]
+    positions = dict(
+        zip(map(id, located), format_positions_batch([u.latitude for u in located], [u.longitude for u in located]))
+    )
+    objs = []
+    for (user, password), password_hash in zip(users, hashes):
+        if not user.password:
+            user.password = password_hash
+        user.update_location_fields(position_dms=positions.get(id(user)))
+        objs.append(user)
+    with transaction.atomic():
+        return User.objects.bulk_create(objs)
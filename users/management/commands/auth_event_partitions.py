@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.partitions import (
+    archive_partition,
+    ensure_partitions,
+    expired_partitions,
+    is_partitioned,
+    partition_name,
+    split_default_partition,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly partitions of the auth event table: create the partitions of the coming "
+        "months, move stray rows out of the default partition, and archive expired months to gzip-compressed "
+        "JSONL files before dropping their partitions. Meant to run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.AUTH_EVENT_PARTITION_MONTHS_AHEAD,
+            help="Number of future months to create partitions for.",
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            default=settings.AUTH_EVENT_RETENTION_MONTHS,
+            help="Number of past months, besides the current one, kept in the database.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.AUTH_EVENT_ARCHIVE_DIR,
+            help="Directory the archives of expired months are written to.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report the partitions that would be archived.")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("The auth event table is not partitioned; partitioning requires PostgreSQL.")
+        if options["months_ahead"] < 0 or options["retention_months"] < 0:
+            raise CommandError("--months-ahead and --retention-months must not be negative.")
+
+        expired = expired_partitions(options["retention_months"])
+        if options["dry_run"]:
+            for month in expired:
+                self.stdout.write(f"Would archive {partition_name(month)}.")
+            return
+
+        for month in split_default_partition() + ensure_partitions(options["months_ahead"]):
+            self.stdout.write(f"Created {partition_name(month)}.")
+        # Months just split out of the default partition may have expired too
+        for month in expired_partitions(options["retention_months"]):
+            path, count = archive_partition(month, options["archive_dir"])
+            self.stdout.write(f"Archived {count} events of {partition_name(month)} to {path} and dropped it.")
+        self.stdout.write(self.style.SUCCESS("Auth event partitions are up to date."))
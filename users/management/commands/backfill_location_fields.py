@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from users.geo import format_positions_batch
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the fields derived from latitude/longitude (geohash, DMS position and float copies) for all users. "
+        "Needed after users were written without going through User.save, e.g. with QuerySet.update()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Number of users updated per query.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        users = User.objects.only("latitude", "longitude").order_by("pk")
+        last_pk, total = 0, 0
+        while batch := list(users.filter(pk__gt=last_pk)[:batch_size]):
+            located = [user for user in batch if user.latitude is not None and user.longitude is not None]
+            positions = format_positions_batch([u.latitude for u in located], [u.longitude for u in located])
+            positions = dict(zip((u.pk for u in located), positions))
+            for user in batch:
+                user.update_location_fields(position_dms=positions.get(user.pk))
+            User.objects.bulk_update(batch, User.LOCATION_DERIVED_FIELDS)
+            last_pk = batch[-1].pk
+            total += len(batch)
+            self.stdout.write(f"Updated {total} users...")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled location fields for {total} users."))
@@ -0,0 +1,51 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.geo import format_position, format_positions_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the scalar DMS formatting (User.to_dms per coordinate) with the vectorized "
+        "users.geo.format_positions_batch on random coordinates. Does not touch the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100000, help="Number of coordinate pairs to format.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation; the best one counts.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def _best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    def handle(self, *args, **options):
+        count, repeat = options["count"], options["repeat"]
+        if count < 1 or repeat < 1:
+            raise CommandError("--count and --repeat must be positive.")
+
+        rng = random.Random(options["seed"])
+        micro = Decimal("0.000001")
+        # Coordinates as stored: Decimals with six decimal places, and their float copies
+        latitudes = [Decimal(rng.randint(-90_000_000, 90_000_000)) * micro for _ in range(count)]
+        longitudes = [Decimal(rng.randint(-180_000_000, 180_000_000)) * micro for _ in range(count)]
+        latitude_floats, longitude_floats = [float(v) for v in latitudes], [float(v) for v in longitudes]
+
+        scalar_time, expected = self._best_of(
+            repeat, lambda: [format_position(lat, lon) for lat, lon in zip(latitudes, longitudes)]
+        )
+        batch_time, result = self._best_of(repeat, lambda: format_positions_batch(latitude_floats, longitude_floats))
+        if result != expected:
+            mismatches = sum(a != b for a, b in zip(result, expected))
+            raise CommandError(f"The batch formatter disagrees with the scalar one on {mismatches} positions.")
+
+        self.stdout.write(f"Scalar: {scalar_time:.3f}s ({count / scalar_time:,.0f} positions/s)")
+        self.stdout.write(f"Batch:  {batch_time:.3f}s ({count / batch_time:,.0f} positions/s)")
+        self.stdout.write(self.style.SUCCESS(f"Batch formatting is {scalar_time / batch_time:.1f}x faster."))
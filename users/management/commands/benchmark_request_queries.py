@@ -0,0 +1,62 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+User = get_user_model()
+
+# Settings of the request path without the session and user caches, as with the local
+# memory cache, and with them, as with a shared cache (see CACHE_SHARED in settings.py)
+UNCACHED_SETTINGS = {"SESSION_ENGINE": "django.contrib.sessions.backends.db", "AUTH_USER_CACHE_TIMEOUT": 0}
+CACHED_SETTINGS = {"SESSION_ENGINE": "django.contrib.sessions.backends.cached_db", "AUTH_USER_CACHE_TIMEOUT": 300}
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the queries and time per request of location_view and profile_view for a logged-in user, "
+        "with the sessions and users loaded from the database and from the cache. Runs in a transaction "
+        "that is rolled back, so the database is left as it was."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per view and configuration.")
+
+    def _measure(self, url, requests):
+        client = Client()
+        client.force_login(self.user)
+        client.get(url)  # Warm up the caches and the template loader
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = client.get(url)
+            elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise CommandError(f"{url} answered with a {response.status_code}.")
+        return len(queries) / requests, elapsed / requests * 1000
+
+    def handle(self, *args, **options):
+        requests = options["requests"]
+        if requests < 1:
+            raise CommandError("--requests must be positive.")
+
+        pages = [("location_view", reverse("location")), ("profile_view", reverse("profile"))]
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]), transaction.atomic():
+            self.user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+            for view, url in pages:
+                with override_settings(**UNCACHED_SETTINGS):
+                    uncached_queries, uncached_ms = self._measure(url, requests)
+                with override_settings(**CACHED_SETTINGS):
+                    cached_queries, cached_ms = self._measure(url, requests)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{view}: {uncached_queries:.1f} -> {cached_queries:.1f} queries/request, "
+                        f"{uncached_ms:.2f} -> {cached_ms:.2f} ms/request"
+                    )
+                )
+            transaction.set_rollback(True)
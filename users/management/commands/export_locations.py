@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from users.export import EXPORT_FORMATS, export_chunks, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = "Export the location of every user with coordinates as GeoJSON or NDJSON, streamed in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help='File to write the export to, or "-" for standard output.')
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="geojson", dest="export_format")
+        parser.add_argument("--gzip", action="store_true", help="Compress the export with gzip.")
+
+    def handle(self, *args, **options):
+        chunks = export_chunks(options["export_format"])
+        if options["gzip"]:
+            chunks = gzip_chunks(chunks)
+
+        if options["output"] == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options["output"], "wb") as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}."))
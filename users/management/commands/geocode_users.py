@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from users.backends import invalidate_cached_users
+from users.gazetteer import normalize_address
+from users.geo import format_positions_batch
+from users.geocoding import geocode_normalized, get_gazetteer
+from users.signals import map_data_reloaded
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Set the coordinates of the users with an address but no coordinates from the local gazetteer "
+        "(settings.GEOCODER_GAZETTEER), without any network access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Number of users geocoded per batch.")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(), help="Number of processes matching addresses."
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["workers"] < 1:
+            raise CommandError("--batch-size and --workers must be positive.")
+        if get_gazetteer() is None:
+            raise CommandError(f"No gazetteer at {settings.GEOCODER_GAZETTEER}.")
+
+        users = User.objects.exclude(address="").filter(latitude=None, longitude=None).only("address").order_by("pk")
+        executor = None
+        if options["workers"] > 1:
+            executor = ProcessPoolExecutor(options["workers"], mp_context=multiprocessing.get_context("spawn"))
+        last_pk, located, total = 0, 0, 0
+        started = time.monotonic()
+        try:
+            while batch := list(users.filter(pk__gt=last_pk)[: options["batch_size"]]):
+                last_pk = batch[-1].pk
+                total += len(batch)
+                addresses = {user.pk: normalize_address(user.address) for user in batch}
+                positions = geocode_normalized(addresses.values(), executor)
+                found = [user for user in batch if positions.get(addresses[user.pk])]
+                for user in found:
+                    user.latitude, user.longitude = positions[addresses[user.pk]]
+                dms = format_positions_batch([u.latitude for u in found], [u.longitude for u in found])
+                now = timezone.now()
+                for user, position_dms in zip(found, dms):
+                    user.update_location_fields(position_dms=position_dms)
+                    # bulk_update skips auto_now, and the profile pages' ETag depends on it
+                    user.updated_at = now
+                User.objects.bulk_update(found, ["latitude", "longitude", "updated_at", *User.LOCATION_DERIVED_FIELDS])
+                invalidate_cached_users([user.pk for user in found])
+                located += len(found)
+                self.stdout.write(
+                    f"Geocoded {located} of {total} users ({total / max(time.monotonic() - started, 1e-6):.0f} users/s)."
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            # bulk_update bypasses the save signals that keep the map up to date
+            if located:
+                map_data_reloaded()
+
+        self.stdout.write(self.style.SUCCESS(f"Located {located} of {total} users with an address."))
@@ -0,0 +1,92 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.hashing import init_worker
+from users.importer import create_users, read_records, validate_chunk
+from users.signals import map_data_reloaded
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users in bulk from a CSV file with a header row or a JSONL file, hashing their passwords across "
+        "a process pool. Users whose username already exists are skipped, so an interrupted import can be rerun "
+        "on the same file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='File to import, or "-" for standard input.')
+        parser.add_argument(
+            "--format", choices=["csv", "jsonl"], dest="input_format", help="Defaults to the extension."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of records created per transaction.")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(), help="Number of processes hashing passwords."
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording how many records were processed; a rerun with it starts after them.",
+        )
+
+    def handle(self, *args, **options):
+        path, input_format = options["path"], options["input_format"]
+        if input_format is None:
+            if path.endswith(".csv"):
+                input_format = "csv"
+            elif path.endswith((".jsonl", ".ndjson")):
+                input_format = "jsonl"
+            else:
+                raise CommandError("Cannot tell the format from the file name, use --format.")
+        if options["batch_size"] < 1 or options["workers"] < 1:
+            raise CommandError("--batch-size and --workers must be positive.")
+
+        checkpoint = options["checkpoint"]
+        done = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = int(f.read().strip() or 0)
+            self.stdout.write(f"Resuming after {done} records.")
+
+        records = itertools.islice(read_records(path, input_format), done, None)
+        executor = None
+        if options["workers"] > 1:
+            # "spawn" rather than fork: the workers must not share the parent's database connection
+            executor = ProcessPoolExecutor(
+                options["workers"], mp_context=multiprocessing.get_context("spawn"), initializer=init_worker
+            )
+        created = skipped = rejected = 0
+        located = False
+        started = time.monotonic()
+        try:
+            while chunk := list(itertools.islice(records, options["batch_size"])):
+                users, chunk_skipped, rejects = validate_chunk(chunk)
+                for line_number, errors in rejects:
+                    self.stderr.write(f"Line {line_number}: {' '.join(errors)}")
+                new_users = create_users(users, executor, options["workers"])
+                located = located or any(user.latitude is not None for user in new_users)
+                created += len(new_users)
+                skipped += chunk_skipped
+                rejected += len(rejects)
+                done += len(chunk)
+                if checkpoint:
+                    with open(checkpoint, "w") as f:
+                        f.write(str(done))
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"Processed {done} records: {created} created, {skipped} skipped, {rejected} rejected "
+                    f"({(created + skipped + rejected) / max(elapsed, 1e-6):.0f} records/s)."
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            # Bulk-created users bypass the save signals that keep the map up to date
+            if located:
+                map_data_reloaded()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {created} users ({skipped} already existed, {rejected} rejected).")
+        )
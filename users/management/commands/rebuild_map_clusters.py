@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from users.clusters import rebuild_clusters
+from users.models import MapCluster
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed user map clusters from the user table."
+
+    def handle(self, *args, **options):
+        rebuild_clusters()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {MapCluster.objects.count()} map clusters."))
@@ -0,0 +1,111 @@
+"""
+Versioned cache of the JSON payloads served to the user map.
+
+All payloads are keyed by a global "locations version" that is bumped whenever a
+user's map point changes, so a changed location invalidates every payload at once
+without having to know which ones it appeared in. Payloads are stored already
+serialized and gzip-compressed, so a cache hit costs no Python work beyond the lookup.
+The version also makes a strong ETag, so a client revalidating an unchanged payload
+gets a 304 after nothing more than the version lookup.
+"""
+
+import gzip
+import hashlib
+import json
+import re
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+LOCATIONS_VERSION_KEY = "users:locations:version"
+SNAPSHOT_TIMEOUT = 60 * 60
+# Payloads smaller than this are not worth compressing
+MIN_COMPRESS_LENGTH = 200
+
+_gzip_token = re.compile(r"\bgzip\b")
+
+
+def accepts_gzip(request):
+    """
+    Return whether the client accepts gzip-encoded responses.
+    """
+    return bool(_gzip_token.search(request.headers.get("Accept-Encoding", "")))
+
+
+def get_locations_version():
+    """
+    Return the current locations version.
+    """
+    version = cache.get(LOCATIONS_VERSION_KEY)
+    if version is None:
+        # Seed from the clock, so a version lost to a cache restart or eviction
+        # never comes back to a value an older snapshot was stored under
+        cache.add(LOCATIONS_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(LOCATIONS_VERSION_KEY)
+    return version
+
+
+def _bump():
+    try:
+        cache.incr(LOCATIONS_VERSION_KEY)
+    except ValueError:
+        cache.set(LOCATIONS_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_locations_version():
+    """
+    Invalidate every cached map payload, now and again once the current transaction
+    commits, so a payload built from the old rows in between is not served under
+    the new version.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _digest(key_parts):
+    return hashlib.md5(repr(key_parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _finalize(response, etag):
+    response.headers["ETag"] = etag
+    # Browsers may keep the payload but must revalidate it, and shared caches must not store it
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def cached_json_response(request, key_parts, build_payload):
+    """
+    Return a JSON response for the payload identified by key_parts.
+    The payload is built by calling build_payload() on a cache miss and stored,
+    serialized and compressed, under the current locations version. The compressed
+    body is sent to clients that accept gzip.
+    The ETag is derived from the version and key_parts alone, so a request whose
+    If-None-Match still matches is answered with a 304 before the snapshot is read.
+    """
+    version, digest = get_locations_version(), _digest(key_parts)
+    wants_gzip = accepts_gzip(request)
+    # Each representation needs its own strong ETag
+    etag = f'"{version}-{digest}{"-gzip" if wants_gzip else ""}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _finalize(not_modified, etag)
+
+    key = f"users:locations:snapshot:{version}:{digest}"
+    snapshot = cache.get(key)
+    if snapshot is None:
+        body = json.dumps(build_payload(), separators=(",", ":")).encode()
+        compressed = gzip.compress(body, compresslevel=6) if len(body) >= MIN_COMPRESS_LENGTH else None
+        snapshot = (body, compressed)
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+
+    body, compressed = snapshot
+    if compressed is not None and wants_gzip:
+        response = HttpResponse(compressed, content_type="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    return _finalize(response, etag)
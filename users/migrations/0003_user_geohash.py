@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+from users.geo import encode_geohash
+
+BATCH_SIZE = 2000
+
+
+def backfill_geohash(apps, schema_editor):
+    """
+    Fill the geohash of existing users, BATCH_SIZE rows at a time.
+    """
+    User = apps.get_model("users", "User")
+    users = User.objects.exclude(latitude=None).exclude(longitude=None).only("latitude", "longitude").order_by("pk")
+    last_pk = 0
+    while batch := list(users.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        for user in batch:
+            user.geohash = encode_geohash(user.latitude, user.longitude)
+        User.objects.bulk_update(batch, ["geohash"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_mapcluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
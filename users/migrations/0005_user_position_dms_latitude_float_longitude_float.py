@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:15
+
+from django.db import migrations, models
+
+from users.geo import format_position
+
+BATCH_SIZE = 2000
+
+
+def backfill_location_copies(apps, schema_editor):
+    """
+    Fill the DMS position and float coordinates of existing users, BATCH_SIZE rows at a time.
+    """
+    User = apps.get_model("users", "User")
+    users = User.objects.exclude(latitude=None).exclude(longitude=None).only("latitude", "longitude").order_by("pk")
+    last_pk = 0
+    while batch := list(users.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        for user in batch:
+            user.position_dms = format_position(user.latitude, user.longitude)
+            user.latitude_float, user.longitude_float = float(user.latitude), float(user.longitude)
+        User.objects.bulk_update(batch, ["position_dms", "latitude_float", "longitude_float"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='latitude_float',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='longitude_float',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='position_dms',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(backfill_location_copies, migrations.RunPython.noop),
+    ]
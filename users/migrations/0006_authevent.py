@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+# The messages the login/logout signal receivers used to write to the admin log
+AUTH_MESSAGES = {
+    "User logged in via admin site.": ("login", "admin"),
+    "User logged in via site.": ("login", "site"),
+    "User logged out via admin site.": ("logout", "admin"),
+    "User logged out via site.": ("logout", "site"),
+}
+
+
+def backfill_auth_events(apps, schema_editor):
+    """
+    Copy the login/logout entries of the admin log into AuthEvent, BATCH_SIZE rows at a time.
+    The entries are matched on their exact messages; their IP address was never recorded.
+    """
+    LogEntry = apps.get_model("admin", "LogEntry")
+    AuthEvent = apps.get_model("users", "AuthEvent")
+    entries = LogEntry.objects.filter(content_type=None, change_message__in=AUTH_MESSAGES).order_by("pk")
+    entries = entries.values_list("pk", "user_id", "action_time", "change_message")
+    last_pk = 0
+    while batch := list(entries.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        AuthEvent.objects.bulk_create(
+            AuthEvent(
+                user_id=user_id,
+                event_type=AUTH_MESSAGES[message][0],
+                channel=AUTH_MESSAGES[message][1],
+                timestamp=action_time,
+            )
+            for _, user_id, action_time, message in batch
+        )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin', '0003_logentry_add_action_flag_choices'),
+        ('users', '0005_user_position_dms_latitude_float_longitude_float'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('login', 'Login'), ('logout', 'Logout')], max_length=6)),
+                ('channel', models.CharField(choices=[('admin', 'Admin site'), ('site', 'Site')], max_length=5)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='auth_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['event_type', 'timestamp'], name='users_authevent_type_time'), models.Index(fields=['user', 'timestamp'], name='users_authevent_user_time')],
+            },
+        ),
+        migrations.RunPython(backfill_auth_events, migrations.RunPython.noop),
+    ]
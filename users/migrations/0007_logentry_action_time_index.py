@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index django_admin_log.action_time, which backs the date drill-down and the default
+    ordering of the "Log entries" admin. The table belongs to django.contrib.admin, so
+    the index is created with SQL; CONCURRENTLY keeps the log writable while it builds.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('admin', '0003_logentry_add_action_flag_choices'),
+        ('users', '0006_authevent'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "users_logentry_action_time_idx" ON "django_admin_log" ("action_time");',
+            'DROP INDEX CONCURRENTLY IF EXISTS "users_logentry_action_time_idx";',
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:40
+
+import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+# Monthly partitions created ahead of time; "manage.py auth_event_partitions" keeps extending them
+MONTHS_AHEAD = 3
+
+COLUMNS = """
+    "id" bigint GENERATED BY DEFAULT AS IDENTITY,
+    "event_type" varchar(6) NOT NULL,
+    "channel" varchar(5) NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    "ip_address" inet NULL,
+    "user_id" bigint NOT NULL
+"""
+COLUMN_NAMES = '"id", "user_id", "event_type", "channel", "timestamp", "ip_address"'
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _rebuild(schema_editor, user_table, old_name, create_sql, after_create=()):
+    """
+    Rename users_authevent out of the way, create its replacement with create_sql,
+    run the after_create statements, then copy the rows over and drop the old table.
+    """
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence('\"users_authevent\"', 'id')")
+        sequence = cursor.fetchone()[0]
+    # Index and sequence names are unique per schema, so the old ones are renamed too
+    execute(f'ALTER TABLE "users_authevent" RENAME TO "{old_name}"')
+    execute(f'ALTER TABLE "{old_name}" RENAME CONSTRAINT "users_authevent_pkey" TO "{old_name}_pkey"')
+    execute(f'ALTER SEQUENCE {sequence} RENAME TO "{old_name}_id_seq"')
+    for index in ("type_time", "user_time"):
+        execute(f'ALTER INDEX "users_authevent_{index}" RENAME TO "{old_name}_{index}"')
+    execute(create_sql)
+    execute(
+        'ALTER TABLE "users_authevent" ADD CONSTRAINT "users_authevent_user_id_fk" '
+        f'FOREIGN KEY ("user_id") REFERENCES "{user_table}" ("id") DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute('CREATE INDEX "users_authevent_type_time" ON "users_authevent" ("event_type", "timestamp")')
+    execute('CREATE INDEX "users_authevent_user_time" ON "users_authevent" ("user_id", "timestamp")')
+    for statement, params in after_create:
+        execute(statement, params)
+    execute(f'INSERT INTO "users_authevent" ({COLUMN_NAMES}) SELECT {COLUMN_NAMES} FROM "{old_name}"')
+    execute(
+        "SELECT setval(pg_get_serial_sequence('\"users_authevent\"', 'id'), "
+        'COALESCE((SELECT max("id") FROM "users_authevent"), 0) + 1, false)'
+    )
+    execute(f'DROP TABLE "{old_name}" CASCADE')
+
+
+def partition_auth_events(apps, schema_editor):
+    """
+    Turn users_authevent into a table partitioned by month of timestamp, with a
+    partition for every month holding events up to MONTHS_AHEAD months from now and
+    a default partition. Declarative partitioning is PostgreSQL only; on other
+    databases the table is left as it is.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    user_table = apps.get_model("users", "User")._meta.db_table
+    AuthEvent = apps.get_model("users", "AuthEvent")
+
+    today = timezone.localdate()
+    oldest = AuthEvent.objects.order_by("timestamp").values_list("timestamp", flat=True).first()
+    month = (timezone.localtime(oldest).date() if oldest else today).replace(day=1)
+    last = _add_months(today.replace(day=1), MONTHS_AHEAD)
+    tz = timezone.get_current_timezone()
+    partitions = [('CREATE TABLE "users_authevent_default" PARTITION OF "users_authevent" DEFAULT', None)]
+    while month <= last:
+        start = datetime.datetime.combine(month, datetime.time(), tzinfo=tz)
+        end = datetime.datetime.combine(_add_months(month, 1), datetime.time(), tzinfo=tz)
+        partitions.append(
+            (
+                f'CREATE TABLE "users_authevent_p{month:%Y%m}" PARTITION OF "users_authevent" '
+                "FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+        )
+        month = _add_months(month, 1)
+
+    # The partition key has to be part of the primary key
+    _rebuild(
+        schema_editor,
+        user_table,
+        "users_authevent_unpartitioned",
+        f'CREATE TABLE "users_authevent" ({COLUMNS}, PRIMARY KEY ("id", "timestamp")) PARTITION BY RANGE ("timestamp")',
+        partitions,
+    )
+
+
+def unpartition_auth_events(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    user_table = apps.get_model("users", "User")._meta.db_table
+    _rebuild(
+        schema_editor,
+        user_table,
+        "users_authevent_partitioned",
+        f'CREATE TABLE "users_authevent" ({COLUMNS}, PRIMARY KEY ("id"))',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_logentry_action_time_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_auth_events, unpartition_auth_events),
+    ]
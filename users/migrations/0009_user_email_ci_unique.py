@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:10
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Conflicting emails listed in the error before giving up
+MAX_REPORTED_CONFLICTS = 50
+
+
+def check_email_conflicts(apps, schema_editor):
+    """
+    Refuse to add the unique index while users share an email regardless of case, and
+    list them, so they can be fixed by hand before the migration is run again.
+    """
+    User = apps.get_model('users', 'User')
+    users = User.objects.exclude(email='').annotate(email_lower=django.db.models.functions.text.Lower('email'))
+    shared = (
+        users.values('email_lower')
+        .annotate(count=models.Count('pk'))
+        .filter(count__gt=1)
+        .order_by('email_lower')
+        .values_list('email_lower', flat=True)
+    )
+    found = {}
+    for pk, email in users.filter(email_lower__in=shared).order_by('email_lower', 'pk').values_list('pk', 'email_lower'):
+        found.setdefault(email, []).append(pk)
+    if found:
+        lines = [
+            f'  {email}: users {", ".join(map(str, pks))}'
+            for email, pks in list(found.items())[:MAX_REPORTED_CONFLICTS]
+        ]
+        if len(found) > MAX_REPORTED_CONFLICTS:
+            lines.append(f'  ... and {len(found) - MAX_REPORTED_CONFLICTS} more')
+        raise RuntimeError(
+            f'{len(found)} emails are shared by several users (ignoring case). '
+            'Give each user a distinct email, or clear it, before migrating:\n' + '\n'.join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_partition_authevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_email_conflicts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower('email'),
+                condition=models.Q(('email', ''), _negated=True),
+                name='users_user_email_ci_unique',
+                violation_error_code='email_in_use',
+                violation_error_message='This email is already in use.',
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:20
+
+from django.db import migrations
+
+# (index, table, column) for every column searched from the admin, see users/search.py
+TRIGRAM_INDEXES = [
+    ('users_user_username_trgm', 'users_user', 'username'),
+    ('users_user_email_trgm', 'users_user', 'email'),
+    ('users_user_phone_number_trgm', 'users_user', 'phone_number'),
+    ('users_logentry_change_message_trgm', 'django_admin_log', 'change_message'),
+    ('users_logentry_object_repr_trgm', 'django_admin_log', 'object_repr'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Install pg_trgm and build the trigram indexes. Databases that cannot have pg_trgm
+    are left as they are and keep Django's own admin search; to add the indexes once
+    pg_trgm is available, migrate back to 0009 and forward again.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote(name)} ON {quote(table)} '
+                f'USING gin ({quote(column)} gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    # The extension is left installed, other schemas may use it
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for name, _, _ in TRIGRAM_INDEXES:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {connection.ops.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+    """
+    Trigram GIN indexes backing the admin search of users and log entries. The log
+    table belongs to django.contrib.admin, so the indexes are created with SQL rather
+    than declared on models; CONCURRENTLY keeps both tables writable while they build.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('admin', '0003_logentry_add_action_flag_choices'),
+        ('users', '0009_user_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,17 +1,171 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.db import models
+from django.db.models.functions import Cast, Coalesce, Lower, Now
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .geo import encode_geohash, format_position, to_dms
+
+EMAIL_IN_USE_MESSAGE = "This email is already in use."
+EMAIL_CONSTRAINT_NAME = "users_user_email_ci_unique"
+
+
+def is_email_conflict(exc):
+    """
+    Return whether an IntegrityError is a violation of the case-insensitive unique email constraint.
+    """
+    diag = getattr(exc.__cause__, "diag", None)
+    return getattr(diag, "constraint_name", None) == EMAIL_CONSTRAINT_NAME
+
+
+def _stored_coordinate(value):
+    """
+    Round a coordinate the way the database rounds it into a six decimal place column.
+    """
+    return Decimal(str(value)).quantize(Decimal("0.000001"), rounding=ROUND_HALF_UP)
+
+
+def float_coordinates():
+    """
+    Return expressions for the (latitude, longitude) of users as floats. They read the
+    denormalized float columns, and fall back to the decimal ones for rows written
+    without User.save, e.g. loaded from fixtures, whose float copies were never filled.
+    """
+    return (
+        Coalesce("latitude_float", Cast("latitude", models.FloatField())),
+        Coalesce("longitude_float", Cast("longitude", models.FloatField())),
+    )
+
 
 class User(AbstractUser):
+    # Fields recomputed from latitude/longitude by update_location_fields()
+    LOCATION_DERIVED_FIELDS = ("geohash", "position_dms", "latitude_float", "longitude_float")
+
     phone_number = PhoneNumberField(max_length=20, blank=True)
     address = models.CharField(max_length=255, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # Spatial index key derived from latitude/longitude on save, see users.geo.bbox_q
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    # Denormalized copies of latitude/longitude maintained on save, so the map payloads
+    # are read straight from the columns without any per-row Python work
+    position_dms = models.CharField(max_length=32, blank=True, editable=False)
+    latitude_float = models.FloatField(blank=True, null=True, editable=False)
+    longitude_float = models.FloatField(blank=True, null=True, editable=False)
+    # Bumped on every save; drives the ETag and Last-Modified headers of the profile pages
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Backed by a unique index on lower(email), which also serves the validation lookup
+            models.UniqueConstraint(
+                Lower("email"),
+                condition=~models.Q(email=""),
+                name=EMAIL_CONSTRAINT_NAME,
+                violation_error_message=EMAIL_IN_USE_MESSAGE,
+                violation_error_code="email_in_use",
+            ),
+        ]
 
     def __str__(self):
         return self.username
 
+    def validate_constraints(self, exclude=None):
+        try:
+            super().validate_constraints(exclude)
+        except ValidationError as exc:
+            # Django reports a violated constraint on an expression as a non-field error,
+            # but a clash on lower(email) belongs to the email field
+            errors = exc.update_error_dict({})
+            others = []
+            for error in errors.pop(NON_FIELD_ERRORS, []):
+                (errors.setdefault("email", []) if error.code == "email_in_use" else others).append(error)
+            if others:
+                errors[NON_FIELD_ERRORS] = others
+            raise ValidationError(errors)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the values loaded from the database so that signal receivers
+        # can tell which fields a save actually changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if settings.GEOCODE_ON_SAVE and self._address_needs_geocoding(update_fields):
+            # Imported here, as users.geocoding imports this module
+            from .geocoding import geocode
+
+            if position := geocode(self.address):
+                self.latitude, self.longitude = position
+                if update_fields is not None:
+                    kwargs["update_fields"] = update_fields = {*update_fields, "latitude", "longitude"}
+        if update_fields is None or {"latitude", "longitude"}.intersection(update_fields):
+            self.update_location_fields()
+            if update_fields is not None:
+                kwargs["update_fields"] = update_fields = {*update_fields, *self.LOCATION_DERIVED_FIELDS}
+        if update_fields:
+            kwargs["update_fields"] = update_fields = {*update_fields, "updated_at"}
+        super().save(*args, **kwargs)
+        if update_fields is None:
+            fields = [f for f in self._meta.concrete_fields if f.attname not in self.get_deferred_fields()]
+        else:
+            fields = [self._meta.get_field(name) for name in update_fields]
+        loaded_values = getattr(self, "_loaded_values", {})
+        loaded_values.update((f.attname, getattr(self, f.attname)) for f in fields)
+        self._loaded_values = loaded_values
+
+    def changed_fields(self, fields=None):
+        """
+        Return the names of the concrete fields, or of those among `fields`, whose value
+        differs from the one last loaded from or saved to the database. Fields whose
+        value is unknown, e.g. all of them on a user that was never saved, count as changed.
+        updated_at is left out, as it changes on every save.
+        """
+        loaded_values = getattr(self, "_loaded_values", {})
+        if fields is None:
+            fields = [f for f in self._meta.concrete_fields if f.attname not in self.get_deferred_fields()]
+        else:
+            # Many-to-many fields, e.g. from a form's field list, are not columns of the user
+            fields = [f for f in map(self._meta.get_field, fields) if f in self._meta.concrete_fields]
+        return frozenset(
+            f.name
+            for f in fields
+            if f.name != "updated_at"
+            and (f.attname not in loaded_values or getattr(self, f.attname) != loaded_values[f.attname])
+        )
+
+    def save_changes(self, fields=None):
+        """
+        Save only the fields (all of them, or those among `fields`) that changed since the
+        user was loaded, and skip the UPDATE altogether when none did. A new user is saved
+        in full. Return the names of the changed fields.
+        """
+        changed = self.changed_fields(fields)
+        if self._state.adding:
+            self.save()
+            return changed
+        if changed:
+            self.save(update_fields=changed)
+        return changed
+
+    def _address_needs_geocoding(self, update_fields):
+        """
+        Return whether the user is being saved with a new address and no coordinates.
+        Coordinates the user entered or shared from the browser are never overwritten.
+        """
+        if not self.address or self.latitude is not None or self.longitude is not None:
+            return False
+        if update_fields is not None and "address" not in update_fields:
+            return False
+        return self.address != getattr(self, "_loaded_values", {}).get("address")
+
     # This should actually be a normal instance method, just wanted to demonstrate that I know the difference
     # def to_dms(self, lat_or_lon="lat"):
     #   if lat_or_lon == "lat":
@@ -25,18 +179,7 @@ class User(AbstractUser):
         """
         Convert a decimal latitude or longitude value to Degrees, Minutes, Seconds (DMS) format.
         """
-        degrees = int(abs(value))
-        minutes_float = (abs(value) - degrees) * 60
-        minutes = int(minutes_float)
-        seconds = round((minutes_float - minutes) * 60)
-
-        direction = ""
-        if lat_or_lon == "lat":
-            direction = "N" if value >= 0 else "S"
-        else:
-            direction = "E" if value >= 0 else "W"
-
-        return f"{degrees}°{minutes}'{seconds}\"{direction}"
+        return to_dms(value, lat_or_lon)
 
     @property
     def position(self):
@@ -48,3 +191,120 @@ class User(AbstractUser):
         lat_dms = self.to_dms(self.latitude)
         lon_dms = self.to_dms(self.longitude, lat_or_lon="lon")
         return f"{lat_dms} {lon_dms}"
+
+    def update_location_fields(self, position_dms=None):
+        """
+        Recompute the fields derived from latitude and longitude.
+        Called on every save; code that writes users with bulk_create or bulk_update
+        must call it itself, and may pass the DMS position already computed for a whole
+        batch with users.geo.format_positions_batch.
+        """
+        if self.latitude is None or self.longitude is None:
+            self.geohash = self.position_dms = ""
+            self.latitude_float = self.longitude_float = None
+        else:
+            # Derive everything from the values as the database will store them, so a user
+            # saved with float coordinates gets the same fields as one loaded back later
+            latitude, longitude = _stored_coordinate(self.latitude), _stored_coordinate(self.longitude)
+            self.geohash = encode_geohash(latitude, longitude)
+            self.position_dms = position_dms if position_dms is not None else format_position(latitude, longitude)
+            self.latitude_float, self.longitude_float = float(latitude), float(longitude)
+
+    @property
+    def map_point(self):
+        """
+        Return the (latitude, longitude, username) shown on the map, or None if coordinates are missing.
+        """
+        if self.latitude is None or self.longitude is None:
+            return None
+        return (float(self.latitude), float(self.longitude), self.username)
+
+    @property
+    def loaded_map_point(self):
+        """
+        Return the map point as it was last loaded from or saved to the database.
+        Return None for a user without saved coordinates, and raise KeyError when
+        the instance was not loaded with the location fields.
+        """
+        latitude, longitude, username = (self._loaded_values[name] for name in ("latitude", "longitude", "username"))
+        if latitude is None or longitude is None:
+            return None
+        return (float(latitude), float(longitude), username)
+
+
+class MapCluster(models.Model):
+    """
+    Precomputed marker cluster for one grid cell of the user map at one zoom level.
+    Rows are maintained incrementally by `users.clusters` whenever a user's
+    coordinates or username change, so rendering a zoomed-out map only reads the
+    handful of cells in view instead of every user.
+    """
+
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    latitude_sum = models.FloatField(default=0)
+    longitude_sum = models.FloatField(default=0)
+    sample_usernames = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["zoom", "cell_x", "cell_y"], name="users_mapcluster_cell_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.zoom}/{self.cell_x}/{self.cell_y} ({self.count})"
+
+
+class AuthEvent(models.Model):
+    """
+    One login or logout, written by the signal receivers in `users.signals`.
+    Kept apart from the admin's LogEntry table so the login/logout history can be
+    filtered by event type, user and time through indexes instead of text matching.
+    """
+
+    class EventType(models.TextChoices):
+        LOGIN = "login", "Login"
+        LOGOUT = "logout", "Logout"
+
+    class Channel(models.TextChoices):
+        ADMIN = "admin", "Admin site"
+        SITE = "site", "Site"
+
+    # Covered by the (user, timestamp) index
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="auth_events", db_index=False
+    )
+    event_type = models.CharField(max_length=6, choices=EventType.choices)
+    channel = models.CharField(max_length=5, choices=Channel.choices)
+    timestamp = models.DateTimeField(default=timezone.now)
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-timestamp"]
+        indexes = [
+            models.Index(fields=["event_type", "timestamp"], name="users_authevent_type_time"),
+            models.Index(fields=["user", "timestamp"], name="users_authevent_user_time"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.event_type} via {self.channel} at {self.timestamp}"
+
+
+class GeocodedAddress(models.Model):
+    """
+    Persistent cache of geocoded addresses, keyed by their normalized text (see
+    `users.gazetteer.normalize_address`). Addresses that matched no place are cached
+    too, with no coordinates. Rows resolved against another version of the gazetteer
+    are ignored and replaced.
+    """
+
+    normalized_address = models.CharField(max_length=255, unique=True)
+    # Fingerprint of the gazetteer file the address was resolved against
+    gazetteer = models.CharField(max_length=32)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+
+    def __str__(self):
+        return self.normalized_address
@@ -0,0 +1,115 @@
+"""
+K-nearest-neighbour search over user coordinates.
+
+Candidates are cut down with an indexed bounding-box query around the origin
+that widens until it holds at least K users, then ranked by great-circle
+distance computed with NumPy over the whole candidate set at once.
+
+Every query loads at most CANDIDATE_FACTOR * K rows. A box that holds more than
+that is too large: the radius is narrowed again, halfway (in log scale) towards
+the largest radius known to hold too few users, so a dense area or an origin far
+from everyone costs at most MAX_SEARCH_STEPS bounded queries.
+"""
+
+import math
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Abs, Least, Power
+
+from .geo import EARTH_RADIUS_KM, bbox_q, haversine_km, radius_bbox
+from .models import float_coordinates
+
+User = get_user_model()
+
+DEFAULT_NEIGHBOURS = 10
+MAX_NEIGHBOURS = 100
+INITIAL_RADIUS_KM = 5.0
+RADIUS_GROWTH = 4
+# Half the Earth's circumference: a circle this large covers the whole globe
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+# Rows loaded per candidate query, per neighbour asked for
+CANDIDATE_FACTOR = 8
+# Candidate queries per search, not counting the final completeness check
+MAX_SEARCH_STEPS = 12
+
+
+def _flat_distance(latitude, longitude):
+    """
+    Return an expression for the squared distance, in degrees, of a user from a point on a flat
+    projection around it: cheap for the database, and close enough to the great-circle distance
+    to pick the users nearest the point when the box holds more than the candidate limit.
+    """
+    user_latitude, user_longitude = float_coordinates()
+    delta_longitude = Abs(user_longitude - longitude)
+    delta_longitude = Least(delta_longitude, 360.0 - delta_longitude)
+    return Power(user_latitude - latitude, 2) + Power(delta_longitude * math.cos(math.radians(latitude)), 2)
+
+
+def _candidates(queryset, latitude, longitude, radius_km, limit):
+    """
+    Return up to `limit` rows of users inside the box around a point, nearest first, with their distances.
+    """
+    queryset = queryset.filter(bbox_q(*radius_bbox(latitude, longitude, radius_km)))
+    rows = list(queryset.order_by(_flat_distance(latitude, longitude))[:limit])
+    if not rows:
+        return [], np.empty(0)
+    coordinates = np.array([(row[2], row[3]) for row in rows], dtype=float)
+    return rows, haversine_km(latitude, longitude, coordinates[:, 0], coordinates[:, 1])
+
+
+def nearest_users(latitude, longitude, k=DEFAULT_NEIGHBOURS, exclude_pk=None):
+    """
+    Return up to k (id, username, latitude, longitude, position, distance_km) tuples
+    for the users closest to a point, nearest first.
+    When even the smallest box searched holds more than the candidate limit, e.g.
+    thousands of users in one building, the neighbours are picked among the capped
+    candidates, the users of that box nearest the point.
+    """
+    queryset = User.objects.exclude(latitude=None).exclude(longitude=None)
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    queryset = queryset.values_list("id", "username", *float_coordinates(), "position_dms")
+    limit = k * CANDIDATE_FACTOR
+
+    # Radii known to hold fewer than k users, and more than `limit` users
+    too_small, too_large = 0.0, None
+    capped = None
+    radius = INITIAL_RADIUS_KM
+    for _ in range(MAX_SEARCH_STEPS):
+        rows, distances = _candidates(queryset, latitude, longitude, radius, limit)
+        if len(rows) >= limit:
+            too_large, capped = radius, (rows, distances)
+        elif len(rows) < k and radius < MAX_RADIUS_KM:
+            too_small = radius
+        else:
+            break
+        if too_large is None:
+            radius = min(radius * RADIUS_GROWTH, MAX_RADIUS_KM)
+        elif too_small:
+            radius = math.sqrt(too_small * too_large)
+        else:
+            radius = too_large / RADIUS_GROWTH
+    else:
+        if len(rows) < k and capped is not None:
+            rows, distances = capped
+            radius = too_large
+
+    order = np.argsort(distances, kind="stable")[:k]
+    # The box only guarantees completeness within `radius`. When the k-th candidate
+    # is further away than that, a closer user may sit just outside the box, so
+    # search once more with the k-th distance as the radius.
+    if len(rows) < limit and len(order) and distances[order[-1]] > radius:
+        radius = float(distances[order[-1]])
+        wider_rows, wider_distances = _candidates(queryset, latitude, longitude, radius, limit)
+        if len(wider_rows) < limit:
+            rows, distances = wider_rows, wider_distances
+        else:
+            # Too many to load them all; rank the ones loaded together with the complete smaller box
+            seen = {row[0] for row in rows}
+            extra = [i for i, row in enumerate(wider_rows) if row[0] not in seen]
+            rows = rows + [wider_rows[i] for i in extra]
+            distances = np.concatenate([distances, wider_distances[extra]])
+        order = np.argsort(distances, kind="stable")[:k]
+
+    return [(*rows[i], float(distances[i])) for i in order]
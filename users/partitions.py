@@ -0,0 +1,177 @@
+"""
+Monthly partitions of the AuthEvent table.
+
+On PostgreSQL `users_authevent` is partitioned by range of `timestamp` (see migration
+0008), with one partition per calendar month named `users_authevent_pYYYYMM` and a
+default partition catching anything outside them. Queries bounded in time only read
+the partitions of the months they cover, and expired months are archived and dropped
+as whole tables instead of being deleted row by row.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AuthEvent
+
+PARENT_TABLE = AuthEvent._meta.db_table
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+# Rows archived per round trip
+ARCHIVE_CHUNK_SIZE = 5000
+
+_partition_name = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def is_partitioned():
+    """
+    Return whether the AuthEvent table is partitioned, i.e. the database is PostgreSQL and migrated.
+    """
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [PARENT_TABLE])
+        return cursor.fetchone() is not None
+
+
+def month_start(value):
+    """
+    Return the first day of the month of a date.
+    """
+    return value.replace(day=1)
+
+
+def add_months(month, months):
+    """
+    Return the first day of the month `months` after (or before, when negative) `month`.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_p{month:%Y%m}"
+
+
+def _bounds(month):
+    """
+    Return the [start, end) timestamps of a month in the current time zone.
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.datetime.combine(month, datetime.time(), tzinfo=tz)
+    end = datetime.datetime.combine(add_months(month, 1), datetime.time(), tzinfo=tz)
+    return start, end
+
+
+def month_partitions():
+    """
+    Return the months that have a partition, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        if match := _partition_name.match(name):
+            months.append(datetime.date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_month_partition(month):
+    """
+    Create the partition for a month, moving any of its rows out of the default partition.
+    Return False when the partition already existed.
+    """
+    name = partition_name(month)
+    start, end = _bounds(month)
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        # Attaching a partition fails while the default partition holds rows in its
+        # range, so the table is filled with them first and attached afterwards
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} (LIKE {quote(PARENT_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s '
+            f"RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(PARENT_TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    return True
+
+
+def split_default_partition():
+    """
+    Give every month with rows in the default partition a partition of its own.
+    Return the months that were created.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE %s)::date FROM {quote(DEFAULT_PARTITION)}",
+            [timezone.get_current_timezone_name()],
+        )
+        months = sorted(row[0] for row in cursor.fetchall())
+    return [month for month in months if create_month_partition(month)]
+
+
+def ensure_partitions(months_ahead, today=None):
+    """
+    Create the partitions from the current month to `months_ahead` months ahead.
+    Return the months that were created.
+    """
+    current = month_start(today or timezone.localdate())
+    return [
+        month for month in (add_months(current, i) for i in range(months_ahead + 1)) if create_month_partition(month)
+    ]
+
+
+def expired_partitions(retention_months, today=None):
+    """
+    Return the months with a partition that lie entirely before the retention window.
+    """
+    cutoff = add_months(month_start(today or timezone.localdate()), -retention_months)
+    return [month for month in month_partitions() if month < cutoff]
+
+
+def archive_partition(month, directory):
+    """
+    Stream the rows of a month's partition into a gzip-compressed JSONL file in
+    `directory`, then drop the partition. Return the path of the file and the number
+    of rows archived. The file is complete on disk before the partition is dropped.
+    """
+    name = partition_name(month)
+    path = os.path.join(directory, f"{name}.jsonl.gz")
+    start, end = _bounds(month)
+    rows = AuthEvent.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by("timestamp", "id")
+    rows = rows.values("id", "user_id", "event_type", "channel", "timestamp", "ip_address")
+
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    with transaction.atomic():
+        with open(f"{path}.tmp", "wb") as raw:
+            with gzip.open(raw, "wt", encoding="utf-8") as archive:
+                for row in rows.iterator(chunk_size=ARCHIVE_CHUNK_SIZE):
+                    row["timestamp"] = row["timestamp"].isoformat()
+                    archive.write(json.dumps(row, separators=(",", ":")) + "\n")
+                    count += 1
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(f"{path}.tmp", path)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+    return path, count
@@ -1,6 +1,40 @@
-from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.auth import get_user_model
 from django.contrib.auth.signals import user_logged_in, user_logged_out
-from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .audit import audit_writer
+from .backends import invalidate_cached_users
+from .clusters import move_point, rebuild_clusters
+from .heatmap import update_heatmaps
+from .map_cache import bump_locations_version
+from .models import AuthEvent
+from .tiles import invalidate_all_tiles, invalidate_tiles
+
+User = get_user_model()
+
+# Fields that change what a user looks like on the map
+MAP_FIELDS = {"latitude", "longitude", "username"}
+
+# Sent after a user was saved with at least one field whose value changed, with the
+# arguments instance, created and changed_fields (a frozenset of field names, see
+# User.changed_fields). Saves that only rewrite the values already stored send nothing.
+user_fields_changed = Signal()
+
+
+def _auth_event(request, user, event_type):
+    """
+    Build the (unsaved) AuthEvent recording a login or logout, stamped with the current time.
+    """
+    # The admin site is mounted under its own namespace ("pin_people_admin:login"),
+    # so match on the "admin" application namespace rather than the view name
+    if "admin" in request.resolver_match.app_names:
+        channel = AuthEvent.Channel.ADMIN
+    else:
+        channel = AuthEvent.Channel.SITE
+    return AuthEvent(
+        user_id=user.pk, event_type=event_type, channel=channel, ip_address=request.META.get("REMOTE_ADDR")
+    )
 
 
 @receiver(user_logged_in)
@@ -15,19 +49,7 @@ def log_user_login(sender, request, user, **kwargs):
     if not getattr(request, "resolver_match", None):
         return  # Skip logging when there is no resolver_match (this is the case when running tests)
 
-    if request.resolver_match.view_name == "admin:login":
-        change_message = "User logged in via admin site."
-    else:
-        change_message = "User logged in via site."
-
-    LogEntry.objects.log_action(
-        user_id=user.pk,
-        content_type_id=None,
-        object_id=None,
-        object_repr=str(user),
-        action_flag=CHANGE,
-        change_message=change_message,
-    )
+    audit_writer.write(_auth_event(request, user, AuthEvent.EventType.LOGIN))
 
 
 @receiver(user_logged_out)
@@ -45,16 +67,83 @@ def log_user_logout(sender, request, user, **kwargs):
     if not getattr(request, "resolver_match", None):
         return  # Skip logging when there is no resolver_match (this is the case when running tests)
 
-    if request.resolver_match.view_name == "admin:logout":
-        change_message = "User logged out via admin site."
+    audit_writer.write(_auth_event(request, user, AuthEvent.EventType.LOGOUT))
+
+
+def map_point_changed(old, new):
+    """
+    Bring the precomputed map data up to date after a user's map point changed.
+    Both are (latitude, longitude, username) tuples or None.
+    """
+    if old == new:
+        return
+    move_point(old, new)
+    invalidate_tiles(old, new)
+    update_heatmaps(old, new)
+    bump_locations_version()
+
+
+def map_data_reloaded():
+    """
+    Bring the precomputed map data up to date after users were written in bulk,
+    bypassing the save signals.
+    """
+    rebuild_clusters()
+    invalidate_all_tiles()
+    bump_locations_version()
+
+
+@receiver(post_save, sender=User)
+def send_user_fields_changed(sender, instance, created, raw, update_fields, **kwargs):
+    """
+    Tell the `user_fields_changed` receivers which fields a save actually changed.
+    """
+    if raw:
+        # Fixtures are loaded as is, without the fields derived from the coordinates;
+        # run "manage.py backfill_location_fields" and then "manage.py rebuild_map_clusters"
+        return
+    # Compared before User.save records the saved values as loaded
+    changed_fields = instance.changed_fields(update_fields)
+    if changed_fields:
+        user_fields_changed.send(sender=sender, instance=instance, created=created, changed_fields=changed_fields)
+
+
+@receiver(user_fields_changed, sender=User)
+def update_map_on_user_change(sender, instance, created, changed_fields, **kwargs):
+    """
+    Move the user's marker in the precomputed map clusters and vector tiles
+    when their coordinates or username changed.
+    """
+    if not MAP_FIELDS.intersection(changed_fields):
+        return  # e.g. the last_login update on every login
+
+    if created:
+        old = None
     else:
-        change_message = "User logged out via site."
-
-    LogEntry.objects.log_action(
-        user_id=user.pk,
-        content_type_id=None,
-        object_id=None,
-        object_repr=str(user),
-        action_flag=CHANGE,
-        change_message=change_message,
-    )
+        try:
+            old = instance.loaded_map_point
+        except (AttributeError, KeyError):
+            return  # The previous point is unknown, so there is nothing safe to update incrementally
+    map_point_changed(old, instance.map_point)
+
+
+@receiver(post_delete, sender=User)
+def update_map_on_user_delete(sender, instance, **kwargs):
+    """
+    Remove a deleted user's marker from the precomputed map clusters and vector tiles.
+    """
+    try:
+        old = instance.loaded_map_point
+    except (AttributeError, KeyError):
+        old = instance.map_point
+    map_point_changed(old, None)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the copy of the user cached for their sessions, so the next request sees the
+    saved row, including a new password.
+    """
+    invalidate_cached_users([instance.pk])
@@ -0,0 +1,148 @@
+from datetime import datetime
+from unittest import mock
+
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.search import trigram_search_available
+
+User = get_user_model()
+
+
+class LogEntryAdminTests(TestCase):
+
+    def setUp(self):
+        """
+        Create a superuser, a few log entries and log in.
+        """
+        self.admin = User.objects.create_superuser(username="admin", password="adminpass")
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        for user in (self.alice, self.bob, self.alice):
+            LogEntry.objects.create(user=user, action_flag=CHANGE, object_repr=user.username, change_message="x")
+        self.client.force_login(self.admin)
+        self.url = reverse("pin_people_admin:admin_logentry_changelist")
+
+    def _query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_users_are_not_fetched_per_row(self):
+        """
+        The number of queries should not grow with the number of entries shown.
+        """
+        self._query_count()  # Caches the session and the user
+        count = self._query_count()
+        for _ in range(5):
+            LogEntry.objects.create(user=self.bob, action_flag=CHANGE, object_repr="bob", change_message="x")
+        self.assertEqual(self._query_count(), count)
+
+    def test_username_filter(self):
+        """
+        The user filter should match usernames starting with the entered text.
+        """
+        response = self.client.get(self.url, {"username": "ali"})
+        self.assertEqual({e.user for e in response.context["cl"].result_list}, {self.alice})
+        self.assertContains(response, 'name="username" value="ali"')
+
+    def test_unfiltered_count_is_estimated(self):
+        """
+        A large unfiltered log should be counted from the table statistics, a filtered one exactly.
+        """
+        with mock.patch("users.admin_paginators.estimated_row_count", return_value=2_000_000):
+            response = self.client.get(self.url)
+            self.assertEqual(response.context["cl"].result_count, 2_000_000)
+
+            response = self.client.get(self.url, {"username": "bob"})
+            self.assertEqual(response.context["cl"].result_count, 1)
+
+
+class UserAdminSearchTests(TestCase):
+
+    def setUp(self):
+        """
+        Create a superuser and a few users to search, and log in.
+        """
+        self.admin = User.objects.create_superuser(username="admin", password="adminpass")
+        for username, email in [
+            ("smith", "smith@example.com"),
+            ("blacksmithing", "forge@example.com"),
+            ("jones", "js@smithson.example"),
+            ("brown", "brown@example.com"),
+        ]:
+            User.objects.create(username=username, email=email)
+        self.client.force_login(self.admin)
+        self.url = reverse("pin_people_admin:users_user_changelist")
+
+    def _search(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [user.username for user in response.context["cl"].result_list]
+
+    def test_search_matches_substrings(self):
+        """
+        Every word of the search should match part of the username, email or phone number, in any case.
+        """
+        self.assertEqual(sorted(self._search({"q": "SMITH"})), ["blacksmithing", "jones", "smith"])
+        self.assertEqual(self._search({"q": "smith forge"}), ["blacksmithing"])
+
+    def test_search_ranks_and_caps_matches(self):
+        """
+        The closest matches should come first, and no more than search_result_limit of them.
+        """
+        if not trigram_search_available(DEFAULT_DB_ALIAS):
+            self.skipTest("The database has no pg_trgm.")
+        self.assertEqual(self._search({"q": "smith"})[0], "smith")
+        with mock.patch("users.admin.UserAdmin.search_result_limit", 2):
+            self.assertEqual(len(self._search({"q": "smith"})), 2)
+            # Ordering by a column still only shows the best matches
+            self.assertEqual(self._search({"q": "smith", "o": "1"}), ["jones", "smith"])
+
+
+class UserAdminChangeTests(TestCase):
+
+    def setUp(self):
+        """
+        Create a superuser and a user to edit, and log in.
+        """
+        self.admin = User.objects.create(username="admin", is_superuser=True, is_staff=True)
+        self.user = User.objects.create(
+            username="bob",
+            email="bob@example.com",
+            password="!",
+            date_joined=timezone.make_aware(datetime(2024, 1, 1, 9, 30)),
+        )
+        self.client.force_login(self.admin)
+        self.url = reverse("pin_people_admin:users_user_change", args=[self.user.pk])
+        self.data = {
+            "username": "bob",
+            "password": "!",
+            "email": "bob@example.com",
+            "is_active": "on",
+            "date_joined_0": "2024-01-01",
+            "date_joined_1": "09:30:00",
+        }
+
+    def _updates(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        return [query["sql"] for query in queries if query["sql"].startswith('UPDATE "users_user"')]
+
+    def test_only_changed_fields_are_written(self):
+        """
+        Saving the change form should write only the changed columns, and nothing when none changed.
+        """
+        self.assertEqual(self._updates(self.data), [])
+
+        (update,) = self._updates({**self.data, "first_name": "Bobby"})
+        self.assertIn('SET "first_name" = ', update)
+        self.assertNotIn('"email"', update)
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, "Bobby")
@@ -0,0 +1,80 @@
+import importlib
+
+from django.apps import apps
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from users.audit import AuditWriter
+from users.models import AuthEvent
+
+User = get_user_model()
+
+
+class AuthEventTests(TestCase):
+
+    def test_login_and_logout_are_recorded(self):
+        """
+        Site logins and logouts should be recorded as AuthEvents, immediately when inside a transaction.
+        """
+        user = User.objects.create_user(username="user1", password="password123")
+        self.client.post(reverse("login"), {"username": "user1", "password": "password123"})
+        self.client.post(reverse("logout"))
+        self.assertEqual(
+            list(AuthEvent.objects.order_by("timestamp").values_list("user", "event_type", "channel", "ip_address")),
+            [(user.pk, "login", "site", "127.0.0.1"), (user.pk, "logout", "site", "127.0.0.1")],
+        )
+
+    def test_admin_login_is_recorded_as_admin_channel(self):
+        """
+        Logins through the admin site should be told apart from site logins.
+        """
+        User.objects.create_superuser(username="admin", password="adminpass")
+        self.client.post(reverse("pin_people_admin:login"), {"username": "admin", "password": "adminpass"})
+        self.assertEqual(list(AuthEvent.objects.values_list("event_type", "channel")), [("login", "admin")])
+
+    def test_admin_filter(self):
+        """
+        The Login/Logout filter of the auth event admin should filter on the event type.
+        """
+        admin = User.objects.create_superuser(username="admin", password="adminpass")
+        AuthEvent.objects.create(user=admin, event_type="login", channel="site")
+        AuthEvent.objects.create(user=admin, event_type="logout", channel="site")
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("pin_people_admin:users_authevent_changelist"), {"login_logout": "logout"})
+        self.assertEqual([e.event_type for e in response.context["cl"].result_list], ["logout"])
+
+    def test_migration_backfills_from_the_admin_log(self):
+        """
+        The login/logout entries already in the admin log should be copied into AuthEvent.
+        """
+        user = User.objects.create_user(username="user1", password="password123")
+        for message in ("User logged in via admin site.", "User logged out via site.", "Changed email."):
+            LogEntry.objects.create(user=user, action_flag=CHANGE, object_repr="user1", change_message=message)
+
+        migration = importlib.import_module("users.migrations.0006_authevent")
+        migration.backfill_auth_events(apps, None)
+
+        self.assertEqual(
+            sorted(AuthEvent.objects.values_list("event_type", "channel")), [("login", "admin"), ("logout", "site")]
+        )
+
+
+@override_settings(AUDIT_LOG_ASYNC=True)
+class AuditWriterTests(TransactionTestCase):
+
+    def test_background_writes_are_flushed_on_shutdown(self):
+        """
+        Records queued outside a transaction should be written in batches by the
+        background thread, and the ones still queued on shutdown should not be lost.
+        """
+        user = User.objects.create(username="user1")
+        writer = AuditWriter(batch_size=2, flush_interval=0.05)
+        for i in range(5):
+            writer.write(AuthEvent(user=user, event_type="login", channel="site", ip_address=f"10.0.0.{i}"))
+        writer.shutdown()
+
+        self.assertEqual(AuthEvent.objects.count(), 5)
+        self.assertIsNone(writer._thread)
@@ -0,0 +1,61 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from users.backends import PooledHashingBackend
+
+User = get_user_model()
+
+
+# As configured with a shared cache; the test run is a single process
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cached_db", AUTH_USER_CACHE_TIMEOUT=300)
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        """
+        Create a user and log in.
+        """
+        cache.clear()
+        self.user = User.objects.create(username="user1", first_name="Ann")
+        self.client.force_login(self.user)
+        self.url = reverse("location")
+
+    def test_user_is_resolved_from_cache(self):
+        """
+        Only the first request should load the user; the session was cached when it was saved at login.
+        """
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), "ANN")
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(PooledHashingBackend().aget_user)(str(self.user.pk)), self.user)
+
+    def test_saving_the_user_refreshes_the_cache(self):
+        """
+        A saved change should show up on the next request.
+        """
+        self.client.get(self.url)
+        self.user.first_name = "Beth"
+        self.user.save()
+        self.assertContains(self.client.get(self.url), "BETH")
+
+    def test_password_change_logs_other_sessions_out(self):
+        """
+        Sessions should not outlive a password change because of the cached user.
+        """
+        self.client.get(self.url)
+        self.user.set_password("new-password")
+        self.user.save()
+        self.assertRedirects(self.client.get(self.url), f"{reverse('login')}?next={self.url}")
+
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        """
+        With a zero timeout the user should be loaded on every request.
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
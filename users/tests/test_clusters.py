@@ -0,0 +1,126 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from users.clusters import CLUSTER_MAX_ZOOM, cell_for
+from users.models import MapCluster
+
+User = get_user_model()
+
+
+class MapClusterMaintenanceTests(TestCase):
+
+    def setUp(self):
+        """
+        Create two users close to each other in Cape Town.
+        """
+        self.user1 = User.objects.create_user(
+            username="user1", password="password123", latitude=-33.92, longitude=18.42
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="password123", latitude=-33.93, longitude=18.43
+        )
+
+    def world_cluster(self):
+        return MapCluster.objects.get(zoom=0)
+
+    def test_users_are_added_to_every_level(self):
+        """
+        Creating a user with coordinates should count them once on every zoom level.
+        """
+        self.assertEqual(MapCluster.objects.filter(zoom=0).count(), 1)
+        self.assertEqual(
+            sum(MapCluster.objects.filter(zoom=CLUSTER_MAX_ZOOM).values_list("count", flat=True)),
+            2,
+        )
+        cluster = self.world_cluster()
+        self.assertEqual(cluster.count, 2)
+        self.assertAlmostEqual(cluster.latitude_sum / cluster.count, -33.925)
+        self.assertEqual(cluster.sample_usernames, ["user1", "user2"])
+
+    def test_user_without_coordinates_is_ignored(self):
+        """
+        Users without coordinates should not be counted.
+        """
+        User.objects.create_user(username="user3", password="password123")
+        self.assertEqual(self.world_cluster().count, 2)
+
+    def test_moving_user_updates_cells(self):
+        """
+        Moving a user should move their count from the old cells to the new ones.
+        """
+        user = User.objects.get(pk=self.user1.pk)
+        user.latitude = Decimal("39.8")
+        user.longitude = Decimal("-89.65")
+        user.save()
+
+        old_cell = cell_for(-33.93, 18.43, CLUSTER_MAX_ZOOM)
+        new_cell = cell_for(39.8, -89.65, CLUSTER_MAX_ZOOM)
+        old_cluster = MapCluster.objects.get(zoom=CLUSTER_MAX_ZOOM, cell_x=old_cell[0], cell_y=old_cell[1])
+        new_cluster = MapCluster.objects.get(zoom=CLUSTER_MAX_ZOOM, cell_x=new_cell[0], cell_y=new_cell[1])
+        self.assertEqual(old_cluster.sample_usernames, ["user2"])
+        self.assertEqual(new_cluster.sample_usernames, ["user1"])
+
+    def test_renaming_user_updates_samples(self):
+        """
+        A username change should replace the sample username without changing counts.
+        """
+        user = User.objects.get(pk=self.user1.pk)
+        user.username = "renamed"
+        user.save()
+        cluster = self.world_cluster()
+        self.assertEqual(cluster.count, 2)
+        self.assertEqual(sorted(cluster.sample_usernames), ["renamed", "user2"])
+
+    def test_last_login_update_does_not_touch_clusters(self):
+        """
+        Saves limited to non-map fields should not query the clusters at all.
+        """
+        user = User.objects.get(pk=self.user1.pk)
+        with self.assertNumQueries(1):
+            user.save(update_fields=["last_login"])
+
+    def test_deleting_user_removes_empty_cells(self):
+        """
+        Deleting users should decrement their cells and drop the empty ones.
+        """
+        User.objects.get(pk=self.user1.pk).delete()
+        self.assertEqual(self.world_cluster().count, 1)
+        User.objects.get(pk=self.user2.pk).delete()
+        self.assertFalse(MapCluster.objects.exists())
+
+    def test_samples_are_refilled_when_sampled_users_leave(self):
+        """
+        Removing sampled users should refill the sample from the users left in the cell.
+        """
+        for number in (3, 4, 5):
+            User.objects.create(username=f"user{number}", latitude=-33.94, longitude=18.44)
+        self.assertEqual(self.world_cluster().sample_usernames, ["user1", "user2", "user3"])
+
+        User.objects.filter(username__in=["user1", "user2"]).delete()
+        cluster = self.world_cluster()
+        self.assertEqual(cluster.count, 3)
+        self.assertEqual(sorted(cluster.sample_usernames), ["user3", "user4", "user5"])
+
+    def test_rebuild_command_matches_incremental_state(self):
+        """
+        Rebuilding from scratch should produce the same clusters as the incremental updates.
+        """
+        fields = ("zoom", "cell_x", "cell_y", "count", "sample_usernames")
+        incremental = sorted(MapCluster.objects.values_list(*fields))
+        MapCluster.objects.all().delete()
+        call_command("rebuild_map_clusters", stdout=StringIO())
+        self.assertEqual(sorted(MapCluster.objects.values_list(*fields)), incremental)
+
+    def test_rebuild_counts_users_written_without_save(self):
+        """
+        Users whose coordinates were written with QuerySet.update() should still be clustered.
+        """
+        User.objects.filter(pk=self.user2.pk).update(latitude_float=None, longitude_float=None)
+        call_command("rebuild_map_clusters", stdout=StringIO())
+        cluster = self.world_cluster()
+        self.assertEqual(cluster.count, 2)
+        self.assertAlmostEqual(cluster.latitude_sum / cluster.count, -33.925)
@@ -0,0 +1,200 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from users.export import export_chunks
+from users.geo import bbox_q
+
+User = get_user_model()
+
+
+class BackfillLocationFieldsCommandTests(TestCase):
+
+    def test_backfills_users_written_without_save(self):
+        """
+        Users whose coordinates were written with QuerySet.update() should get their geohash back.
+        """
+        user = User.objects.create_user(username="user1", password="password123")
+        User.objects.filter(pk=user.pk).update(latitude=-33.92, longitude=18.42)
+
+        call_command("backfill_location_fields", batch_size=1, stdout=StringIO())
+
+        user.refresh_from_db()
+        self.assertEqual(user.geohash, "k3vp51j19")
+        self.assertEqual(user.position_dms, "33°55'12\"S 18°25'12\"E")
+        self.assertEqual((user.latitude_float, user.longitude_float), (-33.92, 18.42))
+
+    def test_initial_data_is_loaded_and_backfilled(self):
+        """
+        The fixture loaded on deploy should load without updated_at, and be found on the map after the backfill.
+        """
+        call_command("loaddata", "users/fixtures/initial_data.json", stdout=StringIO())
+        user = User.objects.get(username="johndoe")
+        self.assertIsNotNone(user.updated_at)
+        self.assertEqual(user.geohash, "")
+
+        call_command("backfill_location_fields", stdout=StringIO())
+        self.assertTrue(User.objects.filter(bbox_q(-34, 18, -33, 19), username="johndoe").exists())
+
+
+class ExportLocationsCommandTests(TestCase):
+
+    def test_exports_geojson_across_chunks(self):
+        """
+        Features split over several chunks should still form one valid FeatureCollection.
+        """
+        for i, (latitude, longitude) in enumerate([(-33.92, 18.42), (39.8, -89.65), (51.5, -0.12)]):
+            User.objects.create_user(
+                username=f"user{i}", password="password123", latitude=latitude, longitude=longitude
+            )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "locations.geojson")
+            with mock.patch("users.export.EXPORT_CHUNK_SIZE", 2):
+                call_command("export_locations", path, stdout=StringIO())
+            with open(path) as f:
+                data = json.load(f)
+
+        self.assertEqual([f["properties"]["username"] for f in data["features"]], ["user0", "user1", "user2"])
+
+    def test_exports_users_written_without_save(self):
+        """
+        Users whose float coordinates were never filled should be exported from the decimal ones.
+        """
+        user = User.objects.create(username="user1")
+        User.objects.filter(pk=user.pk).update(latitude=-33.92, longitude=18.42)
+
+        export = b"".join(export_chunks("ndjson")).decode()
+        self.assertIn('"latitude":-33.92,"longitude":18.42', export)
+
+
+class BenchmarkDmsCommandTests(TestCase):
+
+    def test_reports_both_implementations(self):
+        """
+        The benchmark should check the batch formatter against the scalar one and report both timings.
+        """
+        out = StringIO()
+        call_command("benchmark_dms", count=500, repeat=1, stdout=out)
+        self.assertIn("Scalar:", out.getvalue())
+        self.assertIn("Batch:", out.getvalue())
+
+
+class BenchmarkRequestQueriesCommandTests(TestCase):
+
+    def test_reports_query_reduction(self):
+        """
+        The benchmark should show both views running without queries once sessions and users are cached.
+        """
+        out = StringIO()
+        call_command("benchmark_request_queries", requests=3, stdout=out)
+        self.assertIn("location_view: 2.0 -> 0.0 queries/request", out.getvalue())
+        self.assertIn("profile_view: 2.0 -> 0.0 queries/request", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith="benchmark-").exists())
+
+
+class ImportUsersCommandTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_imports_valid_records_and_reports_rejects(self):
+        """
+        Valid rows should be created with hashed passwords and derived location fields; invalid ones reported.
+        """
+        User.objects.create(username="taken", email="taken@example.com")
+        path = self._write(
+            "users.csv",
+            "username,password,email,phone_number,latitude,longitude\n"
+            "alice,secret123,alice@example.com,0821234567,-33.92,18.42\n"
+            "bob,,bob@example.com,,,\n"
+            "carol,secret123,not-an-email,,,\n"
+            "dave,secret123,TAKEN@example.com,12,,\n"
+            "erin,secret123,Taken@Example.com,,,\n"
+            "alice,secret123,other@example.com,,,\n"
+            "frank,secret123,,,nan,18.42\n",
+        )
+        out, err = StringIO(), StringIO()
+
+        call_command("import_users", path, workers=1, stdout=out, stderr=err)
+
+        alice = User.objects.get(username="alice")
+        self.assertTrue(alice.check_password("secret123"))
+        self.assertEqual(alice.phone_number.as_e164, "+27821234567")
+        self.assertEqual(alice.geohash, "k3vp51j19")
+        self.assertEqual(alice.position_dms, "33°55'12\"S 18°25'12\"E")
+        self.assertFalse(User.objects.get(username="bob").has_usable_password())
+        self.assertFalse(User.objects.filter(username__in=["carol", "dave", "erin"]).exists())
+        errors = err.getvalue()
+        self.assertIn("Line 4: 'not-an-email' is not a valid email address.", errors)
+        self.assertIn("Line 5: '12' is not a valid phone number.", errors)
+        self.assertIn("Line 6: The email 'Taken@Example.com' is already in use.", errors)
+        self.assertIn("Line 7: Duplicate username 'alice' in the input.", errors)
+        self.assertIn("Line 8: latitude must be a finite number.", errors)
+        self.assertIn("Imported 2 users (0 already existed, 5 rejected).", out.getvalue())
+
+    def test_rerun_resumes_from_checkpoint(self):
+        """
+        A rerun should skip the records before the checkpoint and the users that already exist.
+        """
+        path = self._write(
+            "users.jsonl",
+            "".join(json.dumps({"username": f"user{i}", "password_hash": "!"}) + "\n" for i in range(5)),
+        )
+        checkpoint = os.path.join(self.directory, "checkpoint")
+        call_command("import_users", path, workers=1, batch_size=2, checkpoint=checkpoint, stdout=StringIO())
+        User.objects.filter(username="user4").delete()
+        with open(checkpoint, "w") as f:
+            f.write("3")
+
+        out = StringIO()
+        call_command("import_users", path, workers=1, batch_size=2, checkpoint=checkpoint, stdout=out)
+
+        self.assertIn("Resuming after 3 records.", out.getvalue())
+        self.assertIn("Imported 1 users (1 already existed, 0 rejected).", out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith="user").count(), 5)
+        with open(checkpoint) as f:
+            self.assertEqual(f.read(), "5")
+
+
+class GeocodeUsersCommandTests(TestCase):
+
+    def test_locates_users_with_an_address(self):
+        """
+        Users with an address and no coordinates should be located, the others left alone.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "gazetteer.csv")
+            with open(path, "w") as f:
+                f.write("name,latitude,longitude\nCape Town,-33.925839,18.423218\n")
+            User.objects.bulk_create(
+                [
+                    User(username="user1", address="Long Street, Cape Town"),
+                    User(username="user2", address="Atlantis"),
+                    User(username="user3", address="Cape Town", latitude=-34.08, longitude=18.86),
+                ]
+            )
+
+            out = StringIO()
+            with self.settings(GEOCODER_GAZETTEER=path):
+                call_command("geocode_users", workers=1, batch_size=1, stdout=out)
+
+        self.assertIn("Located 1 of 2 users with an address.", out.getvalue())
+        user1, user2, user3 = User.objects.order_by("username")
+        self.assertEqual(user1.position_dms, "33°55'33\"S 18°25'24\"E")
+        self.assertIsNone(user2.latitude)
+        self.assertEqual(float(user3.latitude), -34.08)
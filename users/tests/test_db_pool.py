@@ -0,0 +1,94 @@
+import importlib.util
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from pin_people.db import METRICS_CONTENT_TYPE, render_pool_metrics
+
+User = get_user_model()
+
+
+class StandInPool:
+    """
+    Stand-in for a psycopg_pool.ConnectionPool, reporting fixed statistics.
+    """
+
+    closed = False
+
+    def get_stats(self):
+        return {
+            "pool_min": 2,
+            "pool_max": 10,
+            "pool_size": 4,
+            "pool_available": 1,
+            "requests_waiting": 0,
+            "requests_num": 120,
+            "requests_queued": 3,
+            "requests_wait_ms": 1500,
+        }
+
+
+class PoolMetricsTests(SimpleTestCase):
+
+    def test_render_pool_metrics(self):
+        """
+        Pool statistics should be exported in the Prometheus text format, with times in seconds.
+        """
+        lines = render_pool_metrics({"default": StandInPool()}).splitlines()
+        self.assertIn('pin_people_db_pool_enabled{database="default"} 1', lines)
+        self.assertIn("# TYPE pin_people_db_pool_wait_seconds_total counter", lines)
+        self.assertIn('pin_people_db_pool_wait_seconds_total{database="default"} 1.5', lines)
+        self.assertIn('pin_people_db_pool_queued_requests_total{database="default"} 3', lines)
+        # Counters the pool has not reported yet are zero
+        self.assertIn('pin_people_db_pool_request_errors_total{database="default"} 0', lines)
+        self.assertIn('pin_people_db_pool_utilization_ratio{database="default"} 0.3', lines)
+
+    def test_render_without_pool(self):
+        """
+        Databases without a pool should only be reported as such.
+        """
+        self.assertIn('pin_people_db_pool_enabled{database="default"} 0', render_pool_metrics({}).splitlines())
+
+    @unittest.skipUnless(importlib.util.find_spec("psycopg_pool"), "psycopg_pool is not installed")
+    def test_render_real_pool(self):
+        """
+        The statistics of a real pool on the test database should render.
+        """
+        from psycopg_pool import ConnectionPool
+
+        with ConnectionPool(kwargs=connection.get_connection_params(), min_size=1, max_size=2) as pool:
+            with pool.connection() as conn:
+                conn.execute("SELECT 1")
+            pool.check()
+            lines = render_pool_metrics({"default": pool}).splitlines()
+        self.assertIn('pin_people_db_pool_max_connections{database="default"} 2', lines)
+        self.assertIn('pin_people_db_pool_requests_total{database="default"} 1', lines)
+
+
+@override_settings(METRICS_TOKEN="secret")
+class PoolMetricsViewTests(TestCase):
+
+    def setUp(self):
+        self.url = reverse("db_pool_metrics")
+
+    def test_scrape_with_token(self):
+        """
+        A scraper with the token should get the metrics; anyone else without it a 403.
+        """
+        response = self.client.get(self.url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], METRICS_CONTENT_TYPE)
+        self.assertIn(b"pin_people_db_pool_enabled", response.content)
+
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_staff_can_view(self):
+        """
+        Staff users should see the metrics without the token.
+        """
+        self.client.force_login(User.objects.create(username="staff", is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
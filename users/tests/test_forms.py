@@ -1,9 +1,10 @@
 from decimal import Decimal
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-from users.forms import CustomUserChangeForm, CustomUserCreationForm
+from users.forms import AsyncAuthenticationForm, CustomUserChangeForm, CustomUserCreationForm
 
 User = get_user_model()
 
@@ -150,3 +151,48 @@ class CustomUserChangeFormTests(TestCase):
         self.assertFalse(form.is_valid())
         self.assertIn("email", form.errors)
         self.assertEqual(form.errors["email"][0], "This email is already in use.")
+
+    def test_clean_email_duplicate_ignores_case(self):
+        """
+        An email differing from another user's only in case should be invalid too.
+        """
+        form = CustomUserChangeForm(
+            data={"username": self.user1.username, "email": "User2@Example.COM"}, instance=self.user1
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["email"], ["This email is already in use."])
+
+    def test_blank_email_shared(self):
+        """
+        Several users may leave their email blank.
+        """
+        User.objects.filter(pk=self.user2.pk).update(email="")
+        form = CustomUserChangeForm(data={"username": self.user1.username, "email": ""}, instance=self.user1)
+        self.assertTrue(form.is_valid())
+        form.save()
+
+
+class AsyncAuthenticationFormTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="user1", password="password123")
+
+    def test_sync_validation_checks_credentials(self):
+        """
+        A synchronous is_valid() should still reject a wrong password.
+        """
+        form = AsyncAuthenticationForm(data={"username": "user1", "password": "wrong"})
+        self.assertFalse(form.is_valid())
+        form = AsyncAuthenticationForm(data={"username": "user1", "password": "password123"})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_user(), self.user)
+
+    def test_async_validation_checks_credentials(self):
+        """
+        avalidate() should check the credentials itself.
+        """
+        form = AsyncAuthenticationForm(data={"username": "user1", "password": "wrong"})
+        self.assertFalse(async_to_sync(form.avalidate)())
+        form = AsyncAuthenticationForm(data={"username": "user1", "password": "password123"})
+        self.assertTrue(async_to_sync(form.avalidate)())
+        self.assertEqual(form.get_user(), self.user)
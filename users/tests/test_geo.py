@@ -0,0 +1,148 @@
+import random
+from decimal import Decimal
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from users.geo import (
+    encode_geohash,
+    format_position,
+    format_positions_batch,
+    geohash_prefixes,
+    haversine_km,
+    parse_bbox,
+    radius_bbox,
+    snap_bbox,
+    to_dms,
+    to_dms_batch,
+)
+
+
+class ParseBboxTests(SimpleTestCase):
+
+    def test_wraps_longitudes_and_clamps_latitudes(self):
+        """
+        Out of range values reported by a panned map should be normalized.
+        """
+        params = {"south": -100, "west": 190, "north": 100, "east": 200}
+        self.assertEqual(parse_bbox(params), (-90, -170, 90, -160))
+
+    def test_wide_box_covers_the_world(self):
+        """
+        A box wider than 360 degrees should cover every longitude.
+        """
+        params = {"south": -10, "west": -400, "north": 10, "east": 400}
+        self.assertEqual(parse_bbox(params), (-10, -180, 10, 180))
+
+    def test_invalid_box(self):
+        """
+        A missing parameter or a south edge above the north edge should raise ValueError.
+        """
+        with self.assertRaises(ValueError):
+            parse_bbox({"south": 0, "west": 0, "north": 0})
+        with self.assertRaises(ValueError):
+            parse_bbox({"south": 10, "west": 0, "north": 0, "east": 0})
+
+    def test_non_finite_box(self):
+        """
+        NaN and infinite edges should raise ValueError, as they cannot be mapped to tiles or geohashes.
+        """
+        for value in ("nan", "inf", "-inf"):
+            for key in ("south", "west", "north", "east"):
+                params = {"south": 0, "west": 0, "north": 0, "east": 0, key: value}
+                with self.subTest(key=key, value=value), self.assertRaises(ValueError):
+                    parse_bbox(params)
+
+    def test_snap_bbox_to_tiles(self):
+        """
+        Boxes inside the same tiles should snap to the same box, which contains them.
+        """
+        first = snap_bbox(-33.93, 18.41, -33.91, 18.43, 12)
+        self.assertEqual(snap_bbox(-33.925, 18.415, -33.915, 18.425, 12), first)
+        south, west, north, east = first
+        self.assertTrue(south <= -33.93 and west <= 18.41 and north >= -33.91 and east >= 18.43)
+
+        self.assertEqual(snap_bbox(-89, -179, 89, 179, 3), (-90, -180, 90, 180))
+        # A box crossing the antimeridian keeps crossing it, unless its sides meet once snapped
+        south, west, north, east = snap_bbox(10, 170, 20, -170, 4)
+        self.assertTrue(west <= 170 and east >= -170 and west > east)
+        self.assertEqual(snap_bbox(10, 10, 20, 5, 1)[1::2], (-180, 180))
+
+
+class DmsTests(SimpleTestCase):
+
+    def test_batch_matches_scalar(self):
+        """
+        The vectorized formatter should agree with to_dms on stored coordinates,
+        including half seconds, values rounding up to 60 seconds and negative zero.
+        """
+        rng = random.Random(0)
+        values = [Decimal(rng.randint(-180_000_000, 180_000_000)).scaleb(-6) for _ in range(2000)]
+        values += [Decimal(v) for v in ("0.001250", "0.003750", "10.999999", "-0.000000", "-180.000000")]
+        floats = [float(v) for v in values]
+        self.assertEqual(to_dms_batch(floats, "lon"), [to_dms(v, "lon") for v in values])
+        latitudes = [v for v in values if abs(v) <= 90]
+        self.assertEqual(to_dms_batch(np.array(latitudes, dtype=float)), [to_dms(v) for v in latitudes])
+
+    def test_format_positions_batch(self):
+        """
+        Positions should be formatted like format_position.
+        """
+        self.assertEqual(
+            format_positions_batch([-34.08, 51.5], [18.86, -0.12]),
+            [format_position(Decimal("-34.08"), Decimal("18.86")), "51°30'0\"N 0°7'12\"W"],
+        )
+        self.assertEqual(format_positions_batch([], []), [])
+
+
+class GeohashTests(SimpleTestCase):
+
+    def test_encode_geohash(self):
+        """
+        Encoding should match the reference geohash implementation.
+        """
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(encode_geohash(-33.92, 18.42), "k3vp51j19")
+
+    def test_prefixes_cover_points_in_bbox(self):
+        """
+        Every point inside a bounding box should start with one of its prefixes.
+        """
+        for bbox in [(-34, 18.4, -33.9, 18.5), (-30, 170, 0, -170), (0, 0, 90, 180)]:
+            prefixes = geohash_prefixes(*bbox)
+            self.assertLessEqual(len(prefixes), 32)
+            south, west, north, east = bbox
+            for latitude in (south, (south + north) / 2, north):
+                for longitude in (west, east):
+                    geohash = encode_geohash(latitude, longitude)
+                    self.assertTrue(any(geohash.startswith(p) for p in prefixes), (bbox, geohash))
+
+    def test_world_needs_no_prefixes(self):
+        """
+        A box covering the whole world should not be broken into prefixes.
+        """
+        self.assertIsNone(geohash_prefixes(-90, -180, 90, 180))
+
+
+class DistanceTests(SimpleTestCase):
+
+    def test_haversine_km(self):
+        """
+        Distances should be computed for every point in the arrays at once.
+        """
+        distances = haversine_km(-33.92, 18.42, np.array([-33.92, 51.5]), np.array([18.42, -0.13]))
+        self.assertAlmostEqual(distances[0], 0.0)
+        self.assertAlmostEqual(distances[1], 9676, delta=10)
+
+    def test_radius_bbox_contains_circle(self):
+        """
+        The box around a circle should contain points at the circle's edge in every direction.
+        """
+        south, west, north, east = radius_bbox(60.0, 179.9, 100)
+        self.assertGreater(west, east)  # Crosses the antimeridian
+        for bearing_point in [(60.0, 179.9 + 1.79), (60.0, 179.9 - 1.79), (60.89, 179.9), (59.11, 179.9)]:
+            self.assertLessEqual(
+                haversine_km(60.0, 179.9, np.array([bearing_point[0]]), np.array([bearing_point[1]]))[0], 100
+            )
+
+        self.assertEqual(radius_bbox(89.0, 0.0, 500)[1::2], (-180, 180))
@@ -0,0 +1,90 @@
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from users.gazetteer import Gazetteer, normalize_address
+from users.geocoding import geocode
+from users.models import GeocodedAddress
+
+User = get_user_model()
+
+GAZETTEER = """name,latitude,longitude,population
+Cape Town,-33.925839,18.423218,3433441
+George,-33.963,22.46173,113248
+Durban,-29.8579,31.0292,3120282
+Somerset West,-34.08401,18.84276,100000
+"""
+
+
+def write_gazetteer(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    path = os.path.join(directory.name, "gazetteer.csv")
+    with open(path, "w") as f:
+        f.write(GAZETTEER)
+    return path
+
+
+class GazetteerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gazetteer = Gazetteer(write_gazetteer(self))
+
+    def test_normalize_address(self):
+        """
+        Case, accents, punctuation and extra spaces should not matter.
+        """
+        self.assertEqual(normalize_address("  12 Rue Crémieux ,, Paris-Centre! "), "12 rue cremieux,paris centre")
+
+    def test_locate_prefers_longest_name_then_population(self):
+        """
+        A longer place name should win over a shorter one, and the bigger place among names of equal length.
+        """
+        self.assertEqual(self.gazetteer.locate("1 main rd,somerset west"), ("-34.08401", "18.84276"))
+        self.assertEqual(self.gazetteer.locate("12 george street,durban"), ("-29.8579", "31.0292"))
+        self.assertIsNone(self.gazetteer.locate("nowhere 5"))
+
+
+class GeocodingTests(TestCase):
+
+    def setUp(self):
+        override = override_settings(GEOCODER_GAZETTEER=write_gazetteer(self))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_geocode_caches_result(self):
+        """
+        Geocoded addresses, found or not, should be stored and reused.
+        """
+        self.assertEqual(geocode("Long Street, Cape Town"), (Decimal("-33.925839"), Decimal("18.423218")))
+        self.assertIsNone(geocode("Atlantis"))
+        self.assertEqual(
+            set(GeocodedAddress.objects.values_list("normalized_address", "latitude")),
+            {("long street,cape town", Decimal("-33.925839")), ("atlantis", None)},
+        )
+        with self.assertNumQueries(0):
+            geocode("long street, CAPE TOWN")
+
+    def test_new_address_sets_coordinates_on_save(self):
+        """
+        Saving a user with a new address and no coordinates should locate the user.
+        """
+        user = User.objects.create(username="user1", address="George")
+        self.assertEqual((user.latitude, user.longitude), (Decimal("-33.963"), Decimal("22.46173")))
+        self.assertEqual(user.latitude_float, -33.963)
+
+        user.latitude = user.longitude = None
+        user.address = "Durban"
+        user.save(update_fields=["address", "latitude", "longitude"])
+        user.refresh_from_db()
+        self.assertEqual(user.latitude, Decimal("-29.857900"))
+
+    def test_coordinates_are_not_overwritten(self):
+        """
+        Coordinates entered by the user should be kept whatever the address.
+        """
+        user = User.objects.create(username="user1", address="George", latitude=-34.08, longitude=18.86)
+        self.assertEqual((user.latitude, user.longitude), (-34.08, 18.86))
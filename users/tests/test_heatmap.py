@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.test import TestCase
+from django.urls import reverse
+
+from users.geo import tile_xy
+from users.heatmap import (
+    HEATMAP_CLUSTER_MAX_ZOOM,
+    HEATMAP_GRID_SHIFT,
+    HEATMAP_GRID_SIZE,
+    _cluster_grid,
+    _user_grid,
+    get_heatmap,
+    render_heatmap,
+)
+
+User = get_user_model()
+
+
+def bin_index(latitude, longitude, zoom):
+    """
+    Return the tile and the index within its grid of the bin containing a point.
+    """
+    bx, by = tile_xy(latitude, longitude, zoom + HEATMAP_GRID_SHIFT)
+    size = HEATMAP_GRID_SIZE
+    return (zoom, bx // size, by // size), (by % size) * size + bx % size
+
+
+class HeatmapTests(TestCase):
+
+    def setUp(self):
+        """
+        Create two users in the same spot in Cape Town and one in London.
+        """
+        cache.clear()
+        User.objects.create(username="user1", latitude=-33.92, longitude=18.42)
+        self.user2 = User.objects.create(username="user2", latitude=-33.92, longitude=18.42)
+        User.objects.create(username="user3", latitude=51.5, longitude=-0.13)
+
+    def test_counts_on_every_zoom_level(self):
+        """
+        Both Cape Town users should be counted in one bin, whether the grid comes from the clusters or the users.
+        """
+        for zoom in (0, HEATMAP_CLUSTER_MAX_ZOOM, HEATMAP_CLUSTER_MAX_ZOOM + 1, 16):
+            tile, index = bin_index(-33.92, 18.42, zoom)
+            grid = render_heatmap(*tile)
+            self.assertEqual(len(grid), HEATMAP_GRID_SIZE**2)
+            self.assertEqual(grid[index], 2, zoom)
+            self.assertEqual(grid.sum(), 3 if zoom == 0 else 2, zoom)
+
+    def test_cluster_and_user_grids_agree(self):
+        """
+        Summing the cluster cells and binning the users should give the same grid.
+        """
+        tile, _ = bin_index(51.5, -0.13, HEATMAP_CLUSTER_MAX_ZOOM)
+        self.assertEqual(_cluster_grid(*tile).tolist(), _user_grid(*tile).tolist())
+
+    def test_cached_grids_follow_moves(self):
+        """
+        Cached grids should be updated in place when a user moves, and match a fresh render.
+        """
+        cape_town, index = bin_index(-33.92, 18.42, 12)
+        london, london_index = bin_index(51.5, -0.13, 12)
+        get_heatmap(*cape_town)
+        get_heatmap(*london)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user2.latitude, self.user2.longitude = 51.5, -0.13
+            self.user2.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_heatmap(*cape_town)[index], 1)
+            self.assertEqual(get_heatmap(*london)[london_index], 2)
+        self.assertEqual(get_heatmap(*london).tolist(), render_heatmap(*london).tolist())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user2.delete()
+        self.assertEqual(get_heatmap(*london)[london_index], 1)
+
+    def test_rolled_back_moves_leave_cached_grids_alone(self):
+        """
+        A move that is rolled back should not be applied to the cached grids.
+        """
+        cape_town, index = bin_index(-33.92, 18.42, 12)
+        get_heatmap(*cape_town)
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.user2.latitude, self.user2.longitude = 51.5, -0.13
+            self.user2.save()
+            raise DatabaseError("Rolled back")
+        self.assertEqual(get_heatmap(*cape_town)[index], 2)
+
+
+class HeatmapTileViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="user1", latitude=-33.92, longitude=18.42)
+
+    def test_sparse_counts(self):
+        """
+        The tile should list only its non-empty bins, for logged-in users.
+        """
+        (z, x, y), index = bin_index(-33.92, 18.42, 5)
+        url = reverse("heatmap_tile", args=[z, x, y])
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {"size": HEATMAP_GRID_SIZE, "cells": [index], "counts": [1], "max": 1})
+
+    def test_invalid_tile(self):
+        """
+        Tile coordinates outside the zoom level's grid should return a 404.
+        """
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("heatmap_tile", args=[2, 0, 4])).status_code, 404)
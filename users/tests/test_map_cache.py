@@ -0,0 +1,97 @@
+import gzip
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from users.map_cache import get_locations_version
+
+User = get_user_model()
+
+
+class LocationsSnapshotTests(TestCase):
+
+    def setUp(self):
+        """
+        Create test users and log in.
+        """
+        cache.clear()
+        self.user1 = User.objects.create_user(
+            username="user1", password="password123", latitude=-33.92, longitude=18.42
+        )
+        self.user2 = User.objects.create_user(username="user2", password="password123", latitude=39.8, longitude=-89.65)
+        self.client.login(username="user1", password="password123")
+        self.url = reverse("location_clusters_api")
+        self.world = {"south": -90, "west": -180, "north": 90, "east": 180, "zoom": 2}
+
+    def test_snapshot_is_served_from_cache(self):
+        """
+        A repeated request should not query the map data again.
+        """
+        first = self.client.get(self.url, self.world)
+        with self.assertNumQueries(2):  # Session and user lookups only
+            second = self.client.get(self.url, self.world)
+        self.assertEqual(first.content, second.content)
+
+    def test_nearby_viewports_share_a_snapshot(self):
+        """
+        Viewports panned within the same tiles should be served the same snapshot.
+        """
+        url = reverse("locations_api")
+        first = self.client.get(url, {"south": -33.924, "west": 18.414, "north": -33.908, "east": 18.434, "zoom": 14})
+        with self.assertNumQueries(2):  # Session and user lookups only
+            second = self.client.get(
+                url, {"south": -33.922, "west": 18.416, "north": -33.91, "east": 18.43, "zoom": 14}
+            )
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual([u["username"] for u in second.json()["users"]], ["user1"])
+
+    @mock.patch("users.map_cache.MIN_COMPRESS_LENGTH", 0)
+    def test_compressed_snapshot(self):
+        """
+        Clients accepting gzip should get the pre-compressed payload.
+        """
+        plain = self.client.get(self.url, self.world)
+        compressed = self.client.get(self.url, self.world, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+    def test_version_bumped_only_by_map_changes(self):
+        """
+        Moving or renaming a user invalidates the snapshots, other profile edits do not.
+        """
+        version = get_locations_version()
+        self.user2.first_name = "Alice"
+        self.user2.save()
+        self.assertEqual(get_locations_version(), version)
+
+        self.client.get(self.url, self.world)
+        self.user2.latitude = 51.5
+        self.user2.save()
+        self.assertGreater(get_locations_version(), version)
+
+        clusters = self.client.get(self.url, self.world).json()["clusters"]
+        self.assertIn(51.5, [c["latitude"] for c in clusters])
+
+    def test_snapshot_built_before_commit_is_not_served(self):
+        """
+        A snapshot built from the old rows while the move is not committed yet should not be served after it.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user2.latitude = 51.5
+            self.user2.save()
+            # A concurrent request still sees the committed rows
+            with mock.patch("users.views.clusters_in_bbox", return_value=[]):
+                self.assertEqual(self.client.get(self.url, self.world).json()["clusters"], [])
+        self.assertNotEqual(self.client.get(self.url, self.world).json()["clusters"], [])
+
+    def test_version_survives_cache_loss(self):
+        """
+        A lost version counter should be re-seeded above the previous value.
+        """
+        version = get_locations_version()
+        cache.clear()
+        self.assertGreater(get_locations_version(), version)
@@ -52,3 +52,56 @@ class UserModelTests(TestCase):
         in degrees–minutes–seconds (DMS) format.
         """
         self.assertEqual(self.user.position, "34°4'48\"S 18°51'36\"E")
+
+    def test_geohash_is_kept_in_sync(self):
+        """
+        Test that the geohash is derived from the coordinates on every save,
+        including saves limited with update_fields, and cleared with them.
+        """
+        self.assertEqual(self.user.geohash, "k3vqj5vmt")
+
+        self.user.latitude = Decimal("57.649110")
+        self.user.longitude = Decimal("10.407440")
+        self.user.save(update_fields=["latitude", "longitude"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.geohash, "u4pruydqq")
+
+        self.user.latitude = None
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.geohash, "")
+
+    def test_denormalized_position_is_kept_in_sync(self):
+        """
+        Test that the stored DMS position and float coordinates follow the coordinates
+        and match the position property.
+        """
+        self.assertEqual(self.user.position_dms, self.user.position)
+        self.assertEqual((self.user.latitude_float, self.user.longitude_float), (-34.08, 18.86))
+
+        self.user.latitude = 57.6491104
+        self.user.save(update_fields=["latitude"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.latitude_float, 57.64911)
+        self.assertEqual(self.user.position_dms, self.user.position)
+
+        self.user.longitude = None
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.position_dms, "")
+        self.assertIsNone(self.user.latitude_float)
+
+    def test_save_changes_writes_changed_fields_only(self):
+        """
+        Only fields whose value changed should be written, and nothing when none did.
+        """
+        user = User.objects.get(pk=self.user.pk)
+        user.latitude = Decimal("-34.08")  # The stored value, written differently
+        with self.assertNumQueries(0):
+            self.assertEqual(user.save_changes(), frozenset())
+
+        user.first_name = "Jane"
+        self.assertEqual(user.changed_fields(), {"first_name"})
+        with self.assertNumQueries(1):
+            self.assertEqual(user.save_changes(), {"first_name"})
+        self.assertEqual(user.changed_fields(), frozenset())
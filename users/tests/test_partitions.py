@@ -0,0 +1,54 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from users.models import AuthEvent
+from users.partitions import add_months, is_partitioned, month_partitions, partition_name
+
+User = get_user_model()
+
+
+class AuthEventPartitionTests(TestCase):
+
+    def setUp(self):
+        """
+        Create a user with a recent and an expired auth event.
+        """
+        self.user = User.objects.create(username="user1")
+        self.old = AuthEvent.objects.create(
+            user=self.user, event_type="login", channel="site", timestamp=timezone.now() - timedelta(days=600)
+        )
+        self.recent = AuthEvent.objects.create(user=self.user, event_type="logout", channel="admin")
+
+    def test_table_is_partitioned_by_month(self):
+        """
+        The migrations should leave a partition for the current month and the coming months.
+        """
+        self.assertTrue(is_partitioned())
+        this_month = timezone.localdate().replace(day=1)
+        self.assertIn(add_months(this_month, 3), month_partitions())
+
+    def test_expired_months_are_archived_and_dropped(self):
+        """
+        Expired events should be written to a compressed JSONL archive and their partition dropped.
+        """
+        old_month = timezone.localtime(self.old.timestamp).date().replace(day=1)
+        with tempfile.TemporaryDirectory() as directory:
+            call_command("auth_event_partitions", retention_months=12, archive_dir=directory, stdout=StringIO())
+
+            with gzip.open(os.path.join(directory, f"{partition_name(old_month)}.jsonl.gz"), "rt") as archive:
+                rows = [json.loads(line) for line in archive]
+
+        self.assertEqual(
+            [(row["id"], row["event_type"], row["user_id"]) for row in rows], [(self.old.pk, "login", self.user.pk)]
+        )
+        self.assertEqual(list(AuthEvent.objects.values_list("pk", flat=True)), [self.recent.pk])
+        self.assertNotIn(old_month, month_partitions())
@@ -0,0 +1,142 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, modify_settings, override_settings
+from django.urls import reverse
+
+from pin_people import routers
+from pin_people.routers import PRIMARY_COOKIE, ReplicaStickinessMiddleware, read_from_replicas, replica_lag
+
+User = get_user_model()
+
+REPLICA_SETTINGS = {
+    "DATABASE_REPLICAS": ["replica_1", "replica_2"],
+    "DATABASE_ROUTERS": ["pin_people.routers.ReplicaRouter"],
+    "DATABASE_REPLICA_MAX_LAG": 5,
+    "DATABASE_REPLICA_LAG_CHECK_INTERVAL": 60,
+}
+
+
+@read_from_replicas
+def read_alias_view(request):
+    """
+    Answer with the database the router picks for reading users.
+    """
+    return HttpResponse(router.db_for_read(User))
+
+
+@override_settings(**REPLICA_SETTINGS)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        routers._lag_checks.clear()
+        self.factory = RequestFactory()
+        self.lags = {"replica_1": 0.5, "replica_2": 30}
+        patcher = mock.patch("pin_people.routers.replica_lag", side_effect=self.lags.get)
+        self.replica_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_alias(self, request, view=read_alias_view):
+        """
+        Return the database the router picked inside `view` for a request that went through the middleware.
+        """
+        response = ReplicaStickinessMiddleware(view)(request)
+        return response.content.decode(), response
+
+    def test_reads_go_to_a_healthy_replica(self):
+        """
+        Reads of a wrapped view should go to a replica, skipping the lagging one; writes to the primary.
+        """
+        self.assertEqual(self.read_alias(self.factory.get("/"))[0], "replica_1")
+        self.assertEqual(router.db_for_write(User), "default")
+
+    def test_lagging_or_unreachable_replicas_are_skipped(self):
+        """
+        Without a replica within the lag bound, reads should go to the primary.
+        """
+        self.lags.update(replica_1=None)
+        self.assertEqual(self.read_alias(self.factory.get("/"))[0], "default")
+
+    def test_lag_is_measured_once_per_interval(self):
+        """
+        The lag of each replica should be measured at most once per interval.
+        """
+        self.read_alias(self.factory.get("/"))
+        self.read_alias(self.factory.get("/"))
+        self.assertEqual(self.replica_lag.call_count, 2)
+
+    def test_reads_outside_wrapped_views_go_to_the_primary(self):
+        """
+        Requests other than GET and HEAD, views that were not wrapped and code outside
+        requests should read from the primary.
+        """
+        self.assertEqual(self.read_alias(self.factory.post("/"))[0], "default")
+        self.assertEqual(self.read_alias(self.factory.get("/"), read_alias_view.__wrapped__)[0], "default")
+        self.assertEqual(router.db_for_read(User), "default")
+
+    def test_reads_in_transactions_go_to_the_primary(self):
+        """
+        Reads inside a transaction on the primary must see its writes.
+        """
+        with mock.patch.object(connection, "in_atomic_block", True):
+            self.assertEqual(self.read_alias(self.factory.get("/"))[0], "default")
+
+    def test_writes_stick_to_the_primary(self):
+        """
+        After a write, the rest of the request and the client's next requests within
+        the stickiness window should read from the primary.
+        """
+
+        @read_from_replicas
+        def view(request):
+            router.db_for_write(User)
+            return HttpResponse(router.db_for_read(User))
+
+        alias, response = self.read_alias(self.factory.get("/"), view)
+        self.assertEqual(alias, "default")
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], 15)
+
+        request = self.factory.get("/")
+        request.COOKIES[PRIMARY_COOKIE] = "1"
+        self.assertEqual(self.read_alias(request)[0], "default")
+
+        alias, response = self.read_alias(self.factory.get("/"))
+        self.assertEqual(alias, "replica_1")
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_migrations_run_on_the_primary(self):
+        self.assertTrue(router.allow_migrate("default", "users"))
+        self.assertFalse(router.allow_migrate("replica_1", "users"))
+
+
+class ReplicaLagTests(TestCase):
+
+    def test_primary_has_no_lag(self):
+        """
+        The lag query should report a database that is not a replica as up to date.
+        """
+        self.assertEqual(replica_lag(connection.alias), 0)
+
+
+@override_settings(DATABASE_REPLICAS=["default"], DATABASE_ROUTERS=["pin_people.routers.ReplicaRouter"])
+@modify_settings(MIDDLEWARE={"prepend": "pin_people.routers.ReplicaStickinessMiddleware"})
+class ReplicaStickinessViewTests(TestCase):
+
+    def setUp(self):
+        routers._lag_checks.clear()
+        self.user = User.objects.create(username="user1", first_name="Ann")
+        self.client.force_login(self.user)
+
+    def test_saving_the_profile_sticks_to_the_primary(self):
+        """
+        Saving the profile should mark the client to read from the primary; only reading pages should not.
+        """
+        response = self.client.get(reverse("profile"))
+        self.assertContains(response, "Ann")
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+        response = self.client.post(reverse("profile_change"), {"username": "user1", "first_name": "Beth"})
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], 15)
+        self.assertContains(self.client.get(reverse("profile")), "Beth")
@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from users.geo import tile_xy
+from users.tiles import TILE_CONTENT_TYPE, encode_layer, get_tile
+
+User = get_user_model()
+
+
+class EncodeLayerTests(TestCase):
+
+    def test_encode_point_layer(self):
+        """
+        A layer with one point should match the MVT protobuf encoding byte for byte.
+        """
+        tile = encode_layer("users", [(5, 100, -20, {"username": "bob"})])
+        layer = (
+            b"\x78\x02"  # version = 2
+            + b"\x0a\x05users"  # name
+            + b"\x12\x0e"  # feature
+            + b"\x08\x05"  # id = 5
+            + b"\x12\x02\x00\x00"  # tags = [key 0, value 0]
+            + b"\x18\x01"  # type = POINT
+            + b"\x22\x04\x09\xc8\x01\x27"  # geometry = MoveTo(100, -20)
+            + b"\x1a\x08username"  # keys
+            + b"\x22\x05\x0a\x03bob"  # values
+            + b"\x28\x80\x20"  # extent = 4096
+        )
+        self.assertEqual(tile, b"\x1a" + bytes([len(layer)]) + layer)
+
+    def test_empty_layer(self):
+        """
+        A layer without features should not be encoded at all.
+        """
+        self.assertEqual(encode_layer("users", []), b"")
+
+
+class UserTileViewTests(TestCase):
+
+    def setUp(self):
+        """
+        Create a test user in Cape Town and log in.
+        """
+        cache.clear()
+        self.user = User.objects.create_user(username="user1", password="password123", latitude=-33.92, longitude=18.42)
+        self.client.login(username="user1", password="password123")
+
+    def tile_url(self, zoom, latitude=-33.92, longitude=18.42):
+        return reverse("user_tile", args=[zoom, *tile_xy(latitude, longitude, zoom)])
+
+    def test_cluster_and_user_tiles(self):
+        """
+        Zoomed-out tiles should hold the clusters layer, deep tiles the users layer.
+        """
+        response = self.client.get(self.tile_url(3))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], TILE_CONTENT_TYPE)
+        self.assertIn(b"clusters", response.content)
+        self.assertIn(b"user1", response.content)
+
+        response = self.client.get(self.tile_url(16))
+        self.assertIn(b"\x0a\x05users", response.content)
+        self.assertIn(b"user1", response.content)
+
+    def test_tiles_are_cached_and_invalidated_on_move(self):
+        """
+        A cached tile should be served without queries until a user in it moves away.
+        """
+        url = self.tile_url(16)
+        self.client.get(url)
+        with self.assertNumQueries(2):  # Session and user lookups only
+            self.assertIn(b"user1", self.client.get(url).content)
+
+        self.user.latitude, self.user.longitude = 51.5, -0.13
+        self.user.save()
+        self.assertNotIn(b"user1", self.client.get(url).content)
+        self.assertIn(b"user1", self.client.get(self.tile_url(16, 51.5, -0.13)).content)
+
+    def test_tile_rendered_before_commit_is_dropped(self):
+        """
+        A tile rendered from the old rows while the move is not committed yet should not stay cached.
+        """
+        z, (x, y) = 16, tile_xy(-33.92, 18.42, 16)
+        stale = get_tile(z, x, y)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.latitude, self.user.longitude = 51.5, -0.13
+            self.user.save()
+            # A concurrent request still sees the committed rows
+            with mock.patch("users.tiles.render_tile", return_value=stale):
+                self.assertIn(b"user1", get_tile(z, x, y))
+        self.assertNotIn(b"user1", get_tile(z, x, y))
+
+    def test_invalid_tile(self):
+        """
+        Tile coordinates outside the zoom level's grid should return a 404.
+        """
+        response = self.client.get(reverse("user_tile", args=[2, 4, 0]))
+        self.assertEqual(response.status_code, 404)
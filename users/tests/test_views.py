@@ -1,10 +1,21 @@
+import gzip
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
+import numpy as np
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from users.forms import CustomUserChangeForm, CustomUserCreationForm
+from users.geo import haversine_km
+from users.nearby import MAX_SEARCH_STEPS, nearest_users
+from users.signals import user_fields_changed
 
 User = get_user_model()
 
@@ -53,6 +64,29 @@ class LoginViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "Please enter a correct username and password.")
 
+    def test_login_redirects_to_next(self):
+        """
+        A safe "next" URL should be followed after logging in, an external one ignored.
+        """
+        credentials = {"username": "testuser", "password": "secret123"}
+        response = self.client.post(f"{self.login_url}?next=/users/profile/", credentials)
+        self.assertRedirects(response, reverse("profile"))
+
+        response = self.client.post(f"{self.login_url}?next=https://example.com/", credentials)
+        self.assertRedirects(response, reverse("location"))
+
+    def test_login_sheds_load_when_hashing_pool_is_full(self):
+        """
+        When every hashing slot is taken, the login should be refused with a 503 instead of queued.
+        """
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with ThreadPoolExecutor(1) as executor, mock.patch("users.hashing._pool", return_value=(executor, slots)):
+            response = self.client.post(self.login_url, {"username": "testuser", "password": "secret123"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertNotIn("_auth_user_id", self.client.session)
+
 
 class LogoutViewTest(TestCase):
 
@@ -137,6 +171,17 @@ class RegisterViewTests(TestCase):
         self.assertFalse(User.objects.filter(username="newuser").exists())
         self.assertTrue(response.context["form"].errors)
 
+    def test_post_register_view_hashes_password(self):
+        """
+        The password of a registered user should be hashed, so the user can log in with it.
+        """
+        form_data = {"username": "newuser", "password1": "strongpassword123", "password2": "strongpassword123"}
+        self.client.post(reverse("register"), form_data)
+
+        user = User.objects.get(username="newuser")
+        self.assertNotEqual(user.password, "strongpassword123")
+        self.assertTrue(user.check_password("strongpassword123"))
+
 
 class LocationViewTests(TestCase):
 
@@ -173,7 +218,6 @@ class LocationViewTests(TestCase):
         self.assertTemplateUsed(response, "users/location.html")
 
         # Check context keys
-        self.assertIn("users_json", response.context)
         self.assertIn("logged_in_user_id", response.context)
         self.assertIn("is_superuser", response.context)
 
@@ -183,16 +227,260 @@ class LocationViewTests(TestCase):
         # Verify the superuser flag
         self.assertFalse(response.context["is_superuser"])
 
-        # Verify users_json contains only the users with coordinates
-        users_data = json.loads(response.context["users_json"])
-        self.assertEqual(len(users_data), 2)
-        self.assertTrue(all("latitude" in u and "longitude" in u for u in users_data))
+        # Users are fetched by the map from the locations API, not embedded in the page
+        self.assertNotIn("users_json", response.context)
+        self.assertContains(response, reverse("locations_api"))
+
+    def test_reload_of_unchanged_page_is_not_modified(self):
+        """
+        A reload with a matching If-None-Match should get a 304 without rendering the page.
+        """
+        self.client.login(username="user1", password="password123")
+        url = reverse("location")
+        response = self.client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+
+        # The session and the logged-in user are the only queries
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+
+class LocationsApiViewTests(TestCase):
+
+    def setUp(self):
+        """
+        Create test users.
+        """
+        self.user1 = User.objects.create_user(
+            username="user1", password="password123", latitude=-34.08, longitude=18.86
+        )
+        self.user2 = User.objects.create_user(username="user2", password="password123", latitude=None, longitude=None)
+        self.user3 = User.objects.create_user(username="user3", password="password123", latitude=39.8, longitude=-89.65)
+        self.user4 = User.objects.create_user(username="user4", password="password123", latitude=-17.7, longitude=178.0)
+        self.url = reverse("locations_api")
+        self.world = {"south": -90, "west": -180, "north": 90, "east": 180, "zoom": 2}
+
+    def test_requires_login(self):
+        """
+        The API should redirect to login if not authenticated.
+        """
+        response = self.client.get(self.url, self.world)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse("login"), response.url)
+
+    def test_returns_users_inside_bbox(self):
+        """
+        Only users with coordinates inside the bounding box should be returned.
+        """
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(self.url, {"south": -40, "west": 10, "north": -30, "east": 20, "zoom": 6})
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data["zoom"], 6)
+        self.assertIsNone(data["next_cursor"])
+        self.assertEqual(
+            data["users"],
+            [
+                {
+                    "id": self.user1.id,
+                    "username": "user1",
+                    "latitude": -34.08,
+                    "longitude": 18.86,
+                    "position": "34°4'48\"S 18°51'36\"E",
+                }
+            ],
+        )
+
+    def test_bbox_crossing_antimeridian(self):
+        """
+        A bounding box whose west edge is east of its east edge should wrap around.
+        """
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(self.url, {"south": -30, "west": 170, "north": 0, "east": -170, "zoom": 4})
+        usernames = [u["username"] for u in response.json()["users"]]
+        self.assertEqual(usernames, ["user4"])
+
+    def test_users_written_without_save(self):
+        """
+        Users whose float coordinates were never filled should be returned with the decimal ones.
+        """
+        User.objects.filter(pk=self.user1.pk).update(latitude_float=None, longitude_float=None)
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(self.url, {"south": -40, "west": 10, "north": -30, "east": 20, "zoom": 6})
+        user = response.json()["users"][0]
+        self.assertEqual((user["latitude"], user["longitude"]), (-34.08, 18.86))
+
+    def test_cursor_pagination(self):
+        """
+        The limit caps each page and next_cursor fetches the remaining users.
+        """
+        self.client.login(username="user1", password="password123")
+        first = self.client.get(self.url, {**self.world, "limit": 2}).json()
+        self.assertEqual([u["username"] for u in first["users"]], ["user1", "user3"])
+        self.assertEqual(first["next_cursor"], self.user3.id)
+
+        second = self.client.get(self.url, {**self.world, "limit": 2, "cursor": first["next_cursor"]}).json()
+        self.assertEqual([u["username"] for u in second["users"]], ["user4"])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_invalid_parameters(self):
+        """
+        Missing or malformed parameters should return a 400 with an error message.
+        """
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(self.url, {"south": -40, "west": 10, "north": -30, "zoom": 6})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("east", response.json()["error"])
+
+        response = self.client.get(self.url, {**self.world, "zoom": "far"})
+        self.assertEqual(response.status_code, 400)
+
+        for value in ("nan", "inf"):
+            response = self.client.get(self.url, {**self.world, "south": value})
+            self.assertEqual(response.status_code, 400)
+
+
+class LocationClustersApiViewTests(TestCase):
+
+    def setUp(self):
+        """
+        Create test users.
+        """
+        self.user1 = User.objects.create_user(
+            username="user1", password="password123", latitude=-33.92, longitude=18.42
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="password123", latitude=-33.93, longitude=18.43
+        )
+        self.user3 = User.objects.create_user(username="user3", password="password123", latitude=39.8, longitude=-89.65)
+        self.url = reverse("location_clusters_api")
+        self.client.login(username="user1", password="password123")
+
+    def test_world_view_returns_clusters(self):
+        """
+        Zoomed-out requests should return aggregated clusters and no individual users.
+        """
+        response = self.client.get(self.url, {"south": -90, "west": -180, "north": 90, "east": 180, "zoom": 2})
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data["users"], [])
+        self.assertIsNone(data["next_cursor"])
+        self.assertEqual(sorted(c["count"] for c in data["clusters"]), [1, 2])
+
+        cape_town = max(data["clusters"], key=lambda c: c["count"])
+        self.assertAlmostEqual(cape_town["latitude"], -33.925)
+        self.assertAlmostEqual(cape_town["longitude"], 18.425)
+        self.assertEqual(cape_town["usernames"], ["user1", "user2"])
+
+    def test_clusters_are_limited_to_bbox(self):
+        """
+        Only clusters whose cells intersect the bounding box should be returned.
+        """
+        response = self.client.get(self.url, {"south": 30, "west": -100, "north": 50, "east": -80, "zoom": 4})
+        self.assertEqual([c["usernames"] for c in response.json()["clusters"]], [["user3"]])
+
+    def test_deep_zoom_returns_users(self):
+        """
+        Beyond the deepest cluster level individual users should be returned with their positions.
+        """
+        response = self.client.get(self.url, {"south": -34, "west": 18.4, "north": -33.9, "east": 18.5, "zoom": 15})
+        data = response.json()
+        self.assertEqual(data["clusters"], [])
+        self.assertEqual([u["username"] for u in data["users"]], ["user1", "user2"])
+        self.assertEqual(data["users"][0]["position"], "33°55'12\"S 18°25'12\"E")
+
+    def test_invalid_parameters(self):
+        """
+        Malformed parameters should return a 400.
+        """
+        response = self.client.get(self.url, {"south": "x", "west": 0, "north": 0, "east": 0, "zoom": 2})
+        self.assertEqual(response.status_code, 400)
+
+        for value in ("nan", "inf"):
+            response = self.client.get(self.url, {"south": 0, "west": value, "north": 0, "east": 0, "zoom": 2})
+            self.assertEqual(response.status_code, 400)
+
+    def test_revalidation(self):
+        """
+        A matching If-None-Match should get a 304 until a user on the map moves.
+        """
+        params = {"south": -90, "west": -180, "north": 90, "east": 180, "zoom": 2}
+        etag = self.client.get(self.url, params)["ETag"]
+
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
 
-        # Verify usernames
-        usernames = [u["username"] for u in users_data]
-        self.assertIn("user1", usernames)
-        self.assertIn("admin", usernames)
-        self.assertNotIn("user2", usernames)
+        self.user3.latitude = 40.0
+        self.user3.save()
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ExportLocationsViewTests(TestCase):
+
+    def setUp(self):
+        """
+        Create test users.
+        """
+        self.staff = User.objects.create_user(
+            username="staff", password="password123", is_staff=True, latitude=-33.92, longitude=18.42
+        )
+        self.user1 = User.objects.create_user(username="user1", password="password123", latitude=39.8, longitude=-89.65)
+        self.user2 = User.objects.create_user(username="user2", password="password123")
+        self.url = reverse("export_locations")
+
+    def test_regular_user_cannot_export(self):
+        """
+        Only staff should be able to export locations.
+        """
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_geojson_export(self):
+        """
+        The default export should be a GeoJSON FeatureCollection of the users with coordinates.
+        """
+        self.client.login(username="staff", password="password123")
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["type"], "FeatureCollection")
+        self.assertEqual([f["properties"]["username"] for f in data["features"]], ["staff", "user1"])
+        self.assertEqual(data["features"][1]["geometry"]["coordinates"], [-89.65, 39.8])
+
+    def test_gzipped_ndjson_export(self):
+        """
+        NDJSON exports should hold one user per line and be compressed for clients accepting gzip.
+        """
+        self.client.login(username="staff", password="password123")
+        response = self.client.get(self.url, {"format": "ndjson"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [
+                {"id": self.staff.id, "username": "staff", "latitude": -33.92, "longitude": 18.42},
+                {"id": self.user1.id, "username": "user1", "latitude": 39.8, "longitude": -89.65},
+            ],
+        )
+
+    def test_unknown_format(self):
+        """
+        An unknown format should return a 400.
+        """
+        self.client.login(username="staff", password="password123")
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response.status_code, 400)
 
 
 class ProfileViewTests(TestCase):
@@ -245,6 +533,136 @@ class ProfileViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertIn(reverse("login"), response.url)
 
+    def test_unchanged_profile_is_not_modified(self):
+        """
+        Revalidating a profile should get a 304 until the profile changes.
+        """
+        self.client.login(username="admin", password="adminpass")
+        url = reverse("user_detail", args=[self.user1.id])
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.user1.first_name = "Changed"
+        self.user1.save(update_fields=["first_name"])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Changed")
+
+    def test_profile_is_rendered_from_cache_until_saved(self):
+        """
+        A profile should be served from the cache until the user is saved.
+        """
+        cache.clear()
+        self.client.login(username="admin", password="adminpass")
+        url = reverse("user_detail", args=[self.user1.id])
+        self.assertContains(self.client.get(url), "user1")
+
+        # A queryset update does not bump updated_at, so the cached rendering is still used
+        User.objects.filter(pk=self.user1.pk).update(first_name="Stale")
+        self.assertNotContains(self.client.get(url), "Stale")
+
+        self.client.post(reverse("user_change", args=[self.user1.id]), {"username": "user1", "first_name": "Fresh"})
+        self.assertContains(self.client.get(url), "Fresh")
+
+    def test_superuser_gets_404_for_missing_profile(self):
+        """
+        A superuser asking for a user that does not exist should get a 404.
+        """
+        self.client.login(username="admin", password="adminpass")
+        response = self.client.get(reverse("user_detail", args=[self.user1.id + 1000]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_forbidden_profile_has_no_etag(self):
+        """
+        A profile the user may not view should not be answered from validators.
+        """
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(reverse("user_detail", args=[self.user2.id]), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("ETag", response)
+
+
+class NearbyUsersViewTests(TestCase):
+
+    def setUp(self):
+        """
+        Create users at increasing distances from Cape Town.
+        """
+        self.user1 = User.objects.create_user(
+            username="user1", password="password123", latitude=-33.92, longitude=18.42
+        )
+        self.stellenbosch = User.objects.create_user(
+            username="stellenbosch", password="password123", latitude=-33.93, longitude=18.86
+        )
+        self.johannesburg = User.objects.create_user(
+            username="johannesburg", password="password123", latitude=-26.2, longitude=28.04
+        )
+        self.london = User.objects.create_user(
+            username="london", password="password123", latitude=51.5, longitude=-0.13
+        )
+        self.no_location = User.objects.create_user(username="no_location", password="password123")
+        self.url = reverse("nearby_users")
+
+    def test_nearest_to_logged_in_user(self):
+        """
+        Without coordinates the logged-in user's location is used and they are left out.
+        """
+        self.client.login(username="user1", password="password123")
+        response = self.client.get(self.url, {"k": 2})
+        self.assertEqual(response.status_code, 200)
+
+        users = response.json()["users"]
+        self.assertEqual([u["username"] for u in users], ["stellenbosch", "johannesburg"])
+        self.assertAlmostEqual(users[0]["distance_km"], 40.6, delta=0.5)
+        self.assertAlmostEqual(users[1]["distance_km"], 1264, delta=5)
+        self.assertEqual(users[0]["position"], "33°55'48\"S 18°51'36\"E")
+
+    def test_nearest_to_arbitrary_point(self):
+        """
+        Search widens until it finds k users, across hemispheres if needed.
+        """
+        self.client.login(username="no_location", password="password123")
+        response = self.client.get(self.url, {"latitude": 48.85, "longitude": 2.35, "k": 10})
+        usernames = [u["username"] for u in response.json()["users"]]
+        self.assertEqual(usernames, ["london", "johannesburg", "user1", "stellenbosch"])
+
+    @mock.patch("users.nearby.CANDIDATE_FACTOR", 2)
+    def test_candidate_queries_are_capped(self):
+        """
+        Every candidate query should load a bounded number of rows, in a crowded area as well as
+        far from everyone, and the nearest users should still be found.
+        """
+        crowd = [User(username=f"crowd{n}", latitude=51.5, longitude=-0.13 + n / 1000) for n in range(20)]
+        for user in crowd:
+            user.update_location_fields()
+        User.objects.bulk_create(crowd)
+
+        for latitude, longitude in ((51.5, -0.13), (0.0, -150.0)):
+            with CaptureQueriesContext(connection) as queries:
+                found = nearest_users(latitude, longitude, k=3)
+            self.assertEqual(len(found), 3)
+            self.assertLessEqual(len(queries), MAX_SEARCH_STEPS + 1)
+            self.assertTrue(all(query["sql"].endswith("LIMIT 6") for query in queries))
+
+            users = User.objects.exclude(latitude_float=None)
+            distances = haversine_km(
+                latitude, longitude, [u.latitude_float for u in users], [u.longitude_float for u in users]
+            )
+            np.testing.assert_allclose([row[-1] for row in found], sorted(distances)[:3], atol=1e-9)
+
+    def test_user_without_location_must_pass_coordinates(self):
+        """
+        A user without a saved location gets a 400 unless coordinates are passed.
+        """
+        self.client.login(username="no_location", password="password123")
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.url, {"latitude": 100, "longitude": 0})
+        self.assertEqual(response.status_code, 400)
+
 
 class ProfileChangeViewTests(TestCase):
 
@@ -280,6 +698,30 @@ class ProfileChangeViewTests(TestCase):
         self.assertIsInstance(response.context["form"], CustomUserChangeForm)
         self.assertEqual(response.context["user"], self.user1)
 
+    def test_unchanged_profile_is_not_written(self):
+        """
+        Submitting the form unchanged should not write the user, and a change should
+        only write and report the fields that changed.
+        """
+        self.client.login(username="user1", password="password123")
+        self.user1.refresh_from_db()
+        data = {"username": "user1", "email": "user1@example.com"}
+        changes = []
+
+        def receiver(sender, changed_fields, **kwargs):
+            changes.append(changed_fields)
+
+        user_fields_changed.connect(receiver, sender=User)
+        self.addCleanup(user_fields_changed.disconnect, receiver, sender=User)
+
+        self.client.post(reverse("profile_change"), data)
+        self.assertEqual(User.objects.get(pk=self.user1.pk).updated_at, self.user1.updated_at)
+        self.assertEqual(changes, [])
+
+        self.client.post(reverse("profile_change"), {**data, "first_name": "Ann"})
+        self.assertEqual(changes, [{"first_name"}])
+        self.assertEqual(User.objects.get(pk=self.user1.pk).first_name, "Ann")
+
     def test_regular_user_can_edit_own_profile_post(self):
         """
         Test that a regular user can update their own profile (POST).
@@ -295,6 +737,21 @@ class ProfileChangeViewTests(TestCase):
 
         self.assertRedirects(response, reverse("user_detail", args=[self.user1.id]))
 
+    def test_email_taken_after_validation(self):
+        """
+        When another user takes the email between validation and saving, the form should
+        be shown again with the error instead of failing.
+        """
+        self.client.login(username="user1", password="password123")
+        data = {"username": "user1", "email": "USER2@example.com"}
+        with mock.patch.object(User, "validate_constraints"):
+            response = self.client.post(reverse("profile_change"), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["form"].errors["email"], ["This email is already in use."])
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.email, "user1@example.com")
+
     def test_regular_user_cannot_edit_another_user(self):
         """
         Test that a regular user cannot edit someone else's profile.
@@ -0,0 +1,221 @@
+"""
+Mapbox Vector Tiles (MVT) for the user map.
+
+Tiles are encoded straight from the database into the MVT protobuf format
+(https://github.com/mapbox/vector-tile-spec/tree/master/2.1), cached per tile and
+invalidated only for the tiles around the old and new position of a user that moved.
+Up to CLUSTER_MAX_ZOOM tiles hold a "clusters" layer built from the precomputed
+map clusters; deeper tiles hold a "users" layer with one point per user.
+"""
+
+import math
+import struct
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .clusters import CLUSTER_CELL_SHIFT, CLUSTER_MAX_ZOOM
+from .geo import MAX_LONGITUDE, MAX_ZOOM, MIN_LONGITUDE, bbox_q, tile_bounds, tile_fraction
+from .models import MapCluster, float_coordinates
+
+User = get_user_model()
+
+TILE_EXTENT = 4096
+# Points this many tile units outside a tile are still encoded in it, so markers
+# straddling a tile edge are not cut off
+TILE_BUFFER = 64
+MAX_TILE_FEATURES = 10000
+TILE_CACHE_TIMEOUT = 60 * 60 * 24
+TILE_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+# Part of every tile cache key; bumped to drop all cached tiles at once
+TILES_GENERATION_KEY = "users:tile:generation"
+
+# Protobuf wire types and the MVT point geometry command
+_VARINT, _LENGTH_DELIMITED = 0, 2
+_MOVE_TO_ONE_POINT = (1 & 0x7) | (1 << 3)
+_POINT = 1
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, wire_type):
+    return _varint(number << 3 | wire_type)
+
+
+def _message(number, payload):
+    return _field(number, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _message(number, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return _message(1, value.encode())
+    if isinstance(value, bool):
+        return _field(7, _VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        return _field(5, _VARINT) + _varint(value) if value >= 0 else _field(6, _VARINT) + _varint(_zigzag(value))
+    return _field(3, 1) + struct.pack("<d", value)
+
+
+def encode_layer(name, features):
+    """
+    Encode one MVT layer of point features.
+    `features` is an iterable of (id, x, y, properties) with x/y in tile units.
+    """
+    keys, values, encoded_features = {}, {}, []
+    for feature_id, x, y, properties in features:
+        tags = []
+        for key, value in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value, len(values)))
+        encoded_features.append(
+            _field(1, _VARINT)
+            + _varint(feature_id)
+            + _packed(2, tags)
+            + _field(3, _VARINT)
+            + _varint(_POINT)
+            + _packed(4, [_MOVE_TO_ONE_POINT, _zigzag(x), _zigzag(y)])
+        )
+    if not encoded_features:
+        return b""
+
+    layer = _field(15, _VARINT) + _varint(2) + _message(1, name.encode())
+    layer += b"".join(_message(2, feature) for feature in encoded_features)
+    layer += b"".join(_message(3, key.encode()) for key in keys)
+    layer += b"".join(_message(4, _encode_value(value)) for value in values)
+    layer += _field(5, _VARINT) + _varint(TILE_EXTENT)
+    # A tile is a message whose layers are field 3
+    return _message(3, layer)
+
+
+def _tile_point(latitude, longitude, z, x, y):
+    fx, fy = tile_fraction(latitude, longitude, z)
+    return round((fx - x) * TILE_EXTENT), round((fy - y) * TILE_EXTENT)
+
+
+def _cluster_features(z, x, y):
+    scale = 1 << CLUSTER_CELL_SHIFT
+    clusters = MapCluster.objects.filter(
+        zoom=z,
+        cell_x__gte=x * scale,
+        cell_x__lt=(x + 1) * scale,
+        cell_y__gte=y * scale,
+        cell_y__lt=(y + 1) * scale,
+    )
+    for c in clusters[:MAX_TILE_FEATURES]:
+        px, py = _tile_point(c.latitude_sum / c.count, c.longitude_sum / c.count, z, x, y)
+        yield c.pk, px, py, {"count": c.count, "usernames": ", ".join(c.sample_usernames)}
+
+
+def _user_features(z, x, y):
+    margin = TILE_BUFFER / TILE_EXTENT
+    _, west, north, _ = tile_bounds(x - margin, y - margin, z)
+    south, _, _, east = tile_bounds(x + margin, y + margin, z)
+    bbox = (south, max(west, MIN_LONGITUDE), north, min(east, MAX_LONGITUDE))
+    users = User.objects.filter(bbox_q(*bbox)).order_by("id")
+    rows = users.values_list("id", "username", *float_coordinates(), "position_dms")
+    for user_id, username, latitude, longitude, position in rows[:MAX_TILE_FEATURES]:
+        px, py = _tile_point(latitude, longitude, z, x, y)
+        yield user_id, px, py, {"id": user_id, "username": username, "position": position}
+
+
+def render_tile(z, x, y):
+    """
+    Encode the vector tile z/x/y from the database.
+    """
+    if z <= CLUSTER_MAX_ZOOM:
+        return encode_layer("clusters", _cluster_features(z, x, y))
+    return encode_layer("users", _user_features(z, x, y))
+
+
+def tiles_generation():
+    """
+    Return the current tile generation, part of the cache key of every vector and heatmap tile.
+    """
+    generation = cache.get(TILES_GENERATION_KEY)
+    if generation is None:
+        # Seeded from the clock like the locations version, see users.map_cache
+        cache.add(TILES_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(TILES_GENERATION_KEY)
+    return generation
+
+
+def _cache_key(generation, z, x, y):
+    return f"users:tile:{generation}:{z}:{x}:{y}"
+
+
+def get_tile(z, x, y):
+    """
+    Return the encoded vector tile z/x/y, from the cache when possible.
+    """
+    key = _cache_key(tiles_generation(), z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = render_tile(z, x, y)
+        cache.set(key, tile, TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def _tiles_containing(latitude, longitude):
+    """
+    Yield every tile, on every zoom level, whose buffered area contains a point.
+    """
+    margin = TILE_BUFFER / TILE_EXTENT
+    for z in range(MAX_ZOOM + 1):
+        last = (1 << z) - 1
+        fx, fy = tile_fraction(latitude, longitude, z)
+        xs = {min(max(math.floor(fx + d), 0), last) for d in (-margin, 0, margin)}
+        ys = {min(max(math.floor(fy + d), 0), last) for d in (-margin, 0, margin)}
+        for x in xs:
+            for y in ys:
+                yield z, x, y
+
+
+def invalidate_tiles(old, new):
+    """
+    Drop the cached tiles showing a user's old or new map point, now and again once the
+    current transaction commits, so a tile rendered from the old rows in between does
+    not stay cached.
+    Both are (latitude, longitude, username) tuples or None.
+    """
+    generation = tiles_generation()
+    keys = {
+        _cache_key(generation, *tile) for point in (old, new) if point for tile in _tiles_containing(point[0], point[1])
+    }
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _bump_tiles_generation():
+    try:
+        cache.incr(TILES_GENERATION_KEY)
+    except ValueError:
+        cache.set(TILES_GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate_all_tiles():
+    """
+    Drop every cached tile, e.g. after users were written in bulk, now and again once
+    the current transaction commits.
+    """
+    _bump_tiles_generation()
+    transaction.on_commit(_bump_tiles_generation)
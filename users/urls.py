@@ -1,11 +1,27 @@
 from django.urls import path
 
-from .views import location_view, profile_change_view, profile_view
+from .views import (
+    export_locations_view,
+    heatmap_tile_view,
+    location_clusters_api_view,
+    location_view,
+    locations_api_view,
+    nearby_users_view,
+    profile_change_view,
+    profile_view,
+    user_tile_view,
+)
 
 urlpatterns = [
     path("location/", location_view, name="location"),
+    path("locations/", locations_api_view, name="locations_api"),
+    path("locations/clusters/", location_clusters_api_view, name="location_clusters_api"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", user_tile_view, name="user_tile"),
+    path("heatmap/<int:z>/<int:x>/<int:y>.json", heatmap_tile_view, name="heatmap_tile"),
+    path("locations/export/", export_locations_view, name="export_locations"),
     path("profile/", profile_view, name="profile"),
     path("profile/change/", profile_change_view, name="profile_change"),
+    path("nearby/", nearby_users_view, name="nearby_users"),
     path("<int:user_id>/", profile_view, name="user_detail"),
     path("<int:user_id>/change/", profile_change_view, name="user_change"),
 ]
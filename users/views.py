@@ -1,74 +1,343 @@
-import json
-
-from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import alogin, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.debug import sensitive_post_parameters
+from django.views.decorators.http import condition
+
+from pin_people.routers import read_from_replicas
 
-from .forms import CustomUserChangeForm, CustomUserCreationForm
+from .clusters import CLUSTER_CELL_SHIFT, CLUSTER_MAX_ZOOM, clusters_in_bbox
+from .conditional import (
+    PROFILE_FRAGMENT_TIMEOUT,
+    location_etag,
+    location_last_modified,
+    profile_etag,
+    profile_fragment_vary_on,
+    profile_last_modified,
+    viewed_profile,
+)
+from .export import EXPORT_FORMATS, export_chunks, gzip_chunks
+from .forms import AsyncAuthenticationForm, CustomUserChangeForm, CustomUserCreationForm
+from .geo import (
+    MAX_LATITUDE,
+    MAX_LONGITUDE,
+    MAX_ZOOM,
+    MIN_LATITUDE,
+    MIN_LONGITUDE,
+    bbox_q,
+    parse_bbox,
+    parse_zoom,
+    snap_bbox,
+    tile_ranges,
+)
+from .hashing import HashingOverloaded
+from .heatmap import get_heatmap, sparse_heatmap
+from .map_cache import accepts_gzip, cached_json_response
+from .models import EMAIL_IN_USE_MESSAGE, float_coordinates, is_email_conflict
+from .nearby import DEFAULT_NEIGHBOURS, MAX_NEIGHBOURS, nearest_users
+from .tiles import TILE_CONTENT_TYPE, get_tile
 
 User = get_user_model()
 
+# Hard cap on the number of users returned by one request to the locations API
+MAX_LOCATIONS_PER_PAGE = 500
+
+
+def _hashing_overloaded():
+    """
+    Shed load when the password hashing pool is saturated, rather than queueing the request.
+    """
+    response = HttpResponse("The server is busy, please try again in a moment.", status=503)
+    response["Retry-After"] = str(settings.PASSWORD_HASHING_RETRY_AFTER)
+    return response
+
+
+def _login_redirect_url(request):
+    url = request.POST.get("next", request.GET.get("next", ""))
+    if url_has_allowed_host_and_scheme(url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        return url
+    return settings.LOGIN_REDIRECT_URL
+
 
-def register_view(request):
+@sensitive_post_parameters()
+@never_cache
+async def login_view(request):
+    """
+    Log a user in.
+    The view is async and the password is verified in the hashing pool (see users/hashing.py),
+    so a burst of logins does not hold up the synchronous views under ASGI.
+    Answers 503 with a Retry-After header when the hashing pool is saturated.
+    """
+    if request.method == "POST":
+        form = AsyncAuthenticationForm(request, data=request.POST)
+        try:
+            valid = await form.avalidate()
+        except HashingOverloaded:
+            return _hashing_overloaded()
+        if valid:
+            await alogin(request, form.get_user())
+            return redirect(_login_redirect_url(request))
+    else:
+        form = AsyncAuthenticationForm(request)
+    return await sync_to_async(render)(request, "registration/login.html", {"form": form})
+
+
+@sensitive_post_parameters("password1", "password2")
+async def register_view(request):
     """
     Handle user registration using a custom user creation form.
     This view supports both GET and POST requests:
     - GET: Displays an empty registration form.
     - POST: Validates the submitted form and creates a new user if valid.
       On successful registration, the user is redirected to the login page.
+    Like login_view, the password is hashed in the hashing pool.
     """
     if request.method == "POST":
         form = CustomUserCreationForm(request.POST)
-        if form.is_valid():
-            _ = form.save()
+        # Validation checks the username against the database
+        if await sync_to_async(form.is_valid)():
+            try:
+                await form.asave()
+            except HashingOverloaded:
+                return _hashing_overloaded()
             return redirect("login")
     else:
         form = CustomUserCreationForm()
-    return render(request, "registration/register.html", {"form": form})
+    return await sync_to_async(render)(request, "registration/register.html", {"form": form})
 
 
+@read_from_replicas
 @login_required(login_url="login")
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=location_etag, last_modified_func=location_last_modified)
 def location_view(request):
     """
-    Render the locations page showing all users who have saved coordinates.
-    """
-    users_qs = User.objects.exclude(latitude=None, longitude=None)
-    users = []
-    for u in users_qs:
-        users.append(
-            {
-                "id": u.id,
-                "username": u.username,
-                "latitude": float(u.latitude),
-                "longitude": float(u.longitude),
-                "position": u.position,
-            }
-        )
+    Render the locations page.
+    The page itself carries no user data; the map fetches the clusters or users
+    inside the visible area from `location_clusters_api_view` whenever it is
+    panned or zoomed, or loads them as vector tiles from `user_tile_view` when
+    settings.MAP_VECTOR_TILES is enabled. The optional density layer is loaded per
+    tile from `heatmap_tile_view`. Reloads of an unchanged page get a 304.
+    Its reads may go to a replica, see pin_people/routers.py; the map data endpoints
+    read from the primary, as their responses are cached for everyone.
+    """
     context = {
-        "users_json": json.dumps(list(users)),
         "logged_in_user_id": request.user.id,
         "is_superuser": request.user.is_superuser,
+        "use_vector_tiles": settings.MAP_VECTOR_TILES,
     }
     return render(request, "users/location.html", context)
 
 
 @login_required(login_url="login")
+def locations_api_view(request):
+    """
+    Return the users with saved coordinates inside a bounding box as JSON.
+    Expects south, west, north, east and zoom query parameters. Results are ordered
+    by id and capped at MAX_LOCATIONS_PER_PAGE (or the smaller `limit` parameter);
+    when more users remain, `next_cursor` holds the value to pass as `cursor` to
+    fetch the next page. The box is grown to the edges of the map tiles it covers
+    at the zoom level, so the users just outside the viewport may be included.
+    """
+    try:
+        bbox = parse_bbox(request.GET)
+        zoom = parse_zoom(request.GET)
+        cursor, limit = _page_params(request.GET)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    # Snapped to the tiles in view, so nearby viewports share one snapshot
+    bbox = snap_bbox(*bbox, zoom)
+    return cached_json_response(
+        request,
+        ("locations", bbox, zoom, cursor, limit),
+        lambda: {"zoom": zoom, **_locations_page(bbox, cursor, limit)},
+    )
+
+
+@login_required(login_url="login")
+def location_clusters_api_view(request):
+    """
+    Return the map content for a bounding box and zoom level as JSON.
+    Up to CLUSTER_MAX_ZOOM the response holds one precomputed cluster per grid cell
+    (count, centroid and sample usernames) and no individual users; deeper zoom
+    levels return the individual users exactly like `locations_api_view`.
+    """
+    try:
+        bbox = parse_bbox(request.GET)
+        zoom = parse_zoom(request.GET)
+        cursor, limit = _page_params(request.GET)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    if zoom > CLUSTER_MAX_ZOOM:
+        bbox = snap_bbox(*bbox, zoom)
+        return cached_json_response(
+            request,
+            ("locations", bbox, zoom, cursor, limit),
+            lambda: {"zoom": zoom, "clusters": [], **_locations_page(bbox, cursor, limit)},
+        )
+    # The clusters only depend on the cells in view, so nearby viewports share one snapshot
+    return cached_json_response(
+        request,
+        ("clusters", zoom, tile_ranges(*bbox, zoom + CLUSTER_CELL_SHIFT)),
+        lambda: {"zoom": zoom, "clusters": clusters_in_bbox(*bbox, zoom), "users": [], "next_cursor": None},
+    )
+
+
+@login_required(login_url="login")
+def user_tile_view(request, z, x, y):
+    """
+    Return the user layer of map tile z/x/y as a Mapbox Vector Tile.
+    Up to CLUSTER_MAX_ZOOM the tile holds the precomputed clusters, deeper tiles hold the users.
+    """
+    if z > MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+        raise Http404("No such tile.")
+    return HttpResponse(get_tile(z, x, y), content_type=TILE_CONTENT_TYPE)
+
+
+@login_required(login_url="login")
+def heatmap_tile_view(request, z, x, y):
+    """
+    Return the user density of map tile z/x/y as JSON: the grid size, and the
+    indexes (row by row from the north-west corner) and counts of its non-empty bins.
+    """
+    if z > MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+        raise Http404("No such tile.")
+    return JsonResponse(sparse_heatmap(get_heatmap(z, x, y)))
+
+
+@login_required(login_url="login")
+def export_locations_view(request):
+    """
+    Stream the location of every user with coordinates, for staff only.
+    The `format` query parameter selects "geojson" (a FeatureCollection, the default)
+    or "ndjson" (one JSON object per line). The body is gzip-compressed on the fly
+    for clients that accept it.
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden("You are not allowed to export user locations.")
+
+    export_format = request.GET.get("format", "geojson")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}."}, status=400)
+
+    chunks = export_chunks(export_format)
+    compress = accepts_gzip(request)
+    response = StreamingHttpResponse(
+        gzip_chunks(chunks) if compress else chunks, content_type=EXPORT_FORMATS[export_format]
+    )
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Content-Disposition"] = f'attachment; filename="locations.{export_format}"'
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def _page_params(params):
+    """
+    Parse the cursor and limit query parameters of the locations endpoints.
+    The limit defaults to, and is capped at, MAX_LOCATIONS_PER_PAGE.
+    Raise ValueError when either is invalid.
+    """
+    cursor = int(params.get("cursor", 0))
+    limit = min(int(params.get("limit", MAX_LOCATIONS_PER_PAGE)), MAX_LOCATIONS_PER_PAGE)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer.")
+    return cursor, limit
+
+
+def _locations_page(bbox, cursor, limit):
+    """
+    Return one page of at most `limit` users inside the bounding box with an id above
+    `cursor`, ordered by id. `next_cursor` is the cursor for the next page, or None.
+    """
+    users_qs = User.objects.filter(bbox_q(*bbox), id__gt=cursor).order_by("id")
+    rows = users_qs.values_list("id", "username", *float_coordinates(), "position_dms")
+    # Fetch one extra row to find out whether another page exists
+    page = list(rows[: limit + 1])
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+
+    users = [
+        {"id": user_id, "username": username, "latitude": latitude, "longitude": longitude, "position": position}
+        for user_id, username, latitude, longitude, position in page[:limit]
+    ]
+    return {"users": users, "next_cursor": next_cursor}
+
+
+@read_from_replicas
+@login_required(login_url="login")
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=profile_etag, last_modified_func=profile_last_modified)
 def profile_view(request, user_id=None):
     """
     Show a user's profile. If user_id is provided, show that user's profile;
     otherwise, show the logged-in user's profile.
+    The user is loaded once, with the validators; revalidating an unchanged profile
+    gets a 304 and the profile markup itself is rendered from the cache until the
+    user changes. Reads may go to a replica, see pin_people/routers.py.
     """
-    if user_id:
-        user = get_object_or_404(User, pk=user_id)
-    else:
-        user = request.user
+    user = viewed_profile(request, user_id)
+    if user is None:
+        # Superuser can view anyone, regular users only themselves
+        if not request.user.is_superuser:
+            return HttpResponseForbidden("You are not allowed to view this profile.")
+        raise Http404("No such user.")
 
-    # Superuser can view anyone, regular users only themselves
-    if not request.user.is_superuser and request.user.id != user.id:
-        return HttpResponseForbidden("You are not allowed to view this profile.")
+    context = {
+        "user": user,
+        "fragment_timeout": PROFILE_FRAGMENT_TIMEOUT,
+        "fragment_vary_on": profile_fragment_vary_on(request, user),
+    }
+    return render(request, "users/profile.html", context)
+
+
+@login_required(login_url="login")
+def nearby_users_view(request):
+    """
+    Return the users closest to a point as JSON, nearest first, with great-circle distances.
+    The point is given by the latitude and longitude query parameters and defaults to
+    the logged-in user's own coordinates, in which case they are left out of the results.
+    The optional k parameter sets the number of users (default DEFAULT_NEIGHBOURS,
+    at most MAX_NEIGHBOURS).
+    """
+    try:
+        k = int(request.GET.get("k", DEFAULT_NEIGHBOURS))
+        if "latitude" in request.GET or "longitude" in request.GET:
+            latitude, longitude = float(request.GET["latitude"]), float(request.GET["longitude"])
+            exclude_pk = None
+        else:
+            latitude, longitude = request.user.latitude, request.user.longitude
+            if latitude is None or longitude is None:
+                raise ValueError("Pass latitude and longitude, or save your own location first.")
+            latitude, longitude, exclude_pk = float(latitude), float(longitude), request.user.pk
+    except KeyError as exc:
+        return JsonResponse({"error": f"Missing parameter: {exc.args[0]}."}, status=400)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    if not (MIN_LATITUDE <= latitude <= MAX_LATITUDE and MIN_LONGITUDE <= longitude <= MAX_LONGITUDE):
+        return JsonResponse({"error": "Coordinates are out of range."}, status=400)
+    k = min(max(k, 1), MAX_NEIGHBOURS)
 
-    return render(request, "users/profile.html", {"user": user})
+    users = [
+        {
+            "id": pk,
+            "username": username,
+            "latitude": user_latitude,
+            "longitude": user_longitude,
+            "position": position,
+            "distance_km": round(distance, 3),
+        }
+        for pk, username, user_latitude, user_longitude, position, distance in nearest_users(
+            latitude, longitude, k, exclude_pk
+        )
+    ]
+    return JsonResponse({"latitude": latitude, "longitude": longitude, "users": users})
 
 
 @login_required(login_url="login")
@@ -89,8 +358,16 @@ def profile_change_view(request, user_id=None):
     if request.method == "POST":
         form = CustomUserChangeForm(request.POST, instance=user)
         if form.is_valid():
-            form.save()
-            return redirect("user_detail", user_id=user.id)
+            try:
+                with transaction.atomic():
+                    form.save()
+            except IntegrityError as exc:
+                # Another request took the email between validation and saving
+                if not is_email_conflict(exc):
+                    raise
+                form.add_error("email", EMAIL_IN_USE_MESSAGE)
+            else:
+                return redirect("user_detail", user_id=user.id)
     else:
         form = CustomUserChangeForm(instance=user)
     return render(request, "users/profile_change.html", {"form": form, "user": user})